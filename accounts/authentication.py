@@ -0,0 +1,110 @@
+"""
+API token authentication without a database query per request.
+
+`CachedTokenAuthentication` keeps the token and user of recently seen API keys in a bounded
+in-process LRU, backed by the shared cache. Every entry is tagged with the version of its token,
+a counter in the cache, so the only work on the hot path is one `cache.get` of that counter.
+The accounts signal handlers bump the version once the transaction commits when the token is
+deleted or recreated (e.g. by `ResetAPIKey`) or when its user changes or is deactivated.
+
+With a cache shared by every worker (see `CACHES`) that invalidates the entries of every
+process at once. With a per-process cache (local memory, in development) only the process that
+made the change sees the bump, so entries also expire after `ENTRY_TIMEOUT` wherever they are
+kept, which bounds how long a revoked key keeps working. Cache keys use a digest of the API key,
+never the key itself.
+"""
+
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Iterable
+
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.authentication import TokenAuthentication
+
+VERSION_PREFIX = "api_token:version:"
+ENTRY_PREFIX = "api_token:entry:"
+# Seconds an entry is trusted without reading the token from the database, in the cache and in process.
+ENTRY_TIMEOUT = 5 * 60
+# Most tokens kept per process; the least recently used are dropped first.
+MAX_ENTRIES = 10_000
+
+# (version, token, user, expiry time) by digest, as in the shared cache.
+_entries: "OrderedDict[str, tuple[int, Any, Any, float]]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def _digest(key: str) -> str:
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def _version(digest: str) -> int:
+    key = VERSION_PREFIX + digest
+    if (version := cache.get(key)) is None:
+        # Counters start from the clock so a counter evicted from the cache never repeats an old version.
+        cache.add(key, time.time_ns() // 1000, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _invalidate(digests: set[str]) -> None:
+    for digest in digests:
+        try:
+            cache.incr(VERSION_PREFIX + digest)
+        except ValueError:
+            cache.set(VERSION_PREFIX + digest, time.time_ns() // 1000, timeout=None)
+        with _lock:
+            _entries.pop(digest, None)
+
+
+def invalidate(keys: Iterable[str]) -> None:
+    """Forget the users of the API keys `keys` once the current transaction commits."""
+    digests = {_digest(key) for key in keys}
+    transaction.on_commit(lambda: _invalidate(digests))
+
+
+def reset() -> None:
+    """Forget every token of this process."""
+    with _lock:
+        _entries.clear()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """`TokenAuthentication` answered from the in-process LRU or the shared cache when possible."""
+
+    def authenticate_credentials(self, key: str) -> tuple[Any, Any]:
+        digest = _digest(key)
+        version = _version(digest)
+        now = time.time()
+
+        with _lock:
+            entry = _entries.get(digest)
+            fresh = entry is not None and entry[0] == version and entry[3] > now
+            if fresh:
+                _entries.move_to_end(digest)
+
+        if not fresh:
+            entry = cache.get(ENTRY_PREFIX + digest)
+            if entry is None or entry[0] != version or entry[3] <= now:
+                entry = (version, *self.load(key), now + ENTRY_TIMEOUT)
+                cache.set(ENTRY_PREFIX + digest, entry, ENTRY_TIMEOUT)
+            with _lock:
+                _entries[digest] = entry
+                _entries.move_to_end(digest)
+                if len(_entries) > MAX_ENTRIES:
+                    _entries.popitem(last=False)
+
+        # Requests memoize data on their user (e.g. the organizations they manage), so each gets its own copy.
+        _, token, user, _ = entry
+        user, token = copy.copy(user), copy.copy(token)
+        token.user = user
+        return user, token
+
+    def load(self, key: str) -> tuple[Any, Any]:
+        """(token, user) of `key`, read from the database, as `TokenAuthentication` checks them."""
+        user, token = super().authenticate_credentials(key)
+        return token, user
+
@@ -0,0 +1,23 @@
+"""Signal handlers that revoke the cached API tokens of `accounts.authentication`."""
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate
+from .models import CustomUser
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def token_changed(sender, instance, **kwargs):
+    """A deleted or recreated API key stops authenticating as soon as the change commits."""
+    invalidate([instance.key])
+
+
+@receiver(post_save, sender=CustomUser)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    """Cached users must reflect deactivation and permission changes. Logins only touch `last_login`."""
+    if update_fields and set(update_fields) <= {"last_login"}:
+        return
+    invalidate(Token.objects.filter(user=instance).values_list("key", flat=True))
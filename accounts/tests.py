@@ -1,4 +1,14 @@
-from django.test import TestCase
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from . import authentication
+from .authentication import CachedTokenAuthentication
 from .models import CustomUser
 
 # Create your tests here.
@@ -11,3 +21,57 @@ class CustomUserTest(TestCase):
 
     def test_user_str(self):
         self.assertEqual(str(self.user), self.user.username)
+
+
+class CachedTokenAuthenticationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.user = CustomUser.objects.create(username="organizer", email="organizer@example.com")
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self) -> None:
+        cache.clear()
+        authentication.reset()
+
+    def authenticate(self, key):
+        request = RequestFactory().get("/api/", HTTP_AUTHORIZATION=f"Token {key}")
+        return CachedTokenAuthentication().authenticate(request)
+
+    def test_cached_tokens_cost_no_queries(self):
+        user, token = self.authenticate(self.token.key)
+        self.assertEqual((user, token), (self.user, self.token))
+        with self.assertNumQueries(0):
+            cached, _ = self.authenticate(self.token.key)
+        self.assertEqual(cached, self.user)
+        # Each request gets its own user to memoize on.
+        self.assertIsNot(cached, user)
+
+        # Other processes find the token in the shared cache.
+        authentication.reset()
+        with self.assertNumQueries(0):
+            self.authenticate(self.token.key)
+
+    def test_reset_api_key_revokes_the_old_key(self):
+        self.authenticate(self.token.key)
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("reset-api-key"))
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(self.token.key)
+        new_key = Token.objects.get(user=self.user).key
+        self.assertEqual(self.authenticate(new_key)[0], self.user)
+
+    def test_deactivated_users_are_rejected(self):
+        self.authenticate(self.token.key)
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(self.token.key)
+
+    def test_entries_expire(self):
+        self.authenticate(self.token.key)
+        later = time.time() + authentication.ENTRY_TIMEOUT + 1
+        # A process that missed a bump (e.g. without a shared cache) reads the token again eventually.
+        with mock.patch("accounts.authentication.time.time", return_value=later), self.assertNumQueries(1):
+            self.authenticate(self.token.key)
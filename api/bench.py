@@ -0,0 +1,67 @@
+"""
+API benchmarks.
+
+`SITE` describes the routes of `api.urls` for `org_pages.bench.benchmark`. `serialization`
+compares the API serializers with their field plans and the JSON/orjson/msgpack renderers.
+"""
+
+import statistics
+import time
+from typing import Any, Callable
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+
+from org_pages.bench import Site
+from org_pages.models import Organization
+
+from . import urls
+from .plans import compile_plan
+from .renderers import MessagePackRenderer, ORJSONRenderer, msgpack
+from .serializers import OrganizationSerializer
+
+SITE = Site(
+    "api/", urls, namespace="api",
+    queries=lambda sample, focus: {
+        "autocomplete": {"q": sample.name[:4]},
+        "org_by_location": {"country": sample.location.country if sample.location else ""},
+        "org_detail": {"name": sample.name},
+        "org_map_clusters": {"bbox": "-180,-85,180,85", "zoom": "2"},
+        "nearby": {"lat": "40", "lon": "-74", "radius_km": "500"},
+    },
+    authenticated=frozenset({"info", "my_org", "my_orgs"}),
+    values={"z": "0", "x": "0", "y": "0", "extension": "ndjson"},
+)
+
+
+def _timed(function: Callable[[], Any], iterations: int) -> tuple[dict, Any]:
+    durations, result = [], None
+    for _ in range(iterations):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            result = function()
+            durations.append((time.perf_counter() - start) * 1000)
+    return {"p50_ms": round(statistics.median(durations), 2), "queries": len(queries)}, result
+
+
+def serialization(limit: int = 10_000, iterations: int = 5) -> dict[str, dict]:
+    """
+    Compare the representation of `limit` organizations built by `OrganizationSerializer` and by
+    its field plan, then rendered by DRF's JSON renderer, orjson and (when installed) msgpack.
+    """
+    pks = list(Organization.objects.order_by("name", "id").values_list("pk", flat=True)[:limit])
+    queryset = Organization.objects.for_api().filter(pk__in=pks).order_by("name", "id")
+    serializer = OrganizationSerializer(many=True)
+    plan = compile_plan(serializer)
+
+    results = {"organizations": {"count": len(pks)}}
+    results["serializer"], data = _timed(lambda: OrganizationSerializer(queryset.all(), many=True).data, iterations)
+    results["plan"], _ = _timed(lambda: plan.represent(plan.values(queryset)), iterations)
+    renderers = {"json": JSONRenderer(), "orjson": ORJSONRenderer()}
+    if msgpack:
+        renderers["msgpack"] = MessagePackRenderer()
+    for name, renderer in renderers.items():
+        results[f"render:{name}"], content = _timed(lambda: renderer.render(data), iterations)
+        results[f"render:{name}"]["bytes"] = len(content)
+    return results
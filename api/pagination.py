@@ -0,0 +1,32 @@
+from rest_framework.pagination import CursorPagination
+
+from org_pages.pagination import cached_count
+
+
+class OrganizationCursorPagination(CursorPagination):
+    """
+    Cursor pagination over the organization name so page N costs the same as page 1.
+    Pass `?count=true` for the (cached) total number of results.
+    """
+
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 500
+    ordering = ("name", "id")
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.total = None
+        if request.query_params.get("count") in ("true", "1"):
+            self.total = cached_count(queryset.order_by())
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.total is not None:
+            response.data["count"] = self.total
+        return response
+
+    def get_paginated_response_schema(self, schema):
+        schema = super().get_paginated_response_schema(schema)
+        schema["properties"]["count"] = {"type": "integer", "example": 123}
+        return schema
@@ -0,0 +1,207 @@
+"""
+Field plans: the read fast path of the organization list endpoints.
+
+A plan is compiled once from a serializer instance (after `?fields=`/`?expand=` have shaped
+it) into the `values()` columns it reads and a converter per field. Rows are then read as dicts
+and turned into the serializer's representation without any per-object field machinery: one
+query for the rows and their foreign keys, and one per many-to-many relation and level. Only
+fields whose representation is their column value, or a single `to_representation` call, are
+supported. `compile_plan` returns None for anything else and the view falls back to the serializer.
+"""
+
+import threading
+from collections import OrderedDict
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable, Optional
+
+from django.conf import settings
+from django.db.models import Model, QuerySet
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+# Fields whose representation of a database value is the value itself.
+IDENTITY_FIELDS = (
+    serializers.BooleanField, serializers.CharField, serializers.ChoiceField, serializers.IntegerField,
+    serializers.ReadOnlyField,
+)
+# Fields converted with their own `to_representation`.
+CONVERTED_FIELDS = (
+    serializers.DateField, serializers.DateTimeField, serializers.DecimalField, serializers.DurationField,
+    serializers.FloatField, serializers.TimeField, serializers.UUIDField,
+)
+
+# Most plans kept per process; clients pick the field shapes, so the least recently used are dropped first.
+MAX_PLANS = 256
+
+_plans: "OrderedDict[tuple, Optional[Plan]]" = OrderedDict()
+_lock = threading.Lock()
+# The timezone datetimes are shown in, looked up once per `Plan.represent` rather than per value.
+_timezone: ContextVar = ContextVar("timezone", default=None)
+
+
+@dataclass
+class Entry:
+    """One serializer field: its key, where it is read from and how it is converted."""
+    key: str
+    kind: str  # "value", "foreign" or "many"
+    source: str
+    convert: Optional[Callable[[Any], Any]] = None
+    plan: Optional["Plan"] = None
+
+
+@dataclass
+class Plan:
+    model: type[Model]
+    entries: list[Entry] = field(default_factory=list)
+
+    def columns(self, prefix: str = "") -> list[str]:
+        """The `values()` columns of the plan, foreign keys followed with `prefix`."""
+        columns = [f"{prefix}pk"]
+        for entry in self.entries:
+            if entry.kind == "value" or (entry.kind == "foreign" and not entry.plan):
+                columns.append(prefix + entry.source)
+            elif entry.kind == "foreign":
+                columns.extend(entry.plan.columns(f"{prefix}{entry.source}__"))
+        return list(dict.fromkeys(columns))
+
+    def values(self, queryset: QuerySet, *extra: str) -> QuerySet:
+        """`queryset` as the rows of the plan, plus the `extra` columns (e.g. the pagination ordering)."""
+        columns = self.columns()
+        return queryset.prefetch_related(None).values(*columns, *(x for x in extra if x not in columns))
+
+    def build(self, row: dict, pending: list, prefix: str = "") -> dict:
+        """The representation of `row`. Many-to-many entries are filled in by `represent`."""
+        data = {}
+        for entry in self.entries:
+            if entry.kind == "value":
+                value = row[prefix + entry.source]
+                data[entry.key] = entry.convert(value) if entry.convert and value is not None else value
+            elif entry.kind == "foreign" and not entry.plan:
+                data[entry.key] = row[prefix + entry.source]
+            elif entry.kind == "foreign":
+                nested = f"{prefix}{entry.source}__"
+                data[entry.key] = None if row[f"{nested}pk"] is None else entry.plan.build(row, pending, nested)
+            else:
+                data[entry.key] = []
+        if any(entry.kind == "many" for entry in self.entries):
+            pending.append((self, row[f"{prefix}pk"], data))
+        return data
+
+    def represent(self, rows: Iterable[dict]) -> list[dict]:
+        """The representation of the `values()` rows, with one query per many-to-many entry and level."""
+        token = _timezone.set(timezone.get_current_timezone() if settings.USE_TZ else None)
+        try:
+            pending = []
+            results = [self.build(row, pending) for row in rows]
+            while pending:
+                plan = pending[0][0]
+                mine = [(pk, data) for owner, pk, data in pending if owner is plan]
+                pending = [item for item in pending if item[0] is not plan]
+                plan._fill_many(mine, pending)
+            return results
+        finally:
+            _timezone.reset(token)
+
+    def _fill_many(self, objects: list[tuple[Any, dict]], pending: list) -> None:
+        by_pk = {}
+        for pk, data in objects:
+            by_pk.setdefault(pk, []).append(data)
+
+        for entry in self.entries:
+            if entry.kind != "many":
+                continue
+            relation = self.model._meta.get_field(entry.source)
+            owner = relation.related_query_name()
+            targets = relation.related_model._default_manager.filter(**{f"{owner}__in": list(by_pk)})
+            if entry.plan:
+                for row in entry.plan.values(targets, owner).iterator():
+                    # Targets shared by several owners are built once per owner, like prefetched objects.
+                    for data in by_pk[row[owner]]:
+                        data[entry.key].append(entry.plan.build(row, pending))
+            else:
+                for owner_pk, target_pk in targets.values_list(owner, "pk"):
+                    for data in by_pk[owner_pk]:
+                        data[entry.key].append(target_pk)
+
+
+def _datetime_converter(serializer_field: serializers.DateTimeField) -> Callable:
+    """`DateTimeField.to_representation` for ISO 8601 output in the current timezone."""
+    def convert(value):
+        if (current := _timezone.get()) is None or timezone.is_naive(value):
+            return serializer_field.to_representation(value)
+        text = value.astimezone(current).isoformat()
+        return text[:-6] + "Z" if text.endswith("+00:00") else text
+
+    output_format = getattr(serializer_field, "format", api_settings.DATETIME_FORMAT)
+    if hasattr(serializer_field, "timezone") or not output_format or output_format.lower() != ISO_8601:
+        return serializer_field.to_representation
+    return convert
+
+
+def _value_converter(serializer_field: serializers.Field) -> tuple[bool, Optional[Callable]]:
+    """(supported, converter) for a plain field. A None converter returns the value as is."""
+    if isinstance(serializer_field, serializers.DateTimeField):
+        return True, _datetime_converter(serializer_field)
+    if isinstance(serializer_field, serializers.ListField):
+        supported, convert = _value_converter(serializer_field.child)
+        return supported, convert and (lambda values: [convert(x) for x in values])
+    if isinstance(serializer_field, IDENTITY_FIELDS):
+        return True, None
+    if isinstance(serializer_field, CONVERTED_FIELDS):
+        return True, serializer_field.to_representation
+    return False, None
+
+
+def _compile(serializer: serializers.ModelSerializer) -> Optional[Plan]:
+    model = serializer.Meta.model
+    plan = Plan(model)
+    for key, serializer_field in serializer.fields.items():
+        if serializer_field.write_only:
+            continue
+        source = serializer_field.source
+        if source == "*" or "." in source:
+            return None
+
+        if isinstance(serializer_field, serializers.ListSerializer):
+            if not isinstance(serializer_field.child, serializers.ModelSerializer):
+                return None
+            if (nested := _compile(serializer_field.child)) is None:
+                return None
+            plan.entries.append(Entry(key, "many", source, plan=nested))
+        elif isinstance(serializer_field, serializers.ModelSerializer):
+            if (nested := _compile(serializer_field)) is None:
+                return None
+            plan.entries.append(Entry(key, "foreign", source, plan=nested))
+        elif isinstance(serializer_field, serializers.ManyRelatedField):
+            if not isinstance(serializer_field.child_relation, serializers.PrimaryKeyRelatedField):
+                return None
+            plan.entries.append(Entry(key, "many", source))
+        elif isinstance(serializer_field, serializers.PrimaryKeyRelatedField):
+            plan.entries.append(Entry(key, "foreign", source))
+        else:
+            supported, convert = _value_converter(serializer_field)
+            if not supported:
+                return None
+            if source == "id":
+                source = "pk"
+            plan.entries.append(Entry(key, "value", source, convert))
+    return plan
+
+
+def compile_plan(serializer: serializers.ModelSerializer) -> Optional[Plan]:
+    """The plan of a (list) serializer, compiled once per shape of its fields. None if unsupported."""
+    serializer = getattr(serializer, "child", serializer)
+    key = (type(serializer), *((name, type(x)) for name, x in serializer.fields.items()))
+    with _lock:
+        if key in _plans:
+            _plans.move_to_end(key)
+            return _plans[key]
+
+    plan = _compile(serializer)
+    with _lock:
+        _plans[key] = plan
+        while len(_plans) > MAX_PLANS:
+            _plans.popitem(last=False)
+    return plan
@@ -0,0 +1,51 @@
+"""
+Fast renderers: JSON with orjson and, when the `msgpack` package is installed, MessagePack.
+
+Both fall back on DRF's JSON encoder for the types they don't handle themselves (lazy
+strings, decimals, querysets, ...), so responses hold the same values as with DRF's renderer.
+"""
+
+import orjson
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Datetimes are passed to DRF's encoder, which truncates them to milliseconds like `JSONRenderer`.
+ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+
+def _default(value):
+    return JSONEncoder().default(value)
+
+
+class ORJSONRenderer(BaseRenderer):
+    media_type = "application/json"
+    format = "json"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        options = ORJSON_OPTIONS
+        # The browsable API and `Accept: application/json; indent=4` ask for indented output.
+        renderer_context = renderer_context or {}
+        if renderer_context.get("indent") or "indent=" in (accepted_media_type or ""):
+            options |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=_default, option=options)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """Requires the `msgpack` package, see `settings.REST_FRAMEWORK`."""
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return msgpack.packb(data, default=_default, use_bin_type=True)
@@ -1,3 +1,6 @@
+from typing import Iterable, Optional
+
+from org_pages.bulk import Change
 from org_pages.models import Organization
 from rest_framework import serializers
 
@@ -23,18 +26,86 @@ class OrganizationMappingSerializer(serializers.ModelSerializer):
         return None
 
 
-class OrganizationSerializer(serializers.ModelSerializer):
+class ParentOrganizationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Organization
+        exclude = ("logo", "organizers", "search_document")
+
+
+class FieldsetSerializerMixin:
+    """
+    Accepts `fields`, the names to return (default: all), and `expand`, the relations to nest.
+    When `expand` is given, the relations not in it are returned as primary keys.
+    """
+    EXPANDABLE: tuple[str, ...] = ()
+
+    def __init__(
+        self, *args, fields: Optional[Iterable[str]] = None, expand: Optional[Iterable[str]] = None, **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        if expand is not None:
+            for name in set(self.EXPANDABLE) & set(self.fields) - set(expand):
+                self.fields[name] = serializers.PrimaryKeyRelatedField(
+                    read_only=True, many=name in ("diversity", "technology"),
+                )
+
+
+class OrganizationSerializer(FieldsetSerializerMixin, serializers.ModelSerializer):
+    EXPANDABLE = ("location", "parent", "diversity", "technology")
+
+    parent = ParentOrganizationSerializer(read_only=True)
+
     class Meta:
         model = Organization
-        exclude = ("logo", "organizers")
+        exclude = ("logo", "organizers", "search_document")
         extra_kwargs = {"name": {"required": False}}
         depth = 1
 
 
-class LimitedOrganizationSerializer(serializers.HyperlinkedModelSerializer):
+class NearbyOrganizationSerializer(OrganizationSerializer):
+    distance_km = serializers.FloatField(read_only=True)
+
+    class Meta(OrganizationSerializer.Meta):
+        pass
+
+
+class LimitedOrganizationSerializer(FieldsetSerializerMixin, serializers.ModelSerializer):
+    """The `?view=compact` profile of the organization endpoints."""
     location = serializers.StringRelatedField()
 
     class Meta:
         model = Organization
-        fields = ("name", "location", "url")
-        depth = 1
+        fields = ("name", "slug", "location", "url")
+
+
+class BulkOrganizationSerializer(serializers.ModelSerializer):
+    """
+    One item of a bulk write: `id` for a partial update, none for a create. Relations are
+    primary keys. Uniqueness and references are checked for the whole batch by `org_pages.bulk`.
+    """
+    id = serializers.IntegerField(required=False)
+    location = serializers.IntegerField(required=False, allow_null=True)
+    parent = serializers.IntegerField(required=False, allow_null=True)
+    diversity = serializers.ListField(child=serializers.IntegerField(), required=False)
+    technology = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+    class Meta:
+        model = Organization
+        fields = (
+            "id", "name", "slug", "org_type", "description", "url", "code_of_conduct", "job_board",
+            "events_link", "social_links", "paid", "active", "online_only", "location", "parent",
+            "diversity", "technology",
+        )
+        extra_kwargs = {"name": {"validators": []}, "slug": {"validators": [], "required": False}}
+
+    def to_change(self) -> Change:
+        values = dict(self.validated_data)
+        pk = values.pop("id", None)
+        tags = {tag: values.pop(tag) for tag in ("diversity", "technology") if tag in values}
+        for relation in ("location", "parent"):
+            if relation in values:
+                values[f"{relation}_id"] = values.pop(relation)
+        return Change(pk, values, tags)
@@ -1,3 +1,672 @@
-from django.test import TestCase
+import base64
+import csv
+import gzip
+import hashlib
+import io
+import json
+import tempfile
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.text import slugify
+from rest_framework.authtoken.models import Token
+
+from accounts.models import CustomUser
+from api import bench, plans, throttling
+from api.plans import compile_plan
+from api.renderers import ORJSONRenderer, msgpack
+from api.serializers import LimitedOrganizationSerializer, OrganizationSerializer
+from org_pages import autocomplete, geo
+from org_pages.autocomplete import autocomplete_index
+from org_pages.bench import benchmark
+from org_pages.models import DiversityFocus, Location, Organization, TechnologyFocus
 
 # Create your tests here.
+
+
+class AutocompleteTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.location = Location.objects.create(
+            name="Atlanta", region="Georgia", country="United States", latitude=33.749, longitude=-84.388,
+        )
+        cls.org = Organization.objects.create(name="Black Python Atlanta", slug="black-python-atlanta")
+        DiversityFocus.objects.create(name="Black", other_names=["African American"])
+
+    def setUp(self) -> None:
+        autocomplete_index.rebuild()
+
+    def get_results(self, query, **params):
+        return self.client.get(reverse("autocomplete"), {"q": query, **params}).json()["results"]
+
+    def test_matches_word_prefixes(self):
+        self.assertIn(self.org.name, [x["name"] for x in self.get_results("pyth")])
+
+    def test_full_name_matches_rank_first(self):
+        self.assertEqual(self.get_results("black")[0]["kind"], "diversity")
+        self.assertEqual(self.get_results("atl", kind="location")[0]["name"], str(self.location))
+
+    def test_matches_other_names(self):
+        self.assertEqual(self.get_results("african")[0]["name"], "Black")
+
+    def test_limit_is_clamped(self):
+        self.assertEqual(len(self.get_results("pyth", limit=-1)), 1)
+        self.assertEqual(len(self.get_results("pyth", limit=0)), 1)
+
+    def test_lookup_does_not_query_the_database(self):
+        with self.assertNumQueries(0):
+            self.get_results("bla")
+
+    def test_index_updates_incrementally(self):
+        self.org.name = "Black Django Atlanta"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.org.save()
+        self.assertFalse(self.get_results("black python"))
+        self.assertEqual(self.get_results("black django")[0]["url"], self.org.get_absolute_url())
+
+    def test_unindexed_organizations_are_removed(self):
+        self.org.slug = None
+        with self.captureOnCommitCallbacks(execute=True):
+            self.org.save()
+        self.assertFalse(self.get_results("black python"))
+
+    def test_changes_from_other_processes_force_a_rebuild(self):
+        cache.incr(autocomplete.VERSION_KEY)
+        self.org.name = "Black Django Atlanta"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.org.save()
+        self.assertIsNone(autocomplete_index._version)
+        with self.assertNumQueries(4):
+            self.assertTrue(self.get_results("black django"))
+
+
+class CursorPaginationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        Organization.objects.bulk_create(
+            Organization(name=f"Org {i:03}", slug=f"org-{i:03}") for i in range(60)
+        )
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def test_cursor_pages(self):
+        response = self.client.get(reverse("org_list"), {"page_size": 25, "count": "true"}).json()
+        self.assertEqual(response["count"], 60)
+        names = [org["name"] for org in response["results"]]
+        while response["next"]:
+            response = self.client.get(response["next"]).json()
+            names.extend(org["name"] for org in response["results"])
+        self.assertEqual(names, [f"Org {i:03}" for i in range(60)])
+
+    def test_count_is_optional(self):
+        response = self.client.get(reverse("org_list")).json()
+        self.assertNotIn("count", response)
+        self.assertEqual(len(response["results"]), 50)
+
+    def test_list_is_read_only(self):
+        response = self.client.post(reverse("org_list"), {"name": "Spam", "slug": "spam"})
+        self.assertEqual(response.status_code, 405)
+        self.assertFalse(Organization.objects.filter(slug="spam").exists())
+
+
+class MapSnapshotTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.parent = Organization.objects.create(name="Women Who Code", slug="women-who-code")
+        cls.location = Location.objects.create(name="Austin", country="United States", latitude=30.27, longitude=-97.74)
+        cls.org = Organization.objects.create(
+            name="Women Who Code Austin", slug="wwc-austin", parent=cls.parent, location=cls.location, is_featured=True,
+        )
+        Organization.objects.create(name="Online Only", slug="online-only", parent=cls.parent)
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def get_map(self, params="", **headers):
+        return self.client.get(reverse("org_map") + params, **headers)
+
+    def read(self, response):
+        return json.loads(b"".join(response.streaming_content))
+
+    def test_scopes(self):
+        for params in ("", "?format=json&is_featured=True", f"?format=json&parent={self.parent.pk}"):
+            collection = self.read(self.get_map(params))
+            self.assertEqual(collection["type"], "FeatureCollection")
+            self.assertEqual(collection["features"], [{
+                "type": "Feature",
+                "properties": {"url": self.org.get_absolute_url(), "name": self.org.name},
+                "geometry": {"type": "Point", "coordinates": [-97.74, 30.27]},
+            }])
+
+    def test_snapshot_is_built_once(self):
+        self.get_map("?is_featured=True")
+        with self.assertNumQueries(0):
+            self.get_map("?is_featured=True")
+
+    def test_gzip_and_etag(self):
+        response = self.get_map(HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        collection = json.loads(gzip.decompress(b"".join(response.streaming_content)))
+        self.assertEqual(collection["features"][0]["properties"]["name"], self.org.name)
+
+        etag = response["ETag"]
+        self.assertEqual(self.get_map(HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertNotIn("Content-Encoding", self.get_map(HTTP_ACCEPT_ENCODING="gzip;q=0").headers)
+
+    def test_regenerated_when_organizations_change(self):
+        etag = self.get_map()["ETag"]
+        self.org.name = "WWC Austin"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.org.save()
+        response = self.get_map(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.read(response)["features"][0]["properties"]["name"], "WWC Austin")
+
+    def test_other_filters_fall_back_to_a_query(self):
+        response = self.get_map(f"?format=json&location={self.location.pk}")
+        self.assertEqual(response.json()["features"][0]["properties"]["name"], self.org.name)
+
+
+class MapClusterTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.parent = Organization.objects.create(name="Women Who Code", slug="women-who-code")
+        for i, (city, latitude, longitude) in enumerate((
+            ("Austin", 30.27, -97.74), ("Round Rock", 30.51, -97.68), ("Georgetown", 30.63, -97.67),
+            ("Boston", 42.36, -71.06),
+        )):
+            Organization.objects.create(
+                name=f"Women Who Code {city}", slug=f"wwc-{i}", parent=cls.parent,
+                location=Location.objects.create(name=city, latitude=latitude, longitude=longitude),
+            )
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def get_clusters(self, bbox="-130,20,-60,50", zoom=4, **params):
+        return self.client.get(reverse("org_map_clusters"), {"bbox": bbox, "zoom": zoom, **params})
+
+    def test_nearby_organizations_are_clustered(self):
+        features = sorted(self.get_clusters().json()["features"], key=lambda x: x["geometry"]["coordinates"][0])
+        self.assertEqual(len(features), 2)
+        austin, boston = features
+        self.assertEqual(austin["properties"]["point_count"], 3)
+        self.assertEqual(austin["properties"]["names"][0], "Women Who Code Austin")
+        self.assertAlmostEqual(austin["geometry"]["coordinates"][1], (30.27 + 30.51 + 30.63) / 3)
+        self.assertEqual(boston["properties"], {"url": "/orgs/wwc-3", "name": "Women Who Code Boston"})
+
+    def test_zoomed_in_returns_features_in_the_viewport(self):
+        features = self.get_clusters("-97.8,30.2,-97.6,30.7", zoom=16).json()["features"]
+        self.assertEqual(sorted(x["properties"]["name"] for x in features), [
+            "Women Who Code Austin", "Women Who Code Georgetown", "Women Who Code Round Rock",
+        ])
+
+    def test_cells_are_bounded(self):
+        # A world wide box at the deepest zoom is coarsened instead of returning a point per organization.
+        features = self.get_clusters("-180,-90,180,90", zoom=22).json()["features"]
+        self.assertLessEqual(len(features), 2)
+
+    def test_whole_world_boxes(self):
+        for bbox in ("-180,-90,180,90", "-180,-90,-180,90", "-97,-90,-97,90"):
+            features = self.get_clusters(bbox, zoom=1).json()["features"]
+            self.assertEqual(sum(x["properties"].get("point_count", 1) for x in features), 4, bbox)
+
+    def test_filters_and_validation(self):
+        self.assertEqual(len(self.get_clusters(is_featured="True").json()["features"]), 0)
+        self.assertEqual(self.get_clusters(bbox="1,2,3").status_code, 400)
+        self.assertEqual(self.get_clusters(name="x").status_code, 400)
+
+
+class VectorTileTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.location = Location.objects.create(name="Null Island", latitude=0.00001, longitude=0.00001)
+        cls.org = Organization.objects.create(name="Women Who Code Null Island", slug="wwc-null", location=cls.location)
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def get_tile(self, z, x, y, params=None, **headers):
+        return self.client.get(reverse("org_tiles", args=[z, x, y]), params, **headers)
+
+    def test_encodes_points(self):
+        response = self.get_tile(0, 0, 0)
+        self.assertEqual(response["Content-Type"], "application/vnd.mapbox-vector-tile")
+        self.assertIn(b"organizations", response.content)
+        # A point at the centre of the tile: MoveTo(2048, 2048) in the zigzag encoded geometry.
+        self.assertIn(b"\x22\x05\x09\x80\x20\x80\x20", response.content)
+
+        response = self.get_tile(16, 32768, 32767)
+        self.assertIn(self.org.name.encode(), response.content)
+        self.assertIn(self.org.get_absolute_url().encode(), response.content)
+
+    def test_empty_and_invalid_tiles(self):
+        self.assertNotIn(b"Null Island", self.get_tile(1, 0, 0).content)
+        self.assertEqual(self.get_tile(1, 2, 0).status_code, 404)
+        self.assertEqual(self.get_tile(0, 0, 0, {"name": "x"}).status_code, 400)
+
+    def test_only_covering_tiles_are_invalidated(self):
+        covering, elsewhere = self.get_tile(3, 4, 3)["ETag"], self.get_tile(3, 0, 0)["ETag"]
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_tile(3, 4, 3, HTTP_IF_NONE_MATCH=covering).status_code, 304)
+
+        self.org.name = "WWC Null Island"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.org.save()
+        self.assertNotEqual(self.get_tile(3, 4, 3)["ETag"], covering)
+        self.assertEqual(self.get_tile(3, 0, 0)["ETag"], elsewhere)
+
+
+class NearbyTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.black = DiversityFocus.objects.create(name="Black")
+        cls.orgs = {}
+        for city, latitude, longitude in (
+            ("Austin", 30.27, -97.74), ("Round Rock", 30.51, -97.68), ("Boston", 42.36, -71.06),
+            ("Suva", -18.14, 178.44), ("Apia", -13.83, -171.76),
+        ):
+            cls.orgs[city] = Organization.objects.create(
+                name=f"Women Who Code {city}", slug=slugify(city),
+                location=Location.objects.create(name=city, latitude=latitude, longitude=longitude),
+            )
+        cls.orgs["Round Rock"].diversity.add(cls.black)
+
+    def get_nearby(self, lat=30.27, lon=-97.74, radius_km=50, **params):
+        return self.client.get(reverse("nearby"), {"lat": lat, "lon": lon, "radius_km": radius_km, **params})
+
+    def test_geohash(self):
+        self.assertEqual(geo.encode(57.64911, 10.40744, 11), "u4pruydqqvj")
+        self.assertEqual(self.orgs["Austin"].location.geohash, geo.encode(30.27, -97.74))
+
+    def test_sorted_by_distance_within_radius(self):
+        results = self.get_nearby(lat=30.4, lon=-97.7).json()
+        self.assertEqual([x["name"] for x in results], ["Women Who Code Round Rock", "Women Who Code Austin"])
+        self.assertAlmostEqual(results[1]["distance_km"], 15, delta=1)
+        self.assertEqual(len(self.get_nearby(radius_km=3000).json()), 3)
+
+    def test_crosses_the_antimeridian(self):
+        results = self.get_nearby(lat=-16, lon=179.9, radius_km=1000).json()
+        self.assertEqual([x["name"] for x in results], ["Women Who Code Suva", "Women Who Code Apia"])
+
+    def test_filters_and_validation(self):
+        results = self.get_nearby(diversity="Black").json()
+        self.assertEqual([x["name"] for x in results], ["Women Who Code Round Rock"])
+        self.assertEqual(len(self.get_nearby(radius_km=3000, limit=1).json()), 1)
+        self.assertEqual(self.get_nearby(lat="x").status_code, 400)
+        self.assertEqual(self.get_nearby(radius_km=0).status_code, 400)
+
+
+class ExportTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.parent = Organization.objects.create(name="Women Who Code", slug="women-who-code")
+        cls.org = Organization.objects.create(
+            name="Women Who Code Austin", slug="wwc-austin", parent=cls.parent, description="Line one\nline two",
+            location=Location.objects.create(name="Austin", country="United States", latitude=30.27, longitude=-97.74),
+        )
+        cls.org.diversity.add(DiversityFocus.objects.create(name="Women"), DiversityFocus.objects.create(name="Black"))
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def get_export(self, extension, **params):
+        response = self.client.get(reverse("export", args=[extension]), params)
+        return response, b"".join(response.streaming_content).decode()
+
+    def test_ndjson(self):
+        response, content = self.get_export("ndjson")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([x["name"] for x in rows], ["Women Who Code", "Women Who Code Austin"])
+        self.assertEqual(rows[1]["diversity"], ["Black", "Women"])
+        self.assertEqual(rows[1]["parent_organization"], "Women Who Code")
+        self.assertEqual((rows[1]["location_name"], rows[1]["latitude"]), ("Austin", 30.27))
+
+    def test_csv_and_filters(self):
+        _, content = self.get_export("csv", diversity="Women")
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["diversity"], "Black|Women")
+        self.assertEqual(rows[0]["description"], "Line one\nline two")
+        self.assertEqual(self.client.get(reverse("export", args=["xml"])).status_code, 404)
+
+    def test_snapshots(self):
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+            DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage", MEDIA_ROOT=media_root,
+        ):
+            call_command("export_directory", stdout=io.StringIO())
+            manifest = self.client.get(reverse("export_snapshots")).json()
+            self.assertEqual(manifest.keys(), {"csv", "ndjson"})
+            with default_storage.open(manifest["ndjson"]["name"]) as f:
+                content = gzip.decompress(f.read())
+            self.assertEqual(hashlib.sha256(content).hexdigest(), manifest["ndjson"]["sha256"])
+            self.assertEqual(manifest["csv"]["organizations"], 2)
+
+            # An unchanged directory reuses the same file.
+            call_command("export_directory", format=["ndjson"], stdout=io.StringIO())
+            reused = self.client.get(reverse("export_snapshots")).json()["ndjson"]
+            self.assertEqual(reused["name"], manifest["ndjson"]["name"])
+
+            # The manifest is replaced in place and keeps every format.
+            cache.clear()
+            self.assertEqual(self.client.get(reverse("export_snapshots")).json().keys(), {"csv", "ndjson"})
+            _, files = default_storage.listdir("exports")
+            self.assertEqual([name for name in files if not name.startswith("directory-")], ["manifest.json"])
+
+
+class FieldsetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.parent = Organization.objects.create(name="Women Who Code", slug="women-who-code")
+        cls.location = Location.objects.create(
+            name="Austin", region="Texas", country="United States", latitude=30.27, longitude=-97.74,
+        )
+        cls.org = Organization.objects.create(
+            name="Women Who Code Austin", slug="wwc-austin", parent=cls.parent, location=cls.location,
+            url="https://www.womenwhocode.com/austin",
+        )
+        cls.focus = DiversityFocus.objects.create(name="Women", description="A long description")
+        cls.org.diversity.add(cls.focus)
+
+    def get_results(self, **params):
+        response = self.client.get(reverse("org_list"), params)
+        self.assertEqual(response.status_code, 200)
+        return {x["slug"]: x for x in response.json()["results"]}
+
+    def test_default_nests_every_relation(self):
+        org = self.get_results()["wwc-austin"]
+        self.assertEqual(org["location"]["name"], "Austin")
+        self.assertEqual(org["parent"]["name"], "Women Who Code")
+        self.assertEqual(org["diversity"][0]["description"], "A long description")
+
+    def test_fields_and_expand(self):
+        org = self.get_results(fields="name,slug,location", expand="location")["wwc-austin"]
+        self.assertEqual(org.keys(), {"name", "slug", "location"})
+        self.assertEqual(org["location"]["region"], "Texas")
+
+        org = self.get_results(fields="slug,location,diversity")["wwc-austin"]
+        self.assertEqual(org, {"slug": "wwc-austin", "location": self.location.pk, "diversity": [self.focus.pk]})
+
+        org = self.get_results(expand="parent")["wwc-austin"]
+        self.assertEqual((org["parent"]["slug"], org["location"], org["diversity"]), (
+            "women-who-code", self.location.pk, [self.focus.pk],
+        ))
+        self.assertIn("description", org)
+
+    def test_only_requested_data_is_loaded(self):
+        with CaptureQueriesContext(connection) as full:
+            self.get_results()
+        with CaptureQueriesContext(connection) as sparse:
+            self.get_results(fields="name,slug")
+        self.assertLess(len(sparse), len(full))
+        self.assertNotIn("description", sparse[-1]["sql"])
+
+    def test_compact_view(self):
+        with self.assertNumQueries(1):
+            org = self.get_results(view="compact")["wwc-austin"]
+        self.assertEqual(org, {
+            "name": "Women Who Code Austin", "slug": "wwc-austin", "location": "Austin, Texas, United States",
+            "url": "https://www.womenwhocode.com/austin",
+        })
+
+    def test_unknown_fields_are_rejected(self):
+        self.assertEqual(self.client.get(reverse("org_list"), {"fields": "name,secret"}).status_code, 400)
+        self.assertEqual(self.client.get(reverse("org_list"), {"expand": "organizers"}).status_code, 400)
+
+
+class FieldPlanTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        women = DiversityFocus.objects.create(name="Women", other_names=["Womxn"])
+        black_women = DiversityFocus.objects.create(name="Black Women", description="A description")
+        black_women.parents.add(women)
+        python = TechnologyFocus.objects.create(name="Python")
+        cls.parent = Organization.objects.create(name="Women Who Code", slug="women-who-code")
+        cls.parent.diversity.add(women)
+        for i, city in enumerate(("Austin", "Boston"), start=1):
+            org = Organization.objects.create(
+                name=f"Women Who Code {city}", slug=f"wwc-{city.lower()}", parent=cls.parent,
+                social_links=[f"https://twitter.com/wwc{city}"],
+                location=Location.objects.create(name=city, latitude=30 + i / 7, longitude=-97 - i / 7),
+            )
+            org.diversity.add(women, black_women)
+            org.technology.add(python)
+
+    def render(self, data):
+        return json.loads(ORJSONRenderer().render(data))
+
+    def test_plan_matches_the_serializer(self):
+        for fieldset in ({}, {"expand": ["parent", "diversity"]}, {"fields": ["name", "location", "technology"]}):
+            serializer = OrganizationSerializer(**fieldset)
+            plan = compile_plan(serializer)
+            queryset = Organization.objects.order_by("name")
+            expected = OrganizationSerializer(queryset.for_api(), many=True, **fieldset).data
+            self.assertEqual(self.render(plan.represent(plan.values(queryset))), self.render(expected))
+
+    def test_plan_queries_per_relation_not_per_row(self):
+        plan = compile_plan(OrganizationSerializer())
+        # The rows, the focuses and their parents (twice), and the parents' focus keys (twice).
+        with self.assertNumQueries(7):
+            plan.represent(plan.values(Organization.objects.all()))
+
+    def test_plans_are_bounded(self):
+        with mock.patch("api.plans.MAX_PLANS", 2), mock.patch("api.plans._plans", plans.OrderedDict()):
+            for fields in (["name"], ["slug"], ["url"]):
+                compile_plan(OrganizationSerializer(fields=fields))
+            self.assertEqual(len(plans._plans), 2)
+
+    def test_unsupported_serializers_fall_back(self):
+        self.assertIsNone(compile_plan(LimitedOrganizationSerializer()))
+        self.assertEqual(self.client.get(reverse("org_list"), {"view": "compact"}).status_code, 200)
+
+    def test_renderers(self):
+        response = self.client.get(reverse("org_list"), HTTP_ACCEPT="application/json")
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(len(response.json()["results"]), 3)
+
+    @skipUnless(msgpack, "msgpack is not installed")
+    def test_msgpack(self):
+        response = self.client.get(reverse("org_list"), HTTP_ACCEPT="application/msgpack")
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        self.assertEqual(len(msgpack.unpackb(response.content)["results"]), 3)
+
+    def test_serialization_benchmark(self):
+        results = bench.serialization(limit=3, iterations=1)
+        self.assertEqual(results["organizations"]["count"], 3)
+        self.assertLessEqual(results["plan"]["queries"], results["serializer"]["queries"])
+        self.assertEqual(results["render:json"]["bytes"], results["render:orjson"]["bytes"])
+
+    @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": {"anon": "1/min"}})
+    def test_routes_benchmark(self):
+        throttling.reset()
+        results = benchmark((bench.SITE,), iterations=3, only=["api:org_list", "api:my_orgs", "api:export_snapshots"])
+        # Timed without throttling, and without reaching the configured (remote) storage.
+        self.assertEqual(results["api:org_list"]["statuses"], [200])
+        self.assertEqual(results["api:export_snapshots"]["statuses"], [200])
+        self.assertIn("/api/my/organizations/", results["api:my_orgs"]["url"])
+
+
+class BulkTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.user = CustomUser.objects.create_user(username="organizer", email="organizer@example.com")
+        cls.network = Organization.objects.create(name="Women Who Code", slug="women-who-code")
+        cls.network.organizers.add(cls.user)
+        cls.chapters = [
+            Organization.objects.create(name=f"Women Who Code {i}", slug=f"wwc-{i}", parent=cls.network)
+            for i in range(4)
+        ]
+        cls.other = Organization.objects.create(name="PyLadies", slug="pyladies")
+        cls.location = Location.objects.create(
+            name="Austin", country="United States", latitude=30.27, longitude=-97.74,
+        )
+        cls.women = DiversityFocus.objects.create(name="Women")
+        cls.python = TechnologyFocus.objects.create(name="Python")
+
+    def setUp(self) -> None:
+        self.client.force_login(self.user)
+
+    def post(self, items):
+        return self.client.post(reverse("my_orgs_bulk"), items, content_type="application/json")
+
+    def test_creates_and_updates(self):
+        chapter = self.chapters[0]
+        response = self.post([
+            {"name": "Women Who Code Austin", "parent": self.network.pk, "location": self.location.pk,
+             "diversity": [self.women.pk]},
+            {"id": chapter.pk, "name": "Women Who Code Boston", "location": self.location.pk,
+             "technology": [self.python.pk]},
+        ])
+        self.assertEqual(response.status_code, 200)
+        created, updated = response.json()["results"]
+        self.assertEqual((created["status"], created["slug"]), ("created", "women-who-code-austin"))
+        self.assertEqual((updated["status"], updated["id"]), ("updated", chapter.pk))
+
+        austin = Organization.objects.get(pk=created["id"])
+        self.assertEqual((austin.parent, austin.location), (self.network, self.location))
+        self.assertEqual(list(austin.diversity.all()), [self.women])
+        chapter.refresh_from_db()
+        self.assertEqual((chapter.name, chapter.slug, chapter.location), (
+            "Women Who Code Boston", "wwc-0", self.location,
+        ))
+        self.assertEqual(list(chapter.technology.all()), [self.python])
+        # The search documents include the new location.
+        self.assertEqual(set(Organization.objects.filter(search_document="Austin")), {austin, chapter})
+
+    def test_invalid_batches_are_not_applied(self):
+        response = self.post([
+            {"id": self.chapters[0].pk, "name": "Renamed"},
+            {"id": self.other.pk, "name": "Not mine"},
+            {"name": "PyLadies"},
+        ])
+        self.assertEqual(response.status_code, 400)
+        results = response.json()["results"]
+        self.assertEqual([x["status"] for x in results], ["valid", "error", "error"])
+        self.assertIn("id", results[1]["errors"])
+        self.assertIn("name", results[2]["errors"])
+        self.assertFalse(Organization.objects.filter(name="Renamed").exists())
+
+    def test_parent_cycles_are_rejected(self):
+        chapter = self.chapters[0]
+        response = self.post([{"id": self.network.pk, "parent": chapter.pk}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("parent", response.json()["results"][0]["errors"])
+
+        response = self.post([
+            {"id": self.chapters[1].pk, "parent": self.chapters[2].pk},
+            {"id": self.chapters[2].pk, "parent": self.chapters[1].pk},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([x["status"] for x in response.json()["results"]], ["error", "error"])
+
+        # Moving a chapter under a sibling is fine.
+        self.assertEqual(self.post([{"id": self.chapters[1].pk, "parent": self.chapters[2].pk}]).status_code, 200)
+
+    def test_names_without_a_slug_are_rejected(self):
+        response = self.post([{"name": "日本"}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("slug", response.json()["results"][0]["errors"])
+        self.assertEqual(self.post([{"name": "日本", "slug": "nihon"}]).status_code, 200)
+
+    def test_caches_are_invalidated_after_commit(self):
+        with mock.patch("org_pages.cache._bump") as bump:
+            with self.captureOnCommitCallbacks() as callbacks:
+                self.post([{"id": self.chapters[0].pk, "location": self.location.pk}])
+            bump.assert_not_called()
+            for callback in callbacks:
+                callback()
+            self.assertTrue(bump.called)
+
+    def test_queries_do_not_grow_with_the_batch(self):
+        def count(chapters):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.post([{"id": x.pk, "location": self.location.pk} for x in chapters])
+            self.assertEqual(response.status_code, 200)
+            return len(queries)
+
+        # The first request also loads the organizations the user manages.
+        count(self.chapters[:1])
+        self.assertEqual(count(self.chapters[:2]), count(self.chapters))
+
+
+@override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": {
+    "anon": "2/min", "user": "3/min", "token": "1/min", "expensive.anon": "1/min",
+}})
+class ThrottleTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.user = CustomUser.objects.create_user(username="organizer", email="organizer@example.com")
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self) -> None:
+        cache.clear()
+        throttling.reset()
+
+    def get(self, name, **params):
+        return self.client.get(reverse(name), {"q": "py"} if name == "autocomplete" else {}, **params)
+
+    def test_anonymous_requests_are_throttled_by_ip(self):
+        self.assertEqual([self.get("autocomplete").status_code for _ in range(2)], [200, 200])
+        response = self.get("autocomplete")
+        self.assertEqual(response.status_code, 429)
+        # Two requests a minute: the next token is 30 seconds away.
+        self.assertEqual(response["Retry-After"], "30")
+        self.assertEqual(self.get("autocomplete", REMOTE_ADDR="10.0.0.2").status_code, 200)
+
+    def test_forwarded_for_is_read_from_the_proxy(self):
+        # The proxy appends the client's address; whatever the client put before it doesn't get a new bucket.
+        for spoofed in ("1.1.1.1", "2.2.2.2"):
+            self.get("autocomplete", HTTP_X_FORWARDED_FOR=f"{spoofed}, 10.0.0.3")
+        self.assertEqual(self.get("autocomplete", HTTP_X_FORWARDED_FOR="3.3.3.3, 10.0.0.3").status_code, 429)
+
+    def test_expensive_views_have_their_own_budget(self):
+        self.assertEqual(self.get("org_list").status_code, 200)
+        self.assertEqual(self.get("org_list").status_code, 429)
+        self.assertEqual(self.get("autocomplete").status_code, 200)
+
+    def test_exports_and_maps_are_expensive(self):
+        for url in (
+            reverse("export", args=["csv"]),
+            reverse("org_map"),
+            reverse("org_map") + "?is_featured=True",
+            reverse("org_map_clusters") + "?bbox=-180,-90,180,90&zoom=1",
+            reverse("org_tiles", args=[0, 0, 0]),
+        ):
+            throttling.reset()
+            self.assertEqual(self.client.get(url).status_code, 200, url)
+            self.assertEqual(self.client.get(url).status_code, 429, url)
+
+    def test_conditional_requests_are_throttled(self):
+        etag = self.get("org_list")["ETag"]
+        self.assertEqual(self.get("org_list", HTTP_IF_NONE_MATCH=etag).status_code, 429)
+
+    def test_etags_vary_on_the_api_user(self):
+        # Basic auth is only seen by DRF, not by Django's middleware.
+        self.user.set_password("secret")
+        self.user.save()
+        basic = {"HTTP_AUTHORIZATION": "Basic " + base64.b64encode(b"organizer:secret").decode()}
+        self.assertNotEqual(self.get("org_list")["ETag"], self.get("org_list", **basic)["ETag"])
+
+    def test_tokens_and_users_have_their_own_budget(self):
+        token = {"HTTP_AUTHORIZATION": f"Token {self.token.key}"}
+        self.assertEqual([self.get("info", **token).status_code for _ in range(2)], [200, 429])
+        self.client.force_login(self.user)
+        self.assertEqual([self.get("info").status_code for _ in range(4)], [200, 200, 200, 429])
+
+    def test_buckets_drain_what_other_processes_report(self):
+        with mock.patch("api.throttling.time.time", return_value=600.0):
+            self.assertEqual(throttling.take("k", 5, 5 / 60, now=0), 0)
+            # Another process let 4 requests through in the same window.
+            throttling._add("k", 10, 4)
+            self.assertEqual(throttling.take("k", 5, 5 / 60, now=throttling.SYNC_INTERVAL), 0)
+            self.assertGreater(throttling.take("k", 5, 5 / 60, now=throttling.SYNC_INTERVAL), 0)
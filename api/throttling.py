@@ -0,0 +1,147 @@
+"""
+Token-bucket rate limiting of the API.
+
+Requests are counted against a bucket per API token, per logged in user (session or basic auth)
+or per anonymous IP, and per throttle scope: views with `throttle_scope = "expensive"` (maps,
+full lists, bulk writes) have their own, smaller buckets. Rates are DRF rate strings in
+`REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"]`, keyed by `<kind>` or `<scope>.<kind>` with kind
+`anon`, `user` or `token`. A "60/min" bucket holds up to 60 requests and refills at one a second.
+
+Buckets live in process memory, so the check is one dict lookup under a lock per request. Each
+worker periodically adds the requests it let through to a counter in the shared cache, one
+`cache.incr` per bucket and `SYNC_INTERVAL`, and drains its bucket by what the other workers
+reported, so the limits hold (approximately) across workers. Without a shared cache every
+worker enforces the limits on its own. Throttled requests get a 429 with `Retry-After`.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from django.core.cache import cache
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+CACHE_PREFIX = "api:throttle:"
+# Most buckets kept per process; the least recently used are dropped first.
+MAX_BUCKETS = 10_000
+# Seconds between two syncs of a bucket with the shared cache.
+SYNC_INTERVAL = 1.0
+# Seconds covered by one shared counter. A bucket only learns of requests counted in its current window.
+SYNC_WINDOW = 60
+
+
+@dataclass
+class Bucket:
+    capacity: float
+    rate: float  # tokens per second
+    tokens: float
+    updated: float
+    # Requests let through and not yet added to the shared counter, and when that was last done.
+    pending: int = 0
+    synced: float = 0.0
+    # The shared counter window, the requests this process added to it and those drained from other processes.
+    window: int = 0
+    own: int = 0
+    others: int = 0
+
+    def take(self, now: float) -> float:
+        """Take a token. Returns 0 if there was one, else the seconds until there will be."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            self.pending += 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def drain(self, window: int, added: int, total: int) -> None:
+        """Record that `added` requests took the shared counter of `window` to `total`, and drain the others'."""
+        if window != self.window:
+            self.window, self.own, self.others = window, 0, 0
+        self.own += added
+        if (others := total - self.own) > self.others:
+            self.tokens -= others - self.others
+            self.others = others
+
+
+def _add(key: str, window: int, count: int) -> int:
+    """Add `count` to the shared counter of `key` in `window`. Returns its new value."""
+    key = f"{CACHE_PREFIX}{key}:{window}"
+    try:
+        return cache.incr(key, count)
+    except ValueError:
+        cache.add(key, 0, SYNC_WINDOW * 2)
+        return cache.incr(key, count)
+
+
+_buckets: "OrderedDict[str, Bucket]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def take(key: str, capacity: float, rate: float, now: Optional[float] = None) -> float:
+    """Take a token from the bucket `key`. Returns the seconds to wait, 0 if the request may proceed."""
+    now = time.monotonic() if now is None else now
+    with _lock:
+        if (bucket := _buckets.get(key)) is None:
+            bucket = _buckets[key] = Bucket(capacity, rate, capacity, now, synced=now)
+            if len(_buckets) > MAX_BUCKETS:
+                _buckets.popitem(last=False)
+        else:
+            _buckets.move_to_end(key)
+        wait = bucket.take(now)
+        pending = bucket.pending if now - bucket.synced >= SYNC_INTERVAL else 0
+        if pending:
+            bucket.pending, bucket.synced = 0, now
+
+    if pending:
+        # Wall clock time, so every process counts in the same window.
+        window = int(time.time() // SYNC_WINDOW)
+        total = _add(key, window, pending)
+        with _lock:
+            bucket.drain(window, pending, total)
+    return wait
+
+
+def reset() -> None:
+    """Forget every bucket of this process."""
+    with _lock:
+        _buckets.clear()
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Throttle by API token, user or IP, in the bucket of the view's `throttle_scope`."""
+
+    def get_kind_and_ident(self, request) -> tuple[str, str]:
+        if token := getattr(request.auth, "key", None):
+            # Keep API keys out of cache keys.
+            return "token", hashlib.sha256(token.encode()).hexdigest()[:32]
+        if request.user and request.user.is_authenticated:
+            return "user", str(request.user.pk)
+        return "anon", self.get_ident(request)
+
+    def get_rate(self, scope: Optional[str], kind: str) -> Optional[tuple[int, int]]:
+        """(requests, seconds) of the bucket, None if it isn't limited."""
+        rates = api_settings.DEFAULT_THROTTLE_RATES
+        rate = rates.get(f"{scope}.{kind}") if scope else None
+        if rate is None:
+            rate = rates.get(kind)
+        if rate is None:
+            return None
+        count, period = rate.split("/")
+        return int(count), {"s": 1, "m": 60, "h": 3600, "d": 86400}[period[0]]
+
+    def allow_request(self, request, view) -> bool:
+        scope = getattr(view, "throttle_scope", None)
+        kind, ident = self.get_kind_and_ident(request)
+        if (rate := self.get_rate(scope, kind)) is None:
+            return True
+        count, seconds = rate
+        self.delay = take(f"{scope or 'default'}:{kind}:{ident}", count, count / seconds)
+        return not self.delay
+
+    def wait(self) -> Optional[float]:
+        return self.delay
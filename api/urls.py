@@ -5,9 +5,17 @@ import api.views as views
 urlpatterns = (
     path("", views.ExampleView.as_view(), name="info"),
     path("about", views.AboutTemplateView.as_view(), name="about"),
+    path("autocomplete", views.AutocompleteView.as_view(), name="autocomplete"),
+    path("export.<str:extension>", views.ExportView.as_view(), name="export"),
+    path("export/snapshots", views.ExportSnapshotView.as_view(), name="export_snapshots"),
     path("locations", views.LocationOrganizationListView.as_view(), name="org_by_location"),
     path("map/", views.OrgMapQuerySet.as_view({"get": "list"}), name="org_map"),
+    path("map/clusters", views.MapClusterView.as_view(), name="org_map_clusters"),
+    path("tiles/<int:z>/<int:x>/<int:y>.pbf", views.TileView.as_view(), name="org_tiles"),
+    path("nearby", views.NearbyOrganizationListView.as_view(), name="nearby"),
     path("my/organization/<int:pk>", views.OrganizerDetailView.as_view(), name="my_org"),
     path("my/organizations/", views.OrganizerListView.as_view(), name="my_orgs"),
+    path("my/organizations/bulk", views.BulkOrganizerView.as_view(), name="my_orgs_bulk"),
+    path("organizations/list", views.OrganizationListView.as_view(), name="org_list"),
     path("organizations/", views.OrganizationDetailView.as_view(), name="org_detail"),
 )
@@ -1,12 +1,26 @@
+from typing import Optional
+
 from django.views.generic.base import TemplateView
 from rest_framework.response import Response
 from rest_framework import viewsets, generics
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.authentication import SessionAuthentication, BasicAuthentication, TokenAuthentication
+from rest_framework.authentication import SessionAuthentication, BasicAuthentication
+from rest_framework.exceptions import ValidationError
 from rest_framework.views import APIView
+from accounts.authentication import CachedTokenAuthentication
+from org_pages.authorization import managed_organizations
+from org_pages.autocomplete import autocomplete_index
+from org_pages import bulk, clusters, export, geo, geojson, tiles
+from org_pages.conditional import ConditionalGetMixin
+from org_pages.facets import filter_organizations, match_modes, selected_facets
 from org_pages.models import Organization
 import api.serializers as serializers
-from django.db.models import Q
+from api import plans
+from api.pagination import OrganizationCursorPagination
+from django.db.models import Q, QuerySet
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.functional import cached_property
 
 # Create your views here.
 
@@ -20,8 +34,9 @@ class ExampleView(APIView):
     An example view.
     """
 
-    authentication_classes = [SessionAuthentication, BasicAuthentication, TokenAuthentication]
+    authentication_classes = [SessionAuthentication, BasicAuthentication, CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = 4
 
     def get(self, request, format=None):
         content = {
@@ -34,42 +49,271 @@ class ExampleView(APIView):
         return Response(content)
 
 
-class OrgMapQuerySet(viewsets.ModelViewSet):
+class AutocompleteView(APIView):
+    """
+    Typeahead suggestions for organizations, focuses and locations.
+    Served from the in-process prefix index so suggestions don't query the database.
+    """
+
+    max_limit = 25
+    query_budget = 6
+
+    def get(self, request, format=None):
+        try:
+            limit = max(1, min(int(request.query_params.get("limit", 10)), self.max_limit))
+        except ValueError:
+            limit = 10
+        kinds = request.query_params.getlist("kind") or None
+        results = autocomplete_index.search(request.query_params.get("q", ""), limit=limit, kinds=kinds)
+        return Response({"results": results})
+
+
+class FieldsetMixin:
+    """
+    Sparse fieldsets for organization endpoints. On reads, `?fields=name,slug` returns only the
+    listed fields, `?expand=location,parent` nests only the listed relations (the others are
+    primary keys) and `?view=compact` returns `LimitedOrganizationSerializer`. Without them the
+    full nested representation is returned. `get_organizations` loads just what is returned.
+    """
+
+    compact_serializer_class = serializers.LimitedOrganizationSerializer
+
+    def _param(self, name: str) -> Optional[list[str]]:
+        value = self.request.query_params.get(name)
+        return None if value is None else [x.strip() for x in value.split(",") if x.strip()]
+
+    @cached_property
+    def fieldset(self) -> dict:
+        """The validated `fields`, `expand` and `compact` of the request."""
+        if self.request.method not in ("GET", "HEAD"):
+            return {"fields": None, "expand": None, "compact": False}
+
+        compact = self.request.query_params.get("view") == "compact"
+        serializer_class = self.compact_serializer_class if compact else self.serializer_class
+        fields, expand = self._param("fields"), self._param("expand")
+        errors = {}
+        if fields is not None and (unknown := set(fields) - set(serializer_class().fields)):
+            errors["fields"] = f"Unknown fields: {', '.join(sorted(unknown))}."
+        if expand is not None and (unknown := set(expand) - set(serializer_class.EXPANDABLE)):
+            errors["expand"] = f"Relations that can be expanded: {', '.join(serializer_class.EXPANDABLE) or 'none'}."
+        if errors:
+            raise ValidationError(errors)
+        if fields is not None and expand is None:
+            expand = []
+        return {"fields": fields, "expand": expand, "compact": compact}
+
+    def get_organizations(self) -> QuerySet:
+        """The organizations loaded for the requested fieldset."""
+        fieldset, organizations = self.fieldset, Organization.objects.all()
+        if fieldset["compact"]:
+            return organizations.for_compact()
+        if fieldset["fields"] is None and fieldset["expand"] is None:
+            return organizations.for_api()
+        fields = fieldset["fields"] or list(self.serializer_class().fields)
+        return organizations.for_fields(fields, fieldset["expand"])
+
+    def get_queryset(self):
+        return self.get_organizations()
+
+    def get_serializer_class(self):
+        return self.compact_serializer_class if self.fieldset["compact"] else super().get_serializer_class()
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.update(fields=self.fieldset["fields"], expand=self.fieldset["expand"])
+        return super().get_serializer(*args, **kwargs)
+
+
+class PlannedListMixin:
+    """
+    List through the field plan of the serializer (see `api/plans.py`): rows are read with
+    `values()` and turned into plain dicts, skipping the serializer for each object. Falls back
+    to the serializer when its fields aren't supported by plans.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if (plan := plans.compile_plan(self.get_serializer())) is None:
+            return super().list(request, *args, **kwargs)
+
+        ordering = getattr(self.paginator, "ordering", None) or ()
+        ordering = [ordering] if isinstance(ordering, str) else ordering
+        rows = plan.values(self.filter_queryset(self.get_queryset()), *(field.lstrip("-") for field in ordering))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(plan.represent(page))
+        return Response(plan.represent(rows))
+
+
+class OrgMapQuerySet(ConditionalGetMixin, viewsets.ModelViewSet):
     """View for returning the map organization data"""
 
     serializer_class = serializers.OrganizationMappingSerializer
+    query_budget = 4
+    throttle_scope = "expensive"
+
+    def get_validator_scopes(self):
+        # Snapshots carry their own ETag.
+        if geojson.scope(self.request.GET.dict()) is None:
+            return super().get_validator_scopes()
+        return None
+
+    def get_validator_queryset(self):
+        return None
 
     def get_queryset(self):
         base_params = self.request.query_params.dict()
         base_params.pop("format", None)
-        orgs = (
-            Organization.objects.filter(**base_params)
-            .filter(location__isnull=False)
-        )
+        orgs = Organization.objects.for_map().filter(**base_params)
         return orgs
 
-    def list(self, *args, **kwargs):
-        context = super().list(*args, **kwargs)
-        return Response({"type": "FeatureCollection", "features": [x["coords"] for x in context.data]})
+    def list(self, request, *args, **kwargs):
+        """The common map scopes are served from precomputed snapshots."""
+        if scope := geojson.scope(request.GET.dict()):
+            return geojson.response(request, scope)
+        return Response(geojson.feature_collection(self.get_queryset()))
+
+
+class MapClusterView(APIView):
+    """
+    Clusters of the organizations in the map's viewport: `?bbox=west,south,east,north&zoom=<0-22>`.
+    Supports the same `is_featured=True` and `parent=<pk>` filters as the map snapshots.
+    """
+
+    query_budget = 4
+    throttle_scope = "expensive"
+
+    def get(self, request, format=None):
+        params = request.query_params.dict()
+        try:
+            bbox = clusters.BoundingBox.parse(params.pop("bbox", ""))
+            zoom = int(params.pop("zoom", ""))
+        except ValueError:
+            raise ValidationError("bbox (west,south,east,north in degrees) and zoom are required.")
+        if (scope := geojson.scope(params)) is None:
+            raise ValidationError("Only the is_featured=True and parent=<pk> filters are supported.")
+
+        orgs = geojson.organizations(scope)
+        return Response(clusters.feature_collection(orgs, bbox, zoom, key=f"{scope}:{bbox}:{zoom}"))
+
+
+class TileView(APIView):
+    """
+    Organization locations as Mapbox Vector Tiles: `/api/tiles/<z>/<x>/<y>.pbf`.
+    Supports the same `is_featured=True` and `parent=<pk>` filters as the map snapshots.
+    """
+
+    query_budget = 4
+    throttle_scope = "expensive"
+
+    def get(self, request, z, x, y, format=None):
+        if not tiles.is_valid(z, x, y):
+            raise Http404
+        if (scope := geojson.scope(request.GET.dict())) is None:
+            raise ValidationError("Only the is_featured=True and parent=<pk> filters are supported.")
+
+        content, etag = tiles.tile(geojson.organizations(scope), scope, z, x, y)
+        if (not_modified := get_conditional_response(request, etag=etag)) is not None:
+            return not_modified
+        response = HttpResponse(content, content_type="application/vnd.mapbox-vector-tile")
+        response["ETag"] = etag
+        return response
+
+
+class NearbyOrganizationListView(FieldsetMixin, ConditionalGetMixin, generics.ListAPIView):
+    """
+    Organizations within `radius_km` of a point, nearest first: `?lat=&lon=&radius_km=`.
+    Accepts the facet filters of the search page (diversity, technology, online_only, ...) and `limit`.
+    """
+
+    serializer_class = serializers.NearbyOrganizationSerializer
+    query_budget = 10
+    throttle_scope = "expensive"
+    max_radius_km = 20_000
+    default_limit, max_limit = 50, 200
+
+    def get_queryset(self):
+        params = self.request.query_params
+        try:
+            latitude, longitude = float(params.get("lat", "")), float(params.get("lon", ""))
+            radius_km = float(params.get("radius_km", ""))
+            limit = int(params.get("limit", self.default_limit))
+        except ValueError:
+            raise ValidationError("lat, lon and radius_km are required numbers.")
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180 and 0 < radius_km <= self.max_radius_km):
+            raise ValidationError(f"lat, lon must be in degrees and radius_km between 0 and {self.max_radius_km}.")
+
+        orgs = filter_organizations(self.get_organizations(), selected_facets(params), match_modes(params))
+        orgs = geo.within(orgs, latitude, longitude, radius_km, prefix="location__")
+        return orgs[:max(1, min(limit, self.max_limit))]
+
+
+class ExportView(APIView):
+    """
+    Stream every organization as NDJSON or CSV: `/api/export.ndjson`, `/api/export.csv`.
+    Accepts the facet filters of the search page. Rows are read while the response is sent.
+    """
+
+    query_budget = 0
+    throttle_scope = "expensive"
+
+    def perform_content_negotiation(self, request, force=False):
+        # The format comes from the URL, whatever the Accept header asks for.
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, extension):
+        if extension not in export.FORMATS:
+            raise Http404
+        params = request.GET
+        orgs = filter_organizations(Organization.objects.all(), selected_facets(params), match_modes(params))
+        response = StreamingHttpResponse(
+            export.stream(extension, export.records(orgs)), content_type=export.FORMATS[extension][1],
+        )
+        response["Content-Disposition"] = f'attachment; filename="organizations.{extension}"'
+        return response
+
+
+class ExportSnapshotView(APIView):
+    """The pre-generated gzipped exports, with their download URLs and content hashes."""
+
+    query_budget = 0
+
+    def get(self, request, format=None):
+        return Response(export.manifest())
 
 
-class OrganizationDetailView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Organization.objects.all()
+class OrganizationDetailView(FieldsetMixin, ConditionalGetMixin, generics.RetrieveUpdateDestroyAPIView):
     lookup_field = "name"
     serializer_class = serializers.OrganizationSerializer
+    query_budget = 10
+
+    def get_validator_scopes(self):
+        return None
+
+    def get_validator_queryset(self):
+        """The organization and its (nested) parent."""
+        name = self.kwargs.get("name")
+        return Organization.objects.filter(Q(name=name) | Q(organization__name=name))
 
 
-class OrganizationListView(generics.ListCreateAPIView):
-    queryset = Organization.objects.all()
+class OrganizationListView(PlannedListMixin, FieldsetMixin, ConditionalGetMixin, generics.ListAPIView):
+    """The public directory. Organizations are created through the organizer views."""
+
     serializer_class = serializers.OrganizationSerializer
+    pagination_class = OrganizationCursorPagination
+    query_budget = 10
+    throttle_scope = "expensive"
 
 
-class LocationOrganizationListView(generics.ListAPIView):
+class LocationOrganizationListView(
+    PlannedListMixin, FieldsetMixin, ConditionalGetMixin, generics.ListAPIView,
+):
     serializer_class = serializers.OrganizationSerializer
+    pagination_class = OrganizationCursorPagination
+    query_budget = 10
+    throttle_scope = "expensive"
 
     def get_queryset(self):
         base_params = self.request.query_params.dict()
-        orgs = Organization.objects.all()
+        orgs = self.get_organizations()
         if city := base_params.get("city"):
             print(f"searching for {city=}")
             orgs = orgs.filter(location__name=city)
@@ -80,30 +324,75 @@ class LocationOrganizationListView(generics.ListAPIView):
         return orgs
 
 
-class OrganizerListView(generics.ListCreateAPIView):
+class OrganizerListView(FieldsetMixin, generics.ListCreateAPIView):
     serializer_class = serializers.OrganizationSerializer
-    authentication_classes = [SessionAuthentication, BasicAuthentication, TokenAuthentication]
+    authentication_classes = [SessionAuthentication, BasicAuthentication, CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = 12
 
     def get_queryset(self):
+        managed = managed_organizations(self.request.user)
         if self.request.data.get("include_children", False):
-            return Organization.objects.filter(
-                Q(parent__id__in=self.request.user.organizations.values("id"))
-                | Q(id__in=self.request.user.organizations.values("id")),
-            )
+            return self.get_organizations().filter(pk__in=managed.all)
 
-        return self.request.user.organizations.all()
+        return self.get_organizations().filter(pk__in=managed.direct)
 
 
-class OrganizerDetailView(generics.RetrieveUpdateDestroyAPIView):
+class OrganizerDetailView(FieldsetMixin, generics.RetrieveUpdateDestroyAPIView):
     """View for returning the organizer data"""
 
-    authentication_classes = [SessionAuthentication, BasicAuthentication, TokenAuthentication]
+    authentication_classes = [SessionAuthentication, BasicAuthentication, CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
     serializer_class = serializers.OrganizationSerializer
+    query_budget = 12
 
     def get_queryset(self):
-        return Organization.objects.filter(
-            Q(id__in=self.request.user.organizations.values("id"))
-            | Q(parent_id__in=self.request.user.organizations.values("id")),
-        )
+        return self.get_organizations().filter(pk__in=managed_organizations(self.request.user).all)
+
+
+class BulkOrganizerView(APIView):
+    """
+    Create and partially update many organizations in one request. The body is a list of items:
+    items with an `id` update an organization the user manages (directly or through a parent),
+    the others create one. Nothing is written unless every item is valid.
+    """
+
+    authentication_classes = [SessionAuthentication, BasicAuthentication, CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    query_budget = 40
+    throttle_scope = "expensive"
+
+    def post(self, request):
+        items = request.data
+        if not isinstance(items, list):
+            raise ValidationError("Expected a list of organizations.")
+        if len(items) > bulk.MAX_ITEMS:
+            raise ValidationError(f"At most {bulk.MAX_ITEMS} organizations can be written at once.")
+
+        changes, errors = [], {}
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                errors[index] = {"non_field_errors": ["Expected an object."]}
+                changes.append(bulk.Change())
+                continue
+            serializer = serializers.BulkOrganizationSerializer(data=item, partial="id" in item)
+            if not serializer.is_valid():
+                errors[index] = serializer.errors
+                changes.append(bulk.Change())
+                continue
+            changes.append(serializer.to_change())
+        if not errors:
+            errors = bulk.validate(changes, request.user)
+
+        if errors:
+            return Response({"results": [
+                {"index": index, "status": "error", "errors": errors[index]} if index in errors
+                else {"index": index, "status": "valid"}
+                for index in range(len(changes))
+            ]}, status=400)
+
+        orgs = bulk.apply(changes, request.user)
+        return Response({"results": [
+            {"index": index, "status": "created" if change.pk is None else "updated", "id": org.pk, "slug": org.slug}
+            for index, (change, org) in enumerate(zip(changes, orgs))
+        ]})
@@ -0,0 +1,163 @@
+"""
+In-process request metrics exposed in the Prometheus text format.
+
+`MetricsMiddleware` records, for every resolved URL name, the request latency, the number and
+duration of SQL queries, the template render time and the response size. Outbound HTTP calls
+are timed with `timed()`. Everything is aggregated in memory per process behind one lock, so
+recording costs a few dictionary updates, and the staff-only `metrics` view renders the
+current values for Prometheus to scrape.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from django.db import connection
+from django.http import Http404, HttpRequest, HttpResponse
+
+from .queries import query_budget
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (1_000, 10_000, 50_000, 100_000, 500_000, 1_000_000, 5_000_000)
+
+_lock = threading.Lock()
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: tuple[tuple[str, str], ...], **extra: str) -> str:
+    pairs = (*labels, *extra.items())
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str):
+        self.name, self.documentation = name, documentation
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in sorted(self._values.items()):
+            yield f"{self.name}{_labels(labels)} {value}"
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, buckets: tuple = LATENCY_BUCKETS):
+        self.name, self.documentation, self.buckets = name, documentation, buckets
+        # labels -> [count per bucket..., +Inf count, sum]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        position = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            values = self._values.setdefault(key, [0] * (len(self.buckets) + 2))
+            values[position] += 1
+            values[-1] += value
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, values in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), values):
+                cumulative += count
+                yield f"{self.name}_bucket{_labels(labels, le=str(bound))} {cumulative}"
+            yield f"{self.name}_sum{_labels(labels)} {values[-1]}"
+            yield f"{self.name}_count{_labels(labels)} {cumulative}"
+
+
+REQUESTS = Counter("django_http_requests_total", "Requests by view, method and status.")
+LATENCY = Histogram("django_http_request_duration_seconds", "Request latency by view.")
+QUERIES = Histogram("django_db_queries_per_request", "SQL queries per request by view.", QUERY_BUCKETS)
+QUERY_TIME = Histogram("django_db_query_duration_seconds", "Total SQL time per request by view.")
+TEMPLATE_TIME = Histogram("django_template_render_seconds", "Template render time by view.")
+RESPONSE_SIZE = Histogram("django_http_response_size_bytes", "Response body size by view.", SIZE_BUCKETS)
+EXTERNAL_LATENCY = Histogram("external_request_duration_seconds", "Outbound HTTP calls by service.")
+METRICS = (REQUESTS, LATENCY, QUERIES, QUERY_TIME, TEMPLATE_TIME, RESPONSE_SIZE, EXTERNAL_LATENCY)
+
+
+@contextmanager
+def timed(service: str) -> Iterator[None]:
+    """Record the duration of an outbound call under `service`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        EXTERNAL_LATENCY.observe(time.perf_counter() - start, service=service)
+
+
+def _view_name(request: HttpRequest) -> str:
+    match = getattr(request, "resolver_match", None)
+    return (match.view_name if match else None) or "unresolved"
+
+
+class QueryTimer:
+    """`connection.execute_wrapper` counting the queries of a request and their total time."""
+
+    def __init__(self):
+        self.count, self.duration = 0, 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+class MetricsMiddleware:
+    """Record the metrics of every request under its resolved URL name."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        start = time.perf_counter()
+        queries = QueryTimer()
+        with connection.execute_wrapper(queries):
+            response = self.get_response(request)
+
+        view = _view_name(request)
+        REQUESTS.inc(view=view, method=request.method, status=str(response.status_code))
+        LATENCY.observe(time.perf_counter() - start, view=view)
+        QUERIES.observe(queries.count, view=view)
+        QUERY_TIME.observe(queries.duration, view=view)
+        if not response.streaming:
+            RESPONSE_SIZE.observe(len(response.content), view=view)
+        return response
+
+    def process_template_response(self, request: HttpRequest, response: HttpResponse) -> HttpResponse:
+        """Called right before the response is rendered, so the render time is measured from here."""
+        start = time.perf_counter()
+
+        def rendered(response):
+            TEMPLATE_TIME.observe(time.perf_counter() - start, view=_view_name(request))
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+def render() -> str:
+    with _lock:
+        return "\n".join(line for metric in METRICS for line in metric.render()) + "\n"
+
+
+@query_budget(2)
+def metrics(request: HttpRequest) -> HttpResponse:
+    """The current metrics of this process in the Prometheus text format. Staff only."""
+    if not (request.user.is_authenticated and request.user.is_staff):
+        raise Http404
+    return HttpResponse(render(), content_type="text/plain; version=0.0.4; charset=utf-8")
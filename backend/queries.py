@@ -0,0 +1,126 @@
+"""
+N+1 query detection and per-view query budgets for development and tests.
+
+When `settings.QUERY_INSPECTION` is on, `QueryInspectionMiddleware` fingerprints every SQL
+statement of a request (the statement with its literals and `IN` lists collapsed) and records
+where it came from: the innermost template node being rendered and the innermost line of
+project code. The same fingerprint run `REPEAT_THRESHOLD` times or more from the same place in
+one request is an N+1 pattern. Views may declare a `query_budget`, the most queries a request to them may run.
+
+N+1s and exceeded budgets are logged. With `settings.QUERY_INSPECTION_STRICT` (on in the test
+runner) they raise `QueryBudgetExceeded` instead, so the tests making the request fail.
+"""
+
+import logging
+import re
+import sys
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.http import HttpRequest, HttpResponse
+from django.template.base import Node
+
+logger = logging.getLogger(__name__)
+
+REPEAT_THRESHOLD = 3
+
+_IN_LIST = re.compile(r"\bIN \((?:%s, )*%s\)")
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def fingerprint(sql: str) -> str:
+    """`sql` without the parts that vary between executions of the same statement."""
+    return _LITERAL.sub("?", _IN_LIST.sub("IN (...)", sql))
+
+
+def _origin() -> str:
+    """Where the current query comes from: `template:line` and/or `file:line` of project code."""
+    template = code = None
+    base_dir = str(settings.BASE_DIR)
+    frame = sys._getframe(2)
+    while frame and not (template and code):
+        locals_ = frame.f_locals
+        # type() rather than isinstance(), which would evaluate lazy objects such as request.user.
+        node = locals_.get("self")
+        if template is None and issubclass(type(node), Node) and node.origin and node.token:
+            template = f"{node.origin.template_name}:{node.token.lineno}"
+        filename = frame.f_code.co_filename
+        in_project = filename.startswith(base_dir) and "site-packages" not in filename
+        # Skip the other execute wrappers, e.g. backend.metrics.QueryTimer.
+        is_wrapper = "execute" in locals_ and "many" in locals_
+        if code is None and in_project and not is_wrapper:
+            code = f"{filename[len(base_dir) + 1:]}:{frame.f_lineno}"
+        frame = frame.f_back
+    if template and code:
+        return f"{template} ({code})"
+    return template or code or "unknown"
+
+
+@dataclass
+class QueryReport:
+    """`connection.execute_wrapper` counting the queries of one request by fingerprint and origin."""
+    counts: Counter = field(default_factory=Counter)
+
+    def __call__(self, execute, sql, params, many, context):
+        self.counts[fingerprint(sql), _origin()] += 1
+        return execute(sql, params, many, context)
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    def repeated(self, threshold: int = REPEAT_THRESHOLD) -> list[tuple[str, int, str]]:
+        """(fingerprint, executions, origin) of every statement run at least `threshold` times from one place."""
+        return [(sql, count, origin) for (sql, origin), count in self.counts.most_common() if count >= threshold]
+
+
+def query_budget(budget: int) -> Callable:
+    """Declare the query budget of a function based view."""
+    def decorator(view: Callable) -> Callable:
+        view.query_budget = budget
+        return view
+    return decorator
+
+
+def get_query_budget(view_func: Callable) -> Optional[int]:
+    """The `query_budget` of a function view, or of the class of a Django or DRF class based view."""
+    view = getattr(view_func, "view_class", None) or getattr(view_func, "cls", None) or view_func
+    return getattr(view, "query_budget", None)
+
+
+class QueryInspectionMiddleware:
+    """Report N+1 queries and enforce view query budgets. Disabled unless `settings.QUERY_INSPECTION`."""
+
+    def __init__(self, get_response):
+        if not getattr(settings, "QUERY_INSPECTION", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.strict = getattr(settings, "QUERY_INSPECTION_STRICT", False)
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        report = QueryReport()
+        with connection.execute_wrapper(report):
+            response = self.get_response(request)
+        response.query_report = report
+
+        problems = [f"N+1: {count} x {sql} at {origin}" for sql, count, origin in report.repeated()]
+        budget = getattr(request, "query_budget", None)
+        if budget is not None and report.total > budget:
+            problems.append(f"{report.total} queries, over the budget of {budget}")
+        if problems:
+            message = f"{request.method} {request.get_full_path()}:\n" + "\n".join(problems)
+            if self.strict:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def process_view(self, request: HttpRequest, view_func: Callable, view_args, view_kwargs) -> None:
+        request.query_budget = get_query_budget(view_func)
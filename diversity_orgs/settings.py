@@ -11,7 +11,10 @@ https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 
 from pathlib import Path
+import importlib.util
 import os
+import sys
+from django.core.exceptions import ImproperlyConfigured
 from django.forms.renderers import TemplatesSetting
 
 class CustomFormRenderer(TemplatesSetting):
@@ -33,6 +36,16 @@ DEBUG = os.environ.get("DJANGO_DEBUG", False)
 
 ADMIN_ENABLED = os.environ.get("DJANGO_ADMIN_ENABLED", False)
 
+TESTING = sys.argv[1:2] == ["test"]
+
+# Report N+1 queries and enforce view query budgets (backend.queries). Tests fail on either.
+QUERY_INSPECTION = (
+    os.environ["DJANGO_QUERY_INSPECTION"].strip().lower() in ("1", "true", "yes", "on")
+    if os.environ.get("DJANGO_QUERY_INSPECTION")
+    else bool(DEBUG or TESTING)
+)
+QUERY_INSPECTION_STRICT = TESTING
+
 ALLOWED_HOSTS = SITE_HOSTS = (
     "diversityorgs.tech",
     "diversityorgs-django.azurewebsites.net",
@@ -48,6 +61,7 @@ INSTALLED_APPS = [
     "django.contrib.admin",
     "django.contrib.auth",
     "django.contrib.contenttypes",
+    "django.contrib.postgres",
     "django.forms",
     "django.contrib.sessions",
     "django.contrib.messages",
@@ -58,6 +72,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "backend.metrics.MetricsMiddleware",
+    "backend.queries.QueryInspectionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -100,7 +116,27 @@ REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
         "rest_framework.authentication.BasicAuthentication",
         "rest_framework.authentication.SessionAuthentication",
-    ]
+    ],
+    "DEFAULT_RENDERER_CLASSES": [
+        "api.renderers.ORJSONRenderer",
+        # MessagePack is negotiated (`Accept: application/msgpack`) only when msgpack is installed.
+        *(["api.renderers.MessagePackRenderer"] if importlib.util.find_spec("msgpack") else []),
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_THROTTLE_CLASSES": ["api.throttling.TokenBucketThrottle"],
+    # Anonymous clients are throttled by IP: the address the last of this many proxies (App Service's
+    # front end) appended to X-Forwarded-For. Anything the client sent in that header is ignored.
+    "NUM_PROXIES": int(os.environ.get("DJANGO_NUM_PROXIES", 1)),
+    # Per API token, logged in user or anonymous IP; "expensive.*" for views with throttle_scope = "expensive".
+    # Unlimited in the test runner, throttling tests set their own rates.
+    "DEFAULT_THROTTLE_RATES": {} if TESTING else {
+        "anon": "60/min",
+        "user": "300/min",
+        "token": "600/min",
+        "expensive.anon": "10/min",
+        "expensive.user": "30/min",
+        "expensive.token": "60/min",
+    },
 }
 
 # Database
@@ -120,6 +156,24 @@ DATABASES = {
     }
 }
 
+# Cache
+# Page, map, tile and featured caches, their invalidation versions, the managed organizations,
+# cached API tokens and throttle counters all go through it, so it must be shared by every worker
+# and must not be the database: autocomplete, token lookups and throttling read it on every request
+# to stay off the database. Production requires Redis (REDIS_URL). Only the single process
+# development server and the test runner use local memory.
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+        }
+    }
+elif DEBUG or TESTING:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+else:
+    raise ImproperlyConfigured("REDIS_URL must be set: the workers share their caches through Redis.")
+
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 
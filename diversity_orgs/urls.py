@@ -16,11 +16,13 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 import diversity_orgs.settings as settings
+from backend.metrics import metrics
 
 urlpatterns = [
     path("accounts/", include("accounts.urls")),
     path("accounts/", include("django.contrib.auth.urls")),
     path("api/", include("api.urls")),
+    path("metrics", metrics, name="metrics"),
     path("", include("org_pages.urls")),  # include the urls from the org_pages app
 ]
 
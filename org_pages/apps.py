@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class OrgPagesConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "org_pages"
+
+    def ready(self):
+        import org_pages.signals  # noqa: F401
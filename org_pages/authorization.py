@@ -0,0 +1,81 @@
+"""
+Which organizations a user may manage.
+
+Organizers manage the organizations they organize directly and the children of those
+organizations. Both sets are resolved with one query, memoized on the user object (so once per
+request for `request.user`) and shared between requests through a short lived per-user cache
+entry. The org_pages signal handlers drop the cache entry when organizers or parents change.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Iterable, Optional
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+
+from .models import Organization
+
+CACHE_PREFIX = "managed_orgs:"
+CACHE_TIMEOUT = 300
+
+
+@dataclass(frozen=True)
+class ManagedOrganizations:
+    """The ids of the organizations a user organizes and of every organization they can manage."""
+    direct: frozenset = frozenset()
+    all: frozenset = frozenset()
+
+    def __contains__(self, pk: Optional[int]) -> bool:
+        return pk in self.all
+
+
+def _load(user: Any) -> ManagedOrganizations:
+    organizes = Organization.organizers.through.objects.filter(organization_id=OuterRef("pk"), customuser=user)
+    rows = list(
+        Organization.objects.filter(Q(organizers=user) | Q(parent__organizers=user))
+        .annotate(direct=Exists(organizes))
+        .order_by()
+        .values_list("pk", "direct")
+        .distinct()
+    )
+    return ManagedOrganizations(
+        direct=frozenset(pk for pk, direct in rows if direct),
+        all=frozenset(pk for pk, _ in rows),
+    )
+
+
+def managed_organizations(user: Any) -> ManagedOrganizations:
+    """The organizations `user` may manage. Anonymous users don't manage any."""
+    if not user or not user.is_authenticated:
+        return ManagedOrganizations()
+
+    if (managed := getattr(user, "_managed_organizations", None)) is None:
+        managed = cache.get(CACHE_PREFIX + str(user.pk))
+        if managed is None:
+            managed = _load(user)
+            cache.set(CACHE_PREFIX + str(user.pk), managed, CACHE_TIMEOUT)
+        user._managed_organizations = managed
+    return managed
+
+
+def is_organizer(user: Any, org: Organization) -> bool:
+    """Check if a user is a superuser or manages `org` directly or through its parent."""
+    if not user or not user.is_authenticated:
+        return False
+    return user.is_superuser or org.pk in managed_organizations(user)
+
+
+def invalidate(user_ids: Iterable[int]) -> None:
+    """Drop the cached organizations of `user_ids` once the current transaction commits."""
+    keys = [CACHE_PREFIX + str(pk) for pk in user_ids]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_organizers(org_ids: Iterable[Optional[int]]) -> None:
+    """Drop the cached organizations of every organizer of `org_ids`."""
+    through = Organization.organizers.through
+    invalidate(
+        through.objects.filter(organization_id__in=[pk for pk in org_ids if pk])
+        .values_list("customuser_id", flat=True)
+    )
@@ -0,0 +1,159 @@
+"""
+In-process prefix index used by the autocomplete API.
+
+The index is a sorted list of `(term, kind, pk)` tuples searched with `bisect`, so a lookup never
+touches the database. It is built on the first lookup and kept current by the org_pages signal
+handlers. Other processes notice changes through a version counter in the shared cache and
+rebuild on their next lookup.
+"""
+
+import threading
+from bisect import bisect_left, insort
+from typing import Iterable, Optional
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Model
+from django.urls import reverse
+
+from .models import DiversityFocus, Location, Organization, TechnologyFocus
+from .templatetags.org_extras import urlparams
+
+VERSION_KEY = "autocomplete:version"
+MAX_SCAN = 500
+KINDS = {Organization: "organization", DiversityFocus: "diversity", TechnologyFocus: "technology", Location: "location"}
+
+
+def normalize(value: str) -> str:
+    return " ".join(value.lower().split())
+
+
+def word_terms(*names: str) -> set[str]:
+    """Every word suffix of every name so "py" and "atl" both match "Black Python Atlanta"."""
+    terms = set()
+    for name in names:
+        words = normalize(name or "").split(" ")
+        terms.update(" ".join(words[i:]) for i in range(len(words)) if words[i])
+    return terms
+
+
+def document(instance: Model) -> Optional[tuple[str, str, str, set[str]]]:
+    """Return the (kind, label, url, terms) indexed for a model instance."""
+    if isinstance(instance, Organization):
+        if not instance.slug:
+            return None
+        return "organization", instance.name, instance.get_absolute_url(), word_terms(instance.name)
+
+    if isinstance(instance, (DiversityFocus, TechnologyFocus)):
+        kind = "diversity" if isinstance(instance, DiversityFocus) else "technology"
+        url = reverse("org_filter") + urlparams(**{kind: instance.name})
+        return kind, instance.name, url, word_terms(instance.name, *(instance.other_names or []))
+
+    if isinstance(instance, Location):
+        url = reverse("org_filter") + urlparams(city=instance.name, region=instance.region, country=instance.country)
+        return "location", str(instance), url, word_terms(str(instance).replace(",", " "))
+
+    return None
+
+
+class PrefixIndex:
+    """A sorted array prefix index of organizations, focuses and locations."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._terms: list[tuple[str, str, int]] = []
+        self._docs: dict[tuple[str, int], tuple[str, str, set[str]]] = {}
+        self._version = None
+
+    def _add(self, instance: Model) -> None:
+        if not (doc := document(instance)):
+            return
+        kind, label, url, terms = doc
+        self._docs[(kind, instance.pk)] = (label, url, terms)
+        for term in terms:
+            insort(self._terms, (term, kind, instance.pk))
+
+    def _remove(self, kind: str, pk: int) -> None:
+        if not (doc := self._docs.pop((kind, pk), None)):
+            return
+        for term in doc[2]:
+            position = bisect_left(self._terms, (term, kind, pk))
+            if position < len(self._terms) and self._terms[position] == (term, kind, pk):
+                del self._terms[position]
+
+    def rebuild(self) -> None:
+        """Load every indexed object with one query per model."""
+        version = cache.get_or_set(VERSION_KEY, 1, timeout=None)
+        instances = (
+            *Organization.objects.only("name", "slug"),
+            *DiversityFocus.objects.only("name", "other_names"),
+            *TechnologyFocus.objects.only("name", "other_names"),
+            *Location.objects.only("name", "region", "country"),
+        )
+
+        with self._lock:
+            self._terms, self._docs = [], {}
+            for instance in instances:
+                if doc := document(instance):
+                    kind, label, url, terms = doc
+                    self._docs[(kind, instance.pk)] = (label, url, terms)
+                    self._terms.extend((term, kind, instance.pk) for term in terms)
+            self._terms.sort()
+            self._version = version
+
+    def update(self, instance: Model, deleted: bool = False) -> None:
+        """
+        Replace (or remove) the entries for a single instance and publish the change to other
+        processes, once the current transaction commits.
+        """
+        transaction.on_commit(lambda: self._update(instance, deleted))
+
+    def _update(self, instance: Model, deleted: bool) -> None:
+        try:
+            version = cache.incr(VERSION_KEY)
+        except ValueError:
+            version = None
+
+        with self._lock:
+            if self._version is None:
+                return
+            if version is None or version != self._version + 1:
+                # Another process changed the index too: its change is only picked up by a rebuild.
+                self._version = None
+                return
+
+            # Removed by kind, so an instance that is no longer indexed (e.g. without a slug) loses its entries.
+            if (kind := KINDS.get(type(instance))) is not None:
+                self._remove(kind, instance.pk)
+            if not deleted:
+                self._add(instance)
+            self._version = version
+
+    def search(self, query: str, limit: int = 10, kinds: Optional[Iterable[str]] = None) -> list[dict]:
+        """Return up to `limit` matches for the prefix `query`, full name matches first."""
+        query = normalize(query)
+        if not query:
+            return []
+
+        if self._version is None or self._version != cache.get(VERSION_KEY):
+            self.rebuild()
+
+        with self._lock:
+            matches = {}
+            position = bisect_left(self._terms, (query,))
+            for term, kind, pk in self._terms[position: position + MAX_SCAN]:
+                if not term.startswith(query):
+                    break
+                if kinds and kind not in kinds:
+                    continue
+                rank = 0 if normalize(self._docs[(kind, pk)][0]).startswith(query) else 1
+                matches[(kind, pk)] = min(rank, matches.get((kind, pk), rank))
+
+            ranked = sorted(matches.items(), key=lambda item: (item[1], self._docs[item[0]][0].lower()))
+            return [
+                {"kind": kind, "name": self._docs[(kind, pk)][0], "url": self._docs[(kind, pk)][1]}
+                for (kind, pk), _ in ranked[:limit]
+            ]
+
+
+autocomplete_index = PrefixIndex()
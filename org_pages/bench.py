@@ -0,0 +1,273 @@
+"""
+Synthetic directory benchmark.
+
+`seed` fills the database with a generated directory (organizations, locations, a layered
+diversity/technology DAG, parent organizations with many chapters and organizers) using bulk
+inserts, then rebuilds the derived data the signal handlers would otherwise maintain.
+`benchmark` times every GET route of the URL modules it is given (`SITE` here, `api.bench.SITE`
+for the API) through the test client and reports latency percentiles, query counts and peak
+memory per route.
+"""
+
+import random
+import re
+import statistics
+import tempfile
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, field
+from types import ModuleType
+from typing import Callable, Iterable, Optional
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpResponse
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from accounts.models import CustomUser
+
+from . import geo, urls
+from .models import DiversityFocus, Location, Organization, TechnologyFocus
+from .search import update_search_documents
+from .similarity import refresh as refresh_similar
+from .taxonomy import refresh as refresh_closure
+
+BATCH_SIZE = 5000
+
+
+@dataclass
+class DirectoryConfig:
+    organizations: int = 100_000
+    locations: int = 5_000
+    focuses: int = 300
+    depth: int = 6
+    parents: int = 200
+    chapters: int = 250
+    organizers: int = 1_000
+    seed: int = 0
+
+
+def _bulk(model, objects) -> list:
+    return model.objects.bulk_create(objects, batch_size=BATCH_SIZE)
+
+
+def _focus_dag(model, config: DirectoryConfig, rng: random.Random) -> list:
+    """`config.focuses` focuses in `config.depth` layers, each linked to one or two focuses of the layer above."""
+    focuses = _bulk(model, (model(name=f"{model.__name__} {i}") for i in range(config.focuses)))
+    layers = [focuses[i::config.depth] for i in range(config.depth)]
+    through = model.parents.through
+    name = model._meta.model_name
+    _bulk(through, (
+        through(**{f"from_{name}_id": child.pk, f"to_{name}_id": parent.pk})
+        for above, layer in zip(layers, layers[1:])
+        for child in layer
+        for parent in rng.sample(above, min(len(above), rng.randint(1, 2)))
+    ))
+    return focuses
+
+
+def seed(config: DirectoryConfig) -> dict[str, int]:
+    """Generate a directory. Returns the number of rows created for each model."""
+    rng = random.Random(config.seed)
+
+    # Both coordinates are unique; 7919 is prime, so `i * 7919 % n` permutes range(n).
+    coordinates = [
+        (
+            round(-60 + 120 * i / config.locations, 5),
+            round(-170 + 340 * (i * 7919 % config.locations) / config.locations, 5),
+        )
+        for i in range(config.locations)
+    ]
+    locations = _bulk(Location, (
+        Location(
+            name=f"City {i}", region=f"Region {i % 50}", country=f"Country {i % 20}",
+            latitude=latitude, longitude=longitude, geohash=geo.encode(latitude, longitude),
+        )
+        for i, (latitude, longitude) in enumerate(coordinates)
+    ))
+    diversity = _focus_dag(DiversityFocus, config, rng)
+    technology = _focus_dag(TechnologyFocus, config, rng)
+
+    parents = _bulk(Organization, (
+        Organization(name=f"Network {i}", slug=f"network-{i}", is_featured=i < 20, org_type=Organization.NETWORK)
+        for i in range(min(config.parents, config.organizations))
+    ))
+    chapter_count = min(config.parents * config.chapters, config.organizations - len(parents))
+    org_types = [choice for choice, _ in Organization.TYPE_CHOICES]
+    orgs = _bulk(Organization, (
+        Organization(
+            name=f"Organization {i}",
+            slug=f"organization-{i}",
+            description=f"Synthetic organization {i} for benchmarking.",
+            org_type=rng.choice(org_types),
+            location=rng.choice(locations) if rng.random() < 0.8 else None,
+            online_only=rng.random() < 0.2,
+            paid=rng.random() < 0.1,
+            active=rng.random() < 0.9,
+            is_featured=i < chapter_count and rng.random() < 0.01,
+            parent=parents[i % len(parents)] if parents and i < chapter_count else None,
+        )
+        for i in range(config.organizations - len(parents))
+    ))
+    orgs = parents + orgs
+
+    for tag, focuses in (("diversity", diversity), ("technology", technology)):
+        through = getattr(Organization, tag).through
+        column = f"{focuses[0]._meta.model_name}_id"
+        _bulk(through, (
+            through(organization_id=org.pk, **{column: focus.pk})
+            for org in orgs
+            for focus in rng.sample(focuses, rng.randint(0, 3))
+        ))
+
+    users = _bulk(CustomUser, (
+        CustomUser(username=f"organizer-{i}", email=f"organizer-{i}@example.com", password="!")
+        for i in range(config.organizers)
+    ))
+    through = Organization.organizers.through
+    _bulk(through, (
+        through(organization_id=rng.choice(orgs).pk, customuser_id=user.pk) for user in users
+    ))
+
+    # bulk_create doesn't send signals, so rebuild what the handlers maintain.
+    update_search_documents(Organization.objects.all())
+    refresh_closure(DiversityFocus, None)
+    refresh_closure(TechnologyFocus, None)
+    return {
+        "organizations": len(orgs),
+        "locations": len(locations),
+        "diversity_focuses": len(diversity),
+        "technology_focuses": len(technology),
+        "organizers": len(users),
+    }
+
+
+@dataclass
+class RouteResult:
+    url: str
+    statuses: list[int]
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    queries: int
+    peak_memory_kb: float
+
+
+def percentile(values: list[float], percent: float) -> float:
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered)) - 1))]
+
+
+@dataclass
+class Site:
+    """The GET routes of a URL module, mounted at `prefix`, to time."""
+    prefix: str
+    urls: ModuleType
+    namespace: str = ""
+    # Query parameters of the routes that need them, by URL name, from the sample organization and focus.
+    queries: Callable[[Organization, DiversityFocus], dict[str, dict]] = lambda sample, focus: {}
+    # URL names that need a logged in organizer to do any work.
+    authenticated: frozenset[str] = field(default_factory=frozenset)
+    # Values of the URL parameters besides the sample's slug and pk.
+    values: dict[str, str] = field(default_factory=dict)
+
+    def name(self, pattern) -> str:
+        return f"{self.namespace}:{pattern.name}" if self.namespace else pattern.name
+
+
+SITE = Site(
+    "", urls,
+    queries=lambda sample, focus: {"search": {"q": sample.name.split()[0]}, "org_filter": {"diversity": focus.name}},
+    authenticated=frozenset({"create_org", "update_org", "claim_org"}),
+)
+
+
+def routes(sites: Iterable[Site], sample: Organization, focus: DiversityFocus) -> dict[str, tuple[str, bool]]:
+    """The URL of every named GET route, filled in with sample objects, and whether it needs an organizer."""
+    found = {}
+    for site in sites:
+        values = {"slug": sample.slug, "pk": str(sample.pk), **site.values}
+        queries = site.queries(sample, focus)
+        for pattern in site.urls.urlpatterns:
+            path = re.sub(r"<(?:\w+:)?(\w+)>", lambda match: values[match.group(1)], str(pattern.pattern))
+            query = f"?{urlencode(queries[pattern.name])}" if pattern.name in queries else ""
+            found[site.name(pattern)] = (f"/{site.prefix}{path}{query}", pattern.name in site.authenticated)
+    return found
+
+
+def _get(client: Client, url: str) -> HttpResponse:
+    """GET `url`, consuming a streamed body so its rows are read (and timed)."""
+    response = client.get(url)
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    return response
+
+
+def time_route(client: Client, url: str, iterations: int, warm: bool) -> RouteResult:
+    durations, statuses = [], []
+    for _ in range(iterations):
+        if not warm:
+            cache.clear()
+        start = time.perf_counter()
+        response = _get(client, url)
+        durations.append((time.perf_counter() - start) * 1000)
+        statuses.append(response.status_code)
+
+    if not warm:
+        cache.clear()
+    tracemalloc.start()
+    with CaptureQueriesContext(connection) as queries:
+        _get(client, url)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return RouteResult(
+        url=url,
+        statuses=sorted(set(statuses)),
+        p50_ms=round(statistics.median(durations), 2),
+        p95_ms=round(percentile(durations, 95), 2),
+        p99_ms=round(percentile(durations, 99), 2),
+        queries=len(queries),
+        peak_memory_kb=round(peak / 1024, 1),
+    )
+
+
+def benchmark(
+    sites: Iterable[Site] = (SITE,), iterations: int = 20, warm: bool = False, only: Optional[list[str]] = None,
+) -> dict[str, dict]:
+    """
+    Time every route of `sites`. Caches are cleared before each request unless `warm`.
+    Authenticated routes are requested as an organizer of the sample organization. Throttling
+    is off, so no route is timed answering 429s, and files go to a temporary local directory.
+    """
+    sample = (
+        Organization.objects.filter(parent__isnull=False, location__isnull=False).first()
+        or Organization.objects.first()
+    )
+    refresh_similar(sample)
+    focus = DiversityFocus.objects.filter(parents__isnull=True).first()
+    organizer = CustomUser.objects.filter(is_active=True).first()
+    if organizer:
+        sample.organizers.add(organizer)
+
+    anonymous, authenticated = Client(raise_request_exception=False), Client(raise_request_exception=False)
+    if organizer:
+        authenticated.force_login(organizer)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as media_root, override_settings(
+        REST_FRAMEWORK={**getattr(settings, "REST_FRAMEWORK", {}), "DEFAULT_THROTTLE_RATES": {}},
+        DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage",
+        MEDIA_ROOT=media_root,
+    ):
+        for name, (url, needs_organizer) in routes(sites, sample, focus).items():
+            if only and name not in only:
+                continue
+            client = authenticated if needs_organizer else anonymous
+            results[name] = asdict(time_route(client, url, iterations, warm))
+    return results
@@ -0,0 +1,220 @@
+"""
+Bulk creates and partial updates of organizations.
+
+`validate` checks a batch against the organizations the user manages and against the directory
+(references, unique names and slugs) with a fixed number of queries, whatever its size. `apply`
+writes a valid batch in one transaction: the new organizations with one `bulk_create`, the
+updates with one `bulk_update` per set of changed fields, and the tags and organizers with one
+delete and one insert per through table. None of that sends signals, so the derived data the
+org_pages signal handlers maintain is refreshed once for the whole batch by `refresh_derived`:
+the search documents in the transaction, the similar organizations and the caches (pages, tiles,
+featured list, organizers, autocomplete) once it commits.
+"""
+
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .authorization import invalidate as invalidate_managed, invalidate_organizers, managed_organizations
+from .autocomplete import autocomplete_index
+from .cache import GLOBAL, bump, bump_orgs, org_scope
+from .featured import invalidate as invalidate_featured
+from .models import DiversityFocus, Location, Organization, TechnologyFocus
+from .search import update_search_documents
+from .similarity import PROFILE_FIELDS, refresh_later as refresh_similar
+from .tiles import invalidate as invalidate_tiles
+
+MAX_ITEMS = 1000
+TAG_MODELS = {"diversity": DiversityFocus, "technology": TechnologyFocus}
+# Fields whose change affects the similar organizations of an organization.
+SIMILARITY_FIELDS = {*PROFILE_FIELDS, *TAG_MODELS}
+
+
+@dataclass
+class Change:
+    """A create (no `pk`) or a partial update. `values` are keyed by attname, `tags` by tag field."""
+    pk: Optional[int] = None
+    values: dict[str, Any] = field(default_factory=dict)
+    tags: dict[str, list[int]] = field(default_factory=dict)
+
+    @property
+    def fields(self) -> set[str]:
+        return set(self.values) | set(self.tags)
+
+
+def validate(changes: list[Change], user: Any) -> dict[int, dict[str, list[str]]]:
+    """The errors of each invalid change, by index. Fills in the slugs of new organizations."""
+    errors = defaultdict(lambda: defaultdict(list))
+    managed = managed_organizations(user)
+
+    def can_manage(pk: Optional[int]) -> bool:
+        return user.is_superuser or pk in managed
+
+    seen = set()
+    for index, change in enumerate(changes):
+        if change.pk is not None:
+            if not can_manage(change.pk):
+                errors[index]["id"].append("You don't manage this organization.")
+            elif change.pk in seen:
+                errors[index]["id"].append("The organization is changed more than once.")
+            seen.add(change.pk)
+        parent = change.values.get("parent_id")
+        if parent is not None and (parent == change.pk or not can_manage(parent)):
+            errors[index]["parent"].append("The parent must be another organization you manage.")
+        if change.pk is None and not change.values.get("slug") and change.values.get("name"):
+            change.values["slug"] = slugify(change.values["name"])
+            if not change.values["slug"]:
+                errors[index]["slug"].append("No slug can be made from this name, please provide one.")
+
+    # Parents, as they will be after the batch, must not lead back to the organization.
+    for index in cycles(changes):
+        errors[index]["parent"].append("The parent can't be one of the organization's own chapters.")
+
+    # References, one query per model.
+    references = [
+        ("location", Location, lambda change: [change.values.get("location_id")]),
+        ("parent", Organization, lambda change: [change.values.get("parent_id")]),
+        *((tag, model, lambda change, tag=tag: change.tags.get(tag, [])) for tag, model in TAG_MODELS.items()),
+    ]
+    for name, model, referenced in references:
+        wanted = {pk for change in changes for pk in referenced(change) if pk is not None}
+        existing = set(model.objects.filter(pk__in=wanted).values_list("pk", flat=True)) if wanted else set()
+        for index, change in enumerate(changes):
+            if missing := {pk for pk in referenced(change) if pk is not None} - existing:
+                errors[index][name].append(f"Unknown {name}: {', '.join(str(pk) for pk in sorted(missing))}.")
+
+    # Unique names and slugs, within the batch and against the directory.
+    for key in ("name", "slug"):
+        claimed = defaultdict(list)
+        for index, change in enumerate(changes):
+            if value := change.values.get(key):
+                claimed[value].append(index)
+        taken = dict(Organization.objects.filter(**{f"{key}__in": list(claimed)}).values_list(key, "pk"))
+        for value, indexes in claimed.items():
+            for index in indexes:
+                if len(indexes) > 1 or (value in taken and taken[value] != changes[index].pk):
+                    errors[index][key].append(f"An organization with this {key} already exists.")
+
+    return {index: dict(fields) for index, fields in errors.items()}
+
+
+def cycles(changes: list[Change]) -> list[int]:
+    """
+    The indexes of the changes whose new parent is the organization itself or one of its chapters,
+    given the other parents of the batch. Reads the existing parents one query per level.
+    """
+    parents = {
+        change.pk: change.values["parent_id"]
+        for change in changes if change.pk is not None and "parent_id" in change.values
+    }
+    if not any(parents.values()):
+        return []
+    wanted = set(parents.values()) - set(parents) - {None}
+    while wanted:
+        found = dict(Organization.objects.filter(pk__in=wanted).values_list("pk", "parent_id"))
+        parents.update(found)
+        wanted = set(found.values()) - set(parents) - {None}
+
+    found = []
+    for index, change in enumerate(changes):
+        ancestor, seen = parents.get(change.pk) if change.pk is not None else None, set()
+        while ancestor is not None and ancestor not in seen and ancestor != change.pk:
+            seen.add(ancestor)
+            ancestor = parents.get(ancestor)
+        if ancestor is not None and ancestor == change.pk and parents[change.pk] != change.pk:
+            found.append(index)
+    return found
+
+
+@transaction.atomic
+def apply(changes: list[Change], user: Any) -> list[Organization]:
+    """Write a validated batch. Returns the created or updated organization of each change."""
+    now = timezone.now()
+    existing = Organization.objects.defer("search_document").in_bulk(
+        [change.pk for change in changes if change.pk is not None]
+    )
+    previous = {pk: dict(org._loaded_values) for pk, org in existing.items()}
+
+    created = Organization.objects.bulk_create(
+        [Organization(**change.values) for change in changes if change.pk is None]
+    )
+    new = iter(created)
+    results = [existing[change.pk] if change.pk is not None else next(new) for change in changes]
+
+    # One UPDATE per set of changed fields.
+    groups = defaultdict(list)
+    for change, org in zip(changes, results):
+        if change.pk is not None:
+            for attname, value in change.values.items():
+                setattr(org, attname, value)
+            org.updated_at = now
+            groups[tuple(sorted(change.values))].append(org)
+    for fields, orgs in groups.items():
+        Organization.objects.bulk_update(orgs, [*fields, "updated_at"])
+
+    # Replace the tags of every organization whose tags were given.
+    for tag in TAG_MODELS:
+        through = getattr(Organization, tag).through
+        column = through._meta.get_field(getattr(Organization, tag).field.m2m_reverse_field_name()).attname
+        tagged = [(org, change.tags[tag]) for change, org in zip(changes, results) if tag in change.tags]
+        if not tagged:
+            continue
+        through.objects.filter(organization_id__in=[org.pk for org, _ in tagged]).delete()
+        through.objects.bulk_create([
+            through(organization_id=org.pk, **{column: pk}) for org, pks in tagged for pk in set(pks)
+        ])
+
+    # New organizations outside of a network the user manages are managed by the user.
+    organized = [org for change, org in zip(changes, results) if change.pk is None and not org.parent_id]
+    if organized:
+        Organization.organizers.through.objects.bulk_create([
+            Organization.organizers.through(organization_id=org.pk, customuser_id=user.pk) for org in organized
+        ])
+
+    refresh_derived(changes, results, previous)
+    if organized:
+        invalidate_managed([user.pk])
+    return results
+
+
+def refresh_derived(changes: list[Change], orgs: list[Organization], previous: dict[int, dict]) -> None:
+    """
+    What the signal handlers would have done for each save, done once for the batch.
+    Cache invalidations are deferred until the current transaction commits.
+    """
+    pks = [org.pk for org in orgs]
+    update_search_documents(Organization.objects.filter(pk__in=pks))
+
+    # Pages: the directory, the organizations under their old and new slugs, and their relatives.
+    slugs = {org.slug for org in orgs} | {values.get("slug") for values in previous.values()}
+    parents = {org.parent_id for org in orgs} | {values.get("parent_id") for values in previous.values()}
+    bump(GLOBAL, *(org_scope(slug) for slug in slugs if slug))
+    bump_orgs(Organization.objects.filter(
+        Q(pk__in=[pk for pk in parents if pk]) | Q(parent_id__in=pks) | Q(similarities__similar_id__in=pks)
+    ).distinct())
+    invalidate_featured()
+
+    # Map tiles at the old and new locations.
+    locations = {org.location_id for org in orgs} | {values.get("location_id") for values in previous.values()}
+    invalidate_tiles(
+        Location.objects.filter(pk__in=[pk for pk in locations if pk]).values_list("latitude", "longitude")
+    )
+
+    moved = [
+        pk for org in orgs if org.pk in previous and previous[org.pk].get("parent_id") != org.parent_id
+        for pk in (org.parent_id, previous[org.pk].get("parent_id"))
+    ]
+    if moved:
+        invalidate_organizers(moved)
+
+    refresh_similar(
+        org.pk for change, org in zip(changes, orgs) if change.pk is None or change.fields & SIMILARITY_FIELDS
+    )
+
+    for org in orgs:
+        autocomplete_index.update(org)
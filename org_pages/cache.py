@@ -0,0 +1,130 @@
+"""
+Generational full-page cache for the public directory views.
+
+Cached pages are keyed by the request path and the current "directory version" of every scope
+the page depends on. The org_pages signal handlers bump the versions when organizations,
+locations or focuses change, so stale pages are never served again and simply expire, without
+having to find and delete their keys. Versions are bumped when the current transaction commits:
+bumped earlier, a concurrent request could cache the old data again under the new version.
+
+The cache must be shared by every worker (see `CACHES`), or the other workers never see a bump.
+
+Scopes:
+    global: anything in the directory (home, search and filter pages).
+    org:<slug>: a single organization's detail page.
+    similar: every detail page, bumped when all similar organizations are recomputed.
+    tag:<kind>: the diversity or technology focus list.
+
+Changes to a location or focus also bump the detail pages of the organizations using it.
+"""
+
+import hashlib
+import time
+from typing import Iterable
+
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import QuerySet
+from django.http import HttpRequest, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+VERSION_PREFIX = "directory:version:"
+PAGE_PREFIX = "directory:page:"
+PAGE_TIMEOUT = 60 * 60
+GLOBAL = "global"
+SIMILAR = "similar"
+
+
+def org_scope(slug: str) -> str:
+    return f"org:{slug}"
+
+
+def tag_scope(kind: str) -> str:
+    return f"tag:{kind}"
+
+
+def _initial_version() -> int:
+    # Counters start from the clock so a counter evicted from the cache never repeats an old version.
+    return time.time_ns() // 1000
+
+
+def versions(scopes: Iterable[str]) -> list[int]:
+    """The current version of each scope in one cache round trip."""
+    keys = [VERSION_PREFIX + scope for scope in scopes]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, _initial_version(), timeout=None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def _bump(scopes: set[str]) -> None:
+    for scope in scopes:
+        try:
+            cache.incr(VERSION_PREFIX + scope)
+        except ValueError:
+            cache.set(VERSION_PREFIX + scope, _initial_version(), timeout=None)
+
+
+def bump(*scopes: str) -> None:
+    """Invalidate every cached page depending on `scopes` once the current transaction commits."""
+    if scopes:
+        scopes = set(scopes)
+        transaction.on_commit(lambda: _bump(scopes))
+
+
+def bump_orgs(queryset: QuerySet) -> None:
+    """Invalidate the detail pages of every organization in `queryset`."""
+    bump(*(org_scope(slug) for slug in queryset.exclude(slug=None).values_list("slug", flat=True)))
+
+
+def page_key(request: HttpRequest, scopes: Iterable[str]) -> str:
+    version = ".".join(str(x) for x in versions(scopes))
+    return PAGE_PREFIX + hashlib.md5(f"{request.get_full_path()}:{version}".encode()).hexdigest()
+
+
+def is_cacheable(request: HttpRequest) -> bool:
+    """Only anonymous GETs without pending messages share cached pages."""
+    return (
+        request.method in ("GET", "HEAD")
+        and not request.user.is_authenticated
+        and not len(get_messages(request))
+    )
+
+
+class PageCacheMixin:
+    """
+    View mixin caching the rendered response of anonymous GETs.
+
+    Views list the scopes their page depends on in `get_cache_scopes`. Pages are cached for
+    `page_cache_timeout` seconds at most, which bounds how stale data without a scope can get.
+    """
+    page_cache_timeout = PAGE_TIMEOUT
+
+    def get_cache_scopes(self) -> list[str]:
+        return [GLOBAL]
+
+    def dispatch(self, request: HttpRequest, *args, **kwargs) -> HttpResponse:
+        if not is_cacheable(request):
+            return super().dispatch(request, *args, **kwargs)
+
+        self.request, self.args, self.kwargs = request, args, kwargs
+        key = page_key(request, self.get_cache_scopes())
+        if (response := cache.get(key)) is not None:
+            last_modified = parse_http_date_safe(response.get("Last-Modified"))
+            return get_conditional_response(request, response.get("ETag"), last_modified, response)
+
+        response = super().dispatch(request, *args, **kwargs)
+
+        def store(response: HttpResponse) -> None:
+            if response.status_code == 200 and not response.cookies:
+                cache.set(key, response, self.page_cache_timeout)
+
+        if hasattr(response, "add_post_render_callback") and not response.is_rendered:
+            response.add_post_render_callback(store)
+        else:
+            store(response)
+        return response
@@ -0,0 +1,154 @@
+"""
+Server side clustering of the map.
+
+The map asks for the organizations in its viewport (a bounding box) at its zoom level. The box
+is divided into a grid of `GRID_CELLS` cells per tile width at that zoom, and the organizations
+are grouped by cell in one aggregate query over the location coordinates, returning each cell's
+count, centroid and first few names. Cells holding a single organization, and every
+organization once the map is zoomed in to `FEATURE_ZOOM`, are returned as plain features.
+
+The zoom is lowered until the box has at most `MAX_CELLS` cells, so a huge box at a deep zoom is
+still clustered and the size of a response is bounded by the viewport rather than by the size of
+the directory. Responses are cached under the global directory version.
+"""
+
+import hashlib
+import math
+from dataclasses import dataclass
+
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.contrib.postgres.fields import ArrayField
+from django.core.cache import cache
+from django.db.models import Avg, CharField, Count, ExpressionWrapper, F, FloatField, Func, Min, Q, QuerySet
+from django.db.models.functions import Floor
+
+from .cache import GLOBAL, PAGE_TIMEOUT, versions
+from .geojson import point, url_template, with_coordinates
+
+CACHE_PREFIX = "directory:clusters:"
+GRID_CELLS = 4
+MAX_CELLS = 1024
+MAX_ZOOM = 22
+FEATURE_ZOOM = 14
+MAX_FEATURES = 1000
+CLUSTER_NAMES = 5
+
+
+@dataclass(frozen=True)
+class BoundingBox:
+    west: float
+    south: float
+    east: float
+    north: float
+
+    @classmethod
+    def parse(cls, value: str) -> "BoundingBox":
+        """Parse `west,south,east,north` in degrees. Raises ValueError."""
+        west, south, east, north = (float(x) for x in value.split(","))
+        if not (-180 <= west <= 180 and -180 <= east <= 180 and -90 <= south < north <= 90):
+            raise ValueError("bbox must be west,south,east,north in degrees")
+        return cls(west, south, east, north)
+
+    @property
+    def width(self) -> float:
+        # A box crossing the antimeridian has west > east.
+        return (self.east - self.west) % 360 or 360
+
+    def filter(self, queryset: QuerySet) -> QuerySet:
+        if self.width >= 360:
+            # The whole world, e.g. -180..180 or a box whose edges wrapped onto the same meridian.
+            longitude = Q()
+        elif self.west <= self.east:
+            longitude = Q(location__longitude__gte=self.west, location__longitude__lte=self.east)
+        else:
+            longitude = Q(location__longitude__gte=self.west) | Q(location__longitude__lte=self.east)
+        return queryset.filter(longitude, location__latitude__gte=self.south, location__latitude__lte=self.north)
+
+
+def cell_size(zoom: int) -> float:
+    """The grid cell size in degrees at `zoom`."""
+    return 360 / 2 ** zoom / GRID_CELLS
+
+
+def effective_zoom(bbox: BoundingBox, zoom: int) -> int:
+    """`zoom`, lowered until `bbox` has at most `MAX_CELLS` grid cells."""
+    def cells(zoom: int) -> int:
+        return math.ceil(bbox.width / cell_size(zoom)) * math.ceil((bbox.north - bbox.south) / cell_size(zoom))
+
+    zoom = max(0, min(zoom, MAX_ZOOM))
+    while zoom > 0 and cells(zoom) > MAX_CELLS:
+        zoom -= 1
+    return zoom
+
+
+def _abbreviate(count: int) -> str:
+    return f"{count / 1000:.1f}k".replace(".0k", "k") if count >= 1000 else str(count)
+
+
+def _cell(field: str, size: float) -> Floor:
+    return Floor(ExpressionWrapper(F(field) / size, output_field=FloatField()))
+
+
+def _first_names() -> Func:
+    """The first `CLUSTER_NAMES` names of a cell, sliced in the database."""
+    return Func(
+        ArrayAgg("name", ordering="name"),
+        template=f"(%(expressions)s)[1:{CLUSTER_NAMES}]",
+        output_field=ArrayField(CharField()),
+    )
+
+
+def features(queryset: QuerySet, bbox: BoundingBox) -> list[dict]:
+    url = url_template()
+    rows = bbox.filter(with_coordinates(queryset)).order_by("name").values_list(
+        "name", "slug", "location__longitude", "location__latitude",
+    )[:MAX_FEATURES]
+    return [point(longitude, latitude, {"url": url(slug), "name": name}) for name, slug, longitude, latitude in rows]
+
+
+def clusters(queryset: QuerySet, bbox: BoundingBox, zoom: int) -> list[dict]:
+    """One feature per non empty grid cell of `bbox`, read with one aggregate query."""
+    url = url_template()
+    size = cell_size(zoom)
+    cells = (
+        bbox.filter(with_coordinates(queryset))
+        .annotate(cell_x=_cell("location__longitude", size), cell_y=_cell("location__latitude", size))
+        .order_by()
+        .values("cell_x", "cell_y")
+        .annotate(
+            count=Count("pk"),
+            longitude=Avg("location__longitude"),
+            latitude=Avg("location__latitude"),
+            names=_first_names(),
+            slug=Min("slug"),
+        )
+    )
+    return [
+        point(cell["longitude"], cell["latitude"], (
+            {"url": url(cell["slug"]), "name": cell["names"][0]}
+            if cell["count"] == 1
+            else {
+                "cluster": True,
+                "point_count": cell["count"],
+                "point_count_abbreviated": _abbreviate(cell["count"]),
+                "names": cell["names"],
+            }
+        ))
+        for cell in cells
+    ]
+
+
+def feature_collection(queryset: QuerySet, bbox: BoundingBox, zoom: int, key: str) -> dict:
+    """
+    The clusters (or features, from `FEATURE_ZOOM`) of `queryset` in `bbox`.
+    `key` identifies the queryset and request for the cache.
+    """
+    cache_key = f"{CACHE_PREFIX}{hashlib.md5(key.encode()).hexdigest()}:{versions([GLOBAL])[0]}"
+    if (collection := cache.get(cache_key)) is None:
+        zoom = effective_zoom(bbox, zoom)
+        collection = {
+            "type": "FeatureCollection",
+            "features": features(queryset, bbox) if zoom >= FEATURE_ZOOM else clusters(queryset, bbox, zoom),
+        }
+        cache.set(cache_key, collection, PAGE_TIMEOUT)
+    return collection
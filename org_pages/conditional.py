@@ -0,0 +1,136 @@
+"""
+Conditional GET support (ETag / Last-Modified) for the directory pages and API.
+
+Responses that can include any organization (lists, maps, search) are versioned by the page
+cache versions of `org_pages.cache`, so validating them costs one cache round trip instead of a
+query over the whole table. Those versions only say that something changed, not when, so these
+responses have no Last-Modified (a deletion, for one, would never move it forward).
+
+Responses built from a handful of rows (detail pages) are versioned by the latest `updated_at`
+and the number of those rows, both read with one aggregate query. The org_pages signal handlers
+bump `updated_at` when tags, organizers, locations or focus names change, so the validators
+cover everything a page shows.
+
+A matching `If-None-Match` or `If-Modified-Since` is answered with a 304 before any
+serialization or template work is done. In DRF views that happens after authentication,
+permissions and throttling, so conditional requests are rate limited like any other and the
+ETag varies on the token's user.
+"""
+
+import hashlib
+from datetime import datetime
+from typing import Any, Iterable, Optional
+
+from django.db.models import Count, Max, QuerySet
+from django.http import HttpRequest, HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .cache import GLOBAL, versions
+
+
+def touch(queryset: QuerySet) -> int:
+    """Mark every row in `queryset` as modified now. Doesn't send any signals."""
+    return queryset.update(updated_at=timezone.now())
+
+
+def validators(queryset: QuerySet, *parts: Any) -> tuple[Optional[str], Optional[datetime]]:
+    """
+    A strong ETag and the Last-Modified time for a response built from `queryset`.
+    `parts` (the path, the user, ...) are hashed into the ETag. Returns (None, None) for an empty queryset.
+    """
+    stats = queryset.order_by().aggregate(last_modified=Max("updated_at"), count=Count("pk", distinct=True))
+    if stats["last_modified"] is None:
+        return None, None
+    digest = hashlib.md5(
+        ":".join(str(part) for part in (*parts, stats["last_modified"].isoformat(), stats["count"])).encode()
+    ).hexdigest()
+    return f'"{digest}"', stats["last_modified"]
+
+
+def version_validators(scopes: Iterable[str], *parts: Any) -> tuple[str, None]:
+    """A strong ETag for a response depending on the page cache `scopes`, and no Last-Modified."""
+    digest = hashlib.md5(":".join(str(part) for part in (*parts, *versions(scopes))).encode()).hexdigest()
+    return f'"{digest}"', None
+
+
+def set_validators(response: HttpResponse, etag: Optional[str], last_modified: Optional[datetime]) -> HttpResponse:
+    if etag and response.status_code == 200:
+        response.headers.setdefault("ETag", etag)
+        if last_modified:
+            response.headers.setdefault("Last-Modified", http_date(last_modified.timestamp()))
+    return response
+
+
+class NotModified(Exception):
+    """Ends a DRF view's request with `response` once its checks have run."""
+
+    def __init__(self, response: HttpResponse) -> None:
+        super().__init__()
+        self.response = response
+
+
+class ConditionalGetMixin:
+    """
+    View mixin answering conditional GETs from the versions of `get_validator_scopes` or, if
+    there are none, the rows of `get_validator_queryset`. Works with Django and DRF views.
+    """
+    _validators: Optional[tuple[Optional[str], Optional[datetime]]] = None
+
+    def get_validator_scopes(self) -> Optional[list[str]]:
+        """The page cache scopes the response depends on. Defaults to the whole directory."""
+        return [GLOBAL]
+
+    def get_validator_queryset(self) -> Optional[QuerySet]:
+        """
+        The rows whose changes change the response, None if the response sets its own validators.
+        Defaults to every row of the view's model.
+        """
+        return self.model._default_manager.all()
+
+    def get_etag_parts(self, request: HttpRequest) -> Iterable[Any]:
+        """Everything besides the rows that the response varies on."""
+        user = getattr(request, "user", None)
+        return (
+            request.get_full_path(),
+            request.META.get("HTTP_ACCEPT", ""),
+            user.pk if user and user.is_authenticated else "anonymous",
+        )
+
+    def not_modified(self, request: HttpRequest) -> Optional[HttpResponse]:
+        """The 304 answering `request`, if any. Keeps the validators for the full response."""
+        if scopes := self.get_validator_scopes():
+            etag, last_modified = version_validators(scopes, *self.get_etag_parts(request))
+        elif (queryset := self.get_validator_queryset()) is not None:
+            etag, last_modified = validators(queryset, *self.get_etag_parts(request))
+        else:
+            return None
+        self._validators = etag, last_modified
+        if etag:
+            return get_conditional_response(
+                request, etag=etag, last_modified=int(last_modified.timestamp()) if last_modified else None,
+            )
+        return None
+
+    def dispatch(self, request: HttpRequest, *args, **kwargs) -> HttpResponse:
+        if request.method not in ("GET", "HEAD"):
+            return super().dispatch(request, *args, **kwargs)
+
+        # DRF views check in `initial`, after authentication and throttling.
+        if not hasattr(super(), "initial"):
+            self.request, self.args, self.kwargs = request, args, kwargs
+            if response := self.not_modified(request):
+                return response
+        response = super().dispatch(request, *args, **kwargs)
+        return set_validators(response, *self._validators) if self._validators else response
+
+    def initial(self, request, *args, **kwargs) -> None:
+        super().initial(request, *args, **kwargs)
+        if request.method in ("GET", "HEAD") and (response := self.not_modified(request)):
+            raise NotModified(response)
+
+    def handle_exception(self, exc: Exception) -> HttpResponse:
+        if isinstance(exc, NotModified):
+            return exc.response
+        return super().handle_exception(exc)
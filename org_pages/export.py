@@ -0,0 +1,181 @@
+"""
+Bulk export of the directory as NDJSON or CSV.
+
+Organizations are read in primary key order through a server side cursor, `CHUNK_SIZE` rows
+at a time, with their tags, location and parent flattened into each row by the same query, so
+an export holds one chunk in memory whatever the size of the directory. Records use the keys
+of the legacy JSON dump (`name`, `url`, `diversity`, `technology`, `parent_organization`).
+
+`write_snapshot` stores a gzipped export under a name derived from the SHA-256 of its content
+and records it in a manifest, so large consumers download one pre-generated file instead of
+paging through the API. It is run periodically by the `export_directory` command.
+"""
+
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import tempfile
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+from django.contrib.postgres.expressions import ArraySubquery
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import F, OuterRef, QuerySet
+from django.utils import timezone
+
+from .models import DiversityFocus, Organization, TechnologyFocus
+
+CHUNK_SIZE = 2000
+SNAPSHOT_DIR = "exports"
+MANIFEST = f"{SNAPSHOT_DIR}/manifest.json"
+MANIFEST_CACHE_KEY = "directory:export:manifest"
+MANIFEST_TIMEOUT = 5 * 60
+# A CSV cell holds a list as its values joined by this separator.
+LIST_SEPARATOR = "|"
+
+FIELDS = (
+    "id", "name", "slug", "url", "org_type", "description", "code_of_conduct", "job_board", "events_link",
+    "social_links", "paid", "active", "online_only", "is_featured",
+)
+RELATED = {
+    "diversity_names": ArraySubquery(
+        DiversityFocus.objects.filter(parent_org_diversity=OuterRef("pk")).order_by("name").values("name")
+    ),
+    "technology_names": ArraySubquery(
+        TechnologyFocus.objects.filter(parent_org_technology=OuterRef("pk")).order_by("name").values("name")
+    ),
+    "location_name": F("location__name"),
+    "location_region": F("location__region"),
+    "location_country": F("location__country"),
+    "latitude": F("location__latitude"),
+    "longitude": F("location__longitude"),
+    "parent_organization": F("parent__name"),
+    "parent_slug": F("parent__slug"),
+}
+# Export column: the value selected for it. The tag names can't be annotated under the m2m field names.
+COLUMNS = {
+    **{field: field for field in FIELDS},
+    **{name.removesuffix("_names"): name for name in RELATED},
+}
+
+
+def _jsonable(value: Any) -> Any:
+    # Decimal coordinates.
+    return float(value) if value is not None and not isinstance(value, (str, bool, int, list)) else value
+
+
+def records(queryset: Optional[QuerySet] = None, chunk_size: int = CHUNK_SIZE) -> Iterator[dict]:
+    """The flattened organizations of `queryset`, read in chunks through a server side cursor."""
+    queryset = Organization.objects.all() if queryset is None else queryset
+    rows = queryset.order_by("pk").values(*FIELDS, **RELATED)
+    for row in rows.iterator(chunk_size=chunk_size):
+        yield {column: _jsonable(row[name]) for column, name in COLUMNS.items()}
+
+
+def ndjson(rows: Iterable[dict]) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps(row, separators=(",", ":")) + "\n"
+
+
+def csv_lines(rows: Iterable[dict]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(COLUMNS))
+    writer.writeheader()
+    for row in rows:
+        writer.writerow({
+            key: LIST_SEPARATOR.join(value) if isinstance(value, list) else value for key, value in row.items()
+        })
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # An empty export is still a header line.
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+FORMATS: dict[str, tuple[Callable[[Iterable[dict]], Iterator[str]], str]] = {
+    "ndjson": (ndjson, "application/x-ndjson"),
+    "csv": (csv_lines, "text/csv"),
+}
+
+
+def stream(format: str, rows: Optional[Iterable[dict]] = None) -> Iterator[bytes]:
+    """The export of `rows` (every organization by default) in `format`, one chunk of rows per yielded bytes."""
+    serialize, _ = FORMATS[format]
+    batch = []
+    for line in serialize(records() if rows is None else rows):
+        batch.append(line)
+        if len(batch) == CHUNK_SIZE:
+            yield "".join(batch).encode()
+            batch = []
+    if batch:
+        yield "".join(batch).encode()
+
+
+def manifest() -> dict:
+    """The latest snapshot of each format: name, sha256, size, organizations and generation time."""
+    if (found := cache.get(MANIFEST_CACHE_KEY)) is None:
+        found = {}
+        if default_storage.exists(MANIFEST):
+            with default_storage.open(MANIFEST) as f:
+                found = json.load(f)
+        cache.set(MANIFEST_CACHE_KEY, found, MANIFEST_TIMEOUT)
+    return found
+
+
+def _replace(name: str, content: bytes) -> None:
+    """Swap `content` in as the file `name`, so a concurrent reader sees the old or the new file, never none."""
+    if getattr(default_storage, "overwrite_files", False):
+        # Blob storages replace the blob with a single upload.
+        default_storage.save(name, ContentFile(content))
+        return
+    # Local storages: write a temporary file next to `name` and rename it over the old one.
+    path = default_storage.path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as f:
+        f.write(content)
+    if (mode := getattr(default_storage, "file_permissions_mode", None)) is not None:
+        os.chmod(f.name, mode)
+    os.replace(f.name, path)
+
+
+def write_snapshot(format: str) -> dict:
+    """Store a gzipped export in `format` unless an identical one exists, and record it in the manifest."""
+    digest, count = hashlib.sha256(), 0
+
+    def counted(rows: Iterable[dict]) -> Iterator[dict]:
+        nonlocal count
+        for count, row in enumerate(rows, 1):
+            yield row
+
+    with tempfile.TemporaryFile() as compressed:
+        # A fixed mtime keeps the compressed bytes identical for identical content.
+        with gzip.GzipFile(fileobj=compressed, mode="wb", mtime=0) as out:
+            for chunk in stream(format, counted(records())):
+                digest.update(chunk)
+                out.write(chunk)
+        size = compressed.tell()
+
+        sha256 = digest.hexdigest()
+        name = f"{SNAPSHOT_DIR}/directory-{sha256[:16]}.{format}.gz"
+        if not default_storage.exists(name):
+            compressed.seek(0)
+            name = default_storage.save(name, File(compressed))
+
+    entry = {
+        "name": name,
+        "url": default_storage.url(name),
+        "sha256": sha256,
+        "size": size,
+        "organizations": count,
+        "generated_at": timezone.now().isoformat(),
+    }
+    current = {**manifest(), format: entry}
+    _replace(MANIFEST, json.dumps(current, indent=2).encode())
+    cache.set(MANIFEST_CACHE_KEY, current, MANIFEST_TIMEOUT)
+    return entry
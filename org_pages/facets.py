@@ -0,0 +1,147 @@
+"""
+Faceted filtering for the organization list.
+
+Every facet accepts several values (`?diversity=Women&diversity=LGBTQIA%2B`). Values within a facet
+are combined with OR, or with AND for the tag facets when `<facet>_match=all` is passed, and the
+facets themselves are combined with AND. Facet counts for the whole sidebar come from one UNION ALL
+query where each facet is counted against the results filtered by every *other* facet, so selecting
+a value doesn't hide the alternatives in the same facet.
+"""
+
+from functools import reduce
+from operator import or_
+from typing import Any, Optional
+
+from django.db.models import CharField, Count, Q, QuerySet, TextField, Value
+from django.db.models.functions import Cast
+from django.http import QueryDict
+
+from .taxonomy import tagged
+
+# The value each facet is counted by. Tags count through the closure, like `tagged` filters:
+# an organization tagged with a focus counts for it and for every focus above it.
+FACETS = {
+    "diversity": "diversity__ancestor_links__ancestor__name",
+    "technology": "technology__ancestor_links__ancestor__name",
+    "country": "location__country",
+    "region": "location__region",
+    "city": "location__name",
+    "org_type": "org_type",
+    "active": "active",
+    "online_only": "online_only",
+    "paid": "paid",
+}
+TAG_FACETS = ("diversity", "technology")
+LOCATION_FACETS = ("country", "region", "city")
+BOOLEAN_FACETS = ("active", "online_only", "paid")
+TRUE_VALUES = ("true", "1", "yes", "on")
+FALSE_VALUES = ("false", "0", "no", "off")
+
+
+def parse_boolean(value: str) -> Optional[bool]:
+    if value.lower() in TRUE_VALUES:
+        return True
+    if value.lower() in FALSE_VALUES:
+        return False
+    return None
+
+
+def selected_facets(params: Any) -> dict[str, list]:
+    """The non-empty values selected for each facet in a QueryDict (or plain dict) of parameters."""
+    selected = {}
+    for facet in FACETS:
+        values = params.getlist(facet) if hasattr(params, "getlist") else [params.get(facet)]
+        values = [value.strip() for value in values if value and value.strip()]
+        if facet in BOOLEAN_FACETS:
+            values = list({parsed for value in values if (parsed := parse_boolean(value)) is not None})
+        if values:
+            selected[facet] = values
+    return selected
+
+
+def match_modes(params: Any) -> dict[str, str]:
+    """`all` or `any` for each tag facet. Defaults to `any`."""
+    return {facet: "all" if params.get(f"{facet}_match") == "all" else "any" for facet in TAG_FACETS}
+
+
+def is_selected(selected: dict[str, list], facet: str, value: Any) -> bool:
+    return str(value).lower() in {str(x).lower() for x in selected.get(facet, [])}
+
+
+def toggle_url(params: QueryDict, facet: str, value: Any) -> str:
+    """The query string for `params` with `value` added to or removed from `facet`."""
+    query = params.copy()
+    # A new result set starts from its first page.
+    for key in ("page", "after", "before"):
+        query.pop(key, None)
+    values = [x for x in query.getlist(facet) if x.lower() != str(value).lower()]
+    if len(values) == len(query.getlist(facet)):
+        values.append(str(value))
+    query.setlist(facet, values)
+    return f"?{query.urlencode()}"
+
+
+def facet_filters(facet: str, values: list, match: str = "any") -> list[Q]:
+    """
+    Filters for one facet. Each filter must be applied in its own `filter()` call so that AND
+    across a multi-valued relation joins the relation once per value.
+    """
+    if facet in TAG_FACETS:
+        filters = [tagged(facet, value) for value in values]
+        return filters if match == "all" else [reduce(or_, filters)]
+
+    if facet in BOOLEAN_FACETS:
+        # Selecting both True and False doesn't filter anything.
+        return [Q(**{facet: values[0]})] if len(values) == 1 else []
+
+    if facet in LOCATION_FACETS:
+        return [reduce(or_, (Q(**{f"{FACETS[facet]}__iexact": value}) for value in values))]
+
+    return [Q(**{f"{FACETS[facet]}__in": values})]
+
+
+def filter_organizations(
+    queryset: QuerySet, selected: dict[str, list], match: dict[str, str], exclude: Optional[str] = None,
+) -> QuerySet:
+    """Apply every selected facet except `exclude` to `queryset`."""
+    for facet, values in selected.items():
+        if facet == exclude:
+            continue
+        for query in facet_filters(facet, values, match.get(facet, "any")):
+            queryset = queryset.filter(query)
+
+    if any(facet in selected and facet != exclude for facet in TAG_FACETS):
+        queryset = queryset.distinct()
+    return queryset
+
+
+def facet_counts(
+    queryset: QuerySet, selected: dict[str, list], match: dict[str, str], limit: int = 25,
+) -> dict[str, list[dict]]:
+    """
+    The `limit` most common values of every facet with the number of matching organizations.
+    All facets are counted in a single UNION ALL query.
+    """
+    branches = []
+    for facet, path in FACETS.items():
+        branches.append(
+            filter_organizations(queryset, selected, match, exclude=facet)
+            .order_by()
+            .filter(**{f"{path}__isnull": False})
+            .values(value=Cast(path, TextField()))
+            .annotate(facet=Value(facet, output_field=CharField()), count=Count("pk", distinct=True))
+            .order_by("-count", "value")[:limit]
+        )
+
+    counts = {facet: [] for facet in FACETS}
+    for row in branches[0].union(*branches[1:], all=True):
+        value = parse_boolean(row["value"]) if row["facet"] in BOOLEAN_FACETS else row["value"]
+        if value == "":
+            continue
+        counts[row["facet"]].append(
+            {"value": value, "count": row["count"], "selected": is_selected(selected, row["facet"], value)}
+        )
+
+    for facet in counts:
+        counts[facet].sort(key=lambda item: (-item["count"], str(item["value"])))
+    return counts
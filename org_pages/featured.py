@@ -0,0 +1,31 @@
+"""
+The featured organizations shown on the home page.
+
+Featured organizations are grouped under their parents, and the parents are resolved with a
+single query and kept in the cache. The org_pages signal handlers invalidate the cached list
+whenever an organization's `FEATURED_FIELDS` change (once the change is committed), so the home
+page normally doesn't query the directory at all.
+"""
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .cache import PAGE_TIMEOUT
+from .models import Organization
+
+CACHE_KEY = "featured_parents"
+FEATURED_FIELDS = ("is_featured", "parent_id", "logo", "name", "slug")
+
+
+def featured_parents() -> list[Organization]:
+    """The parents of every featured organization with the fields the home page shows."""
+    parents = cache.get(CACHE_KEY)
+    if parents is None:
+        featured = Organization.objects.filter(is_featured=True, parent__isnull=False).values("parent_id")
+        parents = list(Organization.objects.filter(pk__in=featured).only("name", "slug", "logo").order_by("name"))
+        cache.set(CACHE_KEY, parents, PAGE_TIMEOUT)
+    return parents
+
+
+def invalidate() -> None:
+    transaction.on_commit(lambda: cache.delete(CACHE_KEY))
@@ -0,0 +1,122 @@
+"""
+Geohashes and radius searches over `Location` coordinates.
+
+Every location stores the geohash of its coordinates in an indexed column. A radius search
+covers the bounding box of the circle with a handful of geohash cells, so the candidates are
+read through the index with `LIKE 'prefix%'` lookups, and only those candidates get an exact
+haversine distance, computed in the database.
+"""
+
+import math
+from functools import reduce
+from operator import or_
+from typing import Iterable
+
+from django.db.models import F, FloatField, Q, QuerySet
+from django.db.models.expressions import CombinedExpression
+from django.db.models.functions import ASin, Cos, Least, Power, Radians, Sin, Sqrt
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+PRECISION = 12
+EARTH_RADIUS_KM = 6371.0088
+MAX_CELLS = 16
+
+
+def encode(latitude: float, longitude: float, precision: int = PRECISION) -> str:
+    """The geohash of a point."""
+    bounds = [[-90.0, 90.0], [-180.0, 180.0]]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        # Bits alternate between longitude (first) and latitude.
+        interval, coordinate = (bounds[1], longitude) if even else (bounds[0], latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even, bits = not even, bits + 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def cell_size(precision: int) -> tuple[float, float]:
+    """The (height, width) of a geohash cell in degrees."""
+    bits = 5 * precision
+    return 180 / 2 ** (bits // 2), 360 / 2 ** math.ceil(bits / 2)
+
+
+def bounding_box(latitude: float, longitude: float, radius_km: float) -> tuple[float, float, float, float]:
+    """(south, west, north, east) of the circle, clamped to the poles and wrapping the antimeridian."""
+    delta_latitude = math.degrees(radius_km / EARTH_RADIUS_KM)
+    south, north = max(latitude - delta_latitude, -90.0), min(latitude + delta_latitude, 90.0)
+    if south == -90 or north == 90:
+        return south, -180.0, north, 180.0
+
+    delta_longitude = math.degrees(radius_km / EARTH_RADIUS_KM / math.cos(math.radians(latitude)))
+    if delta_longitude >= 180:
+        return south, -180.0, north, 180.0
+    wrap = lambda x: (x + 540) % 360 - 180  # noqa: E731
+    return south, wrap(longitude - delta_longitude), north, wrap(longitude + delta_longitude)
+
+
+def covering_prefixes(south: float, west: float, north: float, east: float) -> set[str]:
+    """
+    The geohash cells covering a bounding box, at the finest precision needing at most `MAX_CELLS` cells.
+    An empty set means the whole world.
+    """
+    width = (east - west) % 360 or (360 if west == -180 and east == 180 else 0)
+    for precision in range(PRECISION, 0, -1):
+        height_step, width_step = cell_size(precision)
+        rows, columns = math.ceil((north - south) / height_step) + 1, math.ceil(width / width_step) + 1
+        if rows * columns <= MAX_CELLS:
+            break
+    else:
+        return set()
+
+    # Samples a cell apart (and the far edges) hit every cell the box touches.
+    latitudes = [min(south + row * height_step, north) for row in range(rows)]
+    longitudes = [(west + min(column * width_step, width) + 180) % 360 - 180 for column in range(columns)]
+    return {encode(lat, lon, precision) for lat in latitudes for lon in longitudes}
+
+
+def prefix_filter(prefixes: Iterable[str], field: str = "geohash") -> Q:
+    """Match geohashes starting with any of `prefixes`, or everything if there are none."""
+    prefixes = list(prefixes)
+    return reduce(or_, (Q(**{f"{field}__startswith": prefix}) for prefix in prefixes)) if prefixes else Q()
+
+
+def haversine(latitude: float, longitude: float, prefix: str = "") -> CombinedExpression:
+    """The great circle distance in km between the point and the coordinates of each row."""
+    row_latitude = Radians(F(f"{prefix}latitude"), output_field=FloatField())
+    row_longitude = Radians(F(f"{prefix}longitude"), output_field=FloatField())
+    latitude, longitude = math.radians(latitude), math.radians(longitude)
+    a = (
+        Power(Sin((row_latitude - latitude) / 2), 2)
+        + math.cos(latitude) * Cos(row_latitude) * Power(Sin((row_longitude - longitude) / 2), 2)
+    )
+    # Rounding can push `a` just over 1 for antipodal points.
+    return 2 * EARTH_RADIUS_KM * ASin(Least(Sqrt(a), 1.0), output_field=FloatField())
+
+
+def within(queryset: QuerySet, latitude: float, longitude: float, radius_km: float, prefix: str = "") -> QuerySet:
+    """
+    The rows of `queryset` within `radius_km` of the point, annotated with their `distance_km` and
+    sorted by it. `prefix` is the path to the location, e.g. "location__".
+    """
+    south, west, north, east = bounding_box(latitude, longitude, radius_km)
+    longitude_filter = (
+        Q(**{f"{prefix}longitude__gte": west, f"{prefix}longitude__lte": east})
+        if west <= east
+        else Q(**{f"{prefix}longitude__gte": west}) | Q(**{f"{prefix}longitude__lte": east})
+    )
+    return (
+        queryset.filter(prefix_filter(covering_prefixes(south, west, north, east), f"{prefix}geohash"))
+        .filter(longitude_filter, **{f"{prefix}latitude__gte": south, f"{prefix}latitude__lte": north})
+        .annotate(distance_km=haversine(latitude, longitude, prefix))
+        .filter(distance_km__lte=radius_km)
+        .order_by("distance_km")
+    )
@@ -0,0 +1,152 @@
+"""
+Precomputed GeoJSON snapshots for the map API.
+
+The maps on the home page (featured organizations), parent organization pages (children) and
+the full directory map read a FeatureCollection of every matching organization. Each of these
+scopes is built from a single `values()` query, serialized once, compressed once with gzip (and
+brotli when it is installed) and cached under the current global directory version. Changes to
+organizations or locations bump that version (see `cache.py`), so the next request regenerates
+the snapshot. Snapshots are streamed in the encoding the client accepts, with a strong ETag.
+"""
+
+import gzip
+import hashlib
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, Optional
+
+from django.core.cache import cache
+from django.db.models import QuerySet
+from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+
+from .cache import GLOBAL, PAGE_TIMEOUT, versions
+from .models import Organization
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CACHE_PREFIX = "directory:geojson:"
+CHUNK_SIZE = 64 * 1024
+ALL = "all"
+FEATURED = "featured"
+_ZERO_QUALITY = re.compile(r";\s*q=0(?:\.0*)?\s*$")
+
+
+def parent_scope(pk: int) -> str:
+    return f"parent:{pk}"
+
+
+def scope(params: dict[str, str]) -> Optional[str]:
+    """The snapshot scope of the map query `params`, or None if they don't match a snapshot."""
+    params = {key: value for key, value in params.items() if key != "format"}
+    if not params:
+        return ALL
+    if params.keys() == {"is_featured"} and params["is_featured"].lower() == "true":
+        return FEATURED
+    if params.keys() == {"parent"} and params["parent"].isdigit():
+        return parent_scope(int(params["parent"]))
+    return None
+
+
+def organizations(scope: str) -> QuerySet:
+    if scope == FEATURED:
+        return Organization.objects.filter(is_featured=True)
+    if scope.startswith("parent:"):
+        return Organization.objects.filter(parent_id=int(scope.partition(":")[2]))
+    return Organization.objects.all()
+
+
+def point(longitude: Any, latitude: Any, properties: dict) -> dict:
+    return {
+        "type": "Feature",
+        "properties": properties,
+        "geometry": {"type": "Point", "coordinates": [float(longitude), float(latitude)]},
+    }
+
+
+def url_template() -> Callable[[str], str]:
+    """The detail URL of a slug. Slugs are URL safe, so the URL is reversed once and filled in."""
+    url = reverse("org_detail", kwargs={"slug": "__slug__"})
+    return lambda slug: url.replace("__slug__", slug)
+
+
+def with_coordinates(queryset: QuerySet) -> QuerySet:
+    return queryset.filter(location__latitude__isnull=False, location__longitude__isnull=False)
+
+
+def feature_collection(queryset: QuerySet) -> dict:
+    """A FeatureCollection of the organizations in `queryset` with coordinates, read with one query."""
+    url = url_template()
+    rows = with_coordinates(queryset).values_list("name", "slug", "location__longitude", "location__latitude")
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            point(longitude, latitude, {"url": url(slug), "name": name}) for name, slug, longitude, latitude in rows
+        ],
+    }
+
+
+@dataclass
+class Snapshot:
+    """A serialized FeatureCollection and its compressed encodings."""
+    body: bytes
+    digest: str
+    encodings: dict[str, bytes] = field(default_factory=dict)
+
+    @classmethod
+    def build(cls, collection: dict) -> "Snapshot":
+        body = json.dumps(collection, separators=(",", ":")).encode()
+        encodings = {"gzip": gzip.compress(body, compresslevel=9)}
+        if brotli:
+            encodings["br"] = brotli.compress(body, quality=11)
+        return cls(body, hashlib.md5(body).hexdigest(), encodings)
+
+    def encoding_for(self, request: HttpRequest) -> Optional[str]:
+        """The best encoding accepted by the client, None for identity."""
+        accepted = {
+            coding.split(";")[0].strip().lower()
+            for coding in request.META.get("HTTP_ACCEPT_ENCODING", "").split(",")
+            if not _ZERO_QUALITY.search(coding)
+        }
+        return next((encoding for encoding in ("br", "gzip") if encoding in accepted & self.encodings.keys()), None)
+
+
+def snapshot(scope: str) -> Snapshot:
+    """The snapshot of `scope` for the current directory version, built on a miss."""
+    key = f"{CACHE_PREFIX}{scope}:{versions([GLOBAL])[0]}"
+    if (found := cache.get(key)) is None:
+        found = Snapshot.build(feature_collection(organizations(scope)))
+        cache.set(key, found, PAGE_TIMEOUT)
+    return found
+
+
+def _chunks(content: bytes) -> Iterator[bytes]:
+    view = memoryview(content)
+    for start in range(0, len(content), CHUNK_SIZE):
+        yield bytes(view[start:start + CHUNK_SIZE])
+
+
+def response(request: HttpRequest, scope: str) -> HttpResponse:
+    """Stream the snapshot of `scope`, or answer a conditional GET with a 304."""
+    found = snapshot(scope)
+    encoding = found.encoding_for(request)
+    # Each encoding is a different representation, so it gets its own strong ETag.
+    etag = f'"{found.digest}-{encoding}"' if encoding else f'"{found.digest}"'
+
+    if (not_modified := get_conditional_response(request, etag=etag)) is not None:
+        patch_vary_headers(not_modified, ("Accept-Encoding",))
+        return not_modified
+
+    content = found.encodings[encoding] if encoding else found.body
+    streamed = StreamingHttpResponse(_chunks(content), content_type="application/json")
+    streamed["Content-Length"] = len(content)
+    streamed["ETag"] = etag
+    if encoding:
+        streamed["Content-Encoding"] = encoding
+    patch_vary_headers(streamed, ("Accept-Encoding",))
+    return streamed
@@ -0,0 +1,80 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from api import bench as api_bench
+from org_pages import bench
+from org_pages.bench import DirectoryConfig, benchmark, seed
+
+DEFAULTS = DirectoryConfig()
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic directory in a throwaway test database and time every org_pages and api route. "
+        "Prints p50/p95/p99 latency, query counts and peak memory per route as JSON."
+    )
+
+    def add_arguments(self, parser):
+        for option, help_text in (
+            ("organizations", "Number of organizations"),
+            ("locations", "Number of locations"),
+            ("focuses", "Number of diversity and of technology focuses"),
+            ("depth", "Number of layers in the focus DAGs"),
+            ("parents", "Number of parent organizations"),
+            ("chapters", "Number of chapters of each parent organization"),
+            ("organizers", "Number of organizer users"),
+            ("seed", "Random seed"),
+        ):
+            default = getattr(DEFAULTS, option)
+            parser.add_argument(f"--{option}", type=int, default=default, help=f"{help_text} (default {default}).")
+        parser.add_argument(
+            "-n", "--iterations", type=int, default=20, help="Requests per route (default 20).",
+        )
+        parser.add_argument(
+            "--warm", action="store_true", help="Keep the cache between requests instead of clearing it.",
+        )
+        parser.add_argument(
+            "--route", action="append", dest="routes",
+            help="Only time this URL name (api routes are prefixed with 'api:'). Can be repeated.",
+        )
+        parser.add_argument(
+            "--serialization", type=int, metavar="N", default=0,
+            help="Also compare the serializers with their field plans and the renderers on N organizations.",
+        )
+        parser.add_argument("-o", "--output", help="Write the JSON report to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        config = DirectoryConfig(**{field: options[field] for field in DirectoryConfig.__dataclass_fields__})
+        old_name = connection.settings_dict["NAME"]
+        setup_test_environment()
+        connection.creation.create_test_db(verbosity=options["verbosity"], autoclobber=True, serialize=False)
+        try:
+            self.stderr.write("Seeding the directory...")
+            counts = seed(config)
+            self.stderr.write("Timing routes...")
+            routes = benchmark(
+                (bench.SITE, api_bench.SITE), options["iterations"], warm=options["warm"], only=options["routes"],
+            )
+            if options["serialization"]:
+                self.stderr.write("Timing serialization...")
+                serialized = api_bench.serialization(options["serialization"], options["iterations"])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=options["verbosity"])
+            teardown_test_environment()
+
+        report = {
+            "config": config.__dict__, "rows": counts, "iterations": options["iterations"],
+            "warm": options["warm"], "routes": routes,
+        }
+        if options["serialization"]:
+            report["serialization"] = serialized
+        report = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(report + "\n")
+            self.stdout.write(self.style.SUCCESS(f"Timed {len(routes)} routes, report written to {options['output']}."))
+        else:
+            self.stdout.write(report)
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from org_pages.export import FORMATS, write_snapshot
+
+
+class Command(BaseCommand):
+    help = "Write gzipped NDJSON/CSV snapshots of the directory to the default storage. Run it periodically."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-f", "--format", dest="formats", action="append", choices=sorted(FORMATS),
+            help="Snapshot format, may be repeated (default: every format).",
+        )
+
+    def handle(self, *args, **options):
+        for format in options["formats"] or FORMATS:
+            entry = write_snapshot(format)
+            self.stdout.write(self.style.SUCCESS(
+                f"{format}: {entry['organizations']} organizations, {entry['size']} bytes, "
+                f"sha256 {entry['sha256']} -> {entry['name']}"
+            ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from org_pages.similarity import TOP_K, refresh_all
+
+
+class Command(BaseCommand):
+    help = "Recompute the precomputed similar organizations shown on organization detail pages."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-k", "--top", type=int, default=TOP_K,
+            help=f"Number of similar organizations to store for each organization (default {TOP_K}).",
+        )
+
+    def handle(self, *args, **options):
+        rows = refresh_all(k=options["top"])
+        self.stdout.write(self.style.SUCCESS(f"Stored {rows} similar organization rows."))
@@ -0,0 +1,46 @@
+# Generated by Django 4.0.4 on 2026-10-17 03:10
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+# The document built by org_pages.search.search_document, as it was when the field was added.
+# Plain SQL so later changes to the models or the search module don't change this migration.
+POPULATE_SEARCH_DOCUMENTS = """
+UPDATE org_pages_organization o SET search_document =
+    setweight(to_tsvector('english', coalesce(o.name, '')), 'A')
+    || setweight(to_tsvector('english', coalesce((
+        SELECT string_agg(concat(f.name, ' ', array_to_string(f.other_names, ' ')), ' ')
+        FROM org_pages_organization_diversity t JOIN org_pages_diversityfocus f ON f.id = t.diversityfocus_id
+        WHERE t.organization_id = o.id
+    ), '')), 'B')
+    || setweight(to_tsvector('english', coalesce((
+        SELECT string_agg(concat(f.name, ' ', array_to_string(f.other_names, ' ')), ' ')
+        FROM org_pages_organization_technology t JOIN org_pages_technologyfocus f ON f.id = t.technologyfocus_id
+        WHERE t.organization_id = o.id
+    ), '')), 'B')
+    || setweight(to_tsvector('english', coalesce((
+        SELECT concat(l.name, ' ', l.region, ' ', l.country) FROM org_pages_location l WHERE l.id = o.location_id
+    ), '')), 'C')
+    || setweight(to_tsvector('english', coalesce(o.description, '')), 'D')
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('org_pages', '0022_alter_technologyfocus_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='organization',
+            name='search_document',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, help_text='Weighted full text search document. Maintained by the org_pages signals.', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='organization',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_document'], name='org_search_document_gin'),
+        ),
+        migrations.RunSQL(POPULATE_SEARCH_DOCUMENTS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.0.4 on 2026-10-17 03:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('org_pages', '0024_trigram_name_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarOrganization',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(help_text='Weighted overlap of focuses, location and org type.')),
+                ('organization', models.ForeignKey(help_text='Organization the similar organization is recommended for.', on_delete=django.db.models.deletion.CASCADE, related_name='similarities', to='org_pages.organization')),
+                ('similar', models.ForeignKey(help_text='The recommended organization.', on_delete=django.db.models.deletion.CASCADE, related_name='similar_to', to='org_pages.organization')),
+            ],
+            options={
+                'ordering': ('organization', '-score'),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='similarorganization',
+            index=models.Index(fields=['organization', '-score'], name='similar_org_score_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='similarorganization',
+            constraint=models.UniqueConstraint(fields=('organization', 'similar'), name='unique_similar_organization'),
+        ),
+    ]
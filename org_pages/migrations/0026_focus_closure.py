@@ -0,0 +1,70 @@
+# Generated by Django 4.0.4 on 2026-10-17 03:04
+
+from collections import defaultdict, deque
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_closures(apps, schema_editor):
+    """Every focus with itself (depth 0) and each of its ancestors at their shortest depth."""
+    for focus, closure in (
+        ("DiversityFocus", "DiversityFocusClosure"),
+        ("TechnologyFocus", "TechnologyFocusClosure"),
+    ):
+        focus_model, closure_model = apps.get_model("org_pages", focus), apps.get_model("org_pages", closure)
+        name = focus_model._meta.model_name
+        parents = defaultdict(set)
+        for child, parent in focus_model.parents.through.objects.values_list(f"from_{name}_id", f"to_{name}_id"):
+            parents[child].add(parent)
+
+        rows = []
+        for node in focus_model.objects.values_list("pk", flat=True):
+            depths, queue = {node: 0}, deque([node])
+            while queue:
+                current = queue.popleft()
+                for parent in parents[current] - depths.keys():
+                    depths[parent] = depths[current] + 1
+                    queue.append(parent)
+            rows.extend(
+                closure_model(ancestor_id=ancestor, descendant_id=node, depth=depth)
+                for ancestor, depth in depths.items()
+            )
+        closure_model.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('org_pages', '0025_similarorganization'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TechnologyFocusClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveSmallIntegerField(help_text='Shortest number of parent links from the descendant.')),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='org_pages.technologyfocus')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='org_pages.technologyfocus')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DiversityFocusClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveSmallIntegerField(help_text='Shortest number of parent links from the descendant.')),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='org_pages.diversityfocus')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='org_pages.diversityfocus')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='technologyfocusclosure',
+            constraint=models.UniqueConstraint(fields=('ancestor', 'descendant'), name='unique_technology_focus_closure'),
+        ),
+        migrations.AddConstraint(
+            model_name='diversityfocusclosure',
+            constraint=models.UniqueConstraint(fields=('ancestor', 'descendant'), name='unique_diversity_focus_closure'),
+        ),
+        migrations.RunPython(populate_closures, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.0.4 on 2026-10-17 05:10
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('org_pages', '0026_focus_closure'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='diversityfocus',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='organization',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, help_text='Last change to the organization, its tags or organizers. Used for conditional requests.'),
+        ),
+        migrations.AddField(
+            model_name='technologyfocus',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
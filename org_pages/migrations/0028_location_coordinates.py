@@ -0,0 +1,17 @@
+# Generated by Django 4.0.4 on 2026-10-17 09:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('org_pages', '0027_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['latitude', 'longitude'], name='location_coordinates'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.0.4 on 2026-10-17 11:05
+
+from django.db import migrations, models
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def encode(latitude, longitude, precision=12):
+    """The geohash of a point, as org_pages.geo.encode computed it when the field was added."""
+    bounds = [[-90.0, 90.0], [-180.0, 180.0]]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        interval, coordinate = (bounds[1], longitude) if even else (bounds[0], latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even, bits = not even, bits + 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def populate_geohashes(apps, schema_editor):
+    Location = apps.get_model("org_pages", "Location")
+    locations = Location.objects.filter(latitude__isnull=False, longitude__isnull=False)
+    for location in locations:
+        location.geohash = encode(float(location.latitude), float(location.longitude))
+    Location.objects.bulk_update(locations, ["geohash"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('org_pages', '0028_location_coordinates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+        migrations.RunPython(populate_geohashes, migrations.RunPython.noop),
+    ]
@@ -1,11 +1,19 @@
+from django.core.exceptions import FieldDoesNotExist
 from django.db import models
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVectorField
+from django.db.models.fields.files import FieldFile
+from django.db.models.functions import Upper
 from django.urls import reverse
+from typing import Any, Iterable
 from uuid import uuid4
 from django.utils.text import slugify
 import httpx
 import os
 from accounts.models import CustomUser
+from backend.metrics import timed
+from . import geo
 
 def gen_upload_path():
     return f"media/logos/{uuid4()}/"
@@ -17,6 +25,7 @@ class DiversityFocus(models.Model):
     parents = models.ManyToManyField("self", blank=True, symmetrical=False)
     description = models.TextField(blank=True)
     other_names = ArrayField(models.CharField(max_length=200), blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -24,21 +33,52 @@ class DiversityFocus(models.Model):
     class Meta:
         ordering = ("name",)
         verbose_name_plural = "Diversity Focuses"
+        indexes = [
+            GinIndex(OpClass(Upper("name"), name="gin_trgm_ops"), name="diversityfocus_name_trgm"),
+        ]
 
 
 class TechnologyFocus(models.Model):
     name = models.CharField(max_length=200)
     parents = models.ManyToManyField("self", blank=True, symmetrical=False)
     other_names = ArrayField(models.CharField(max_length=200), blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ["name"]
         verbose_name_plural = "Technologies"
+        indexes = [
+            GinIndex(OpClass(Upper("name"), name="gin_trgm_ops"), name="technologyfocus_name_trgm"),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class DiversityFocusClosure(models.Model):
+    """Transitive closure of `DiversityFocus.parents`. Maintained by `org_pages.taxonomy`."""
+    ancestor = models.ForeignKey(DiversityFocus, on_delete=models.CASCADE, related_name="descendant_links")
+    descendant = models.ForeignKey(DiversityFocus, on_delete=models.CASCADE, related_name="ancestor_links")
+    depth = models.PositiveSmallIntegerField(help_text="Shortest number of parent links from the descendant.")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["ancestor", "descendant"], name="unique_diversity_focus_closure"),
+        ]
+
+
+class TechnologyFocusClosure(models.Model):
+    """Transitive closure of `TechnologyFocus.parents`. Maintained by `org_pages.taxonomy`."""
+    ancestor = models.ForeignKey(TechnologyFocus, on_delete=models.CASCADE, related_name="descendant_links")
+    descendant = models.ForeignKey(TechnologyFocus, on_delete=models.CASCADE, related_name="ancestor_links")
+    depth = models.PositiveSmallIntegerField(help_text="Shortest number of parent links from the descendant.")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["ancestor", "descendant"], name="unique_technology_focus_closure"),
+        ]
+
+
 class Location(models.Model):
     name = models.CharField(max_length=200, blank=True, null=True)
     region = models.CharField(max_length=250, blank=True, null=True)
@@ -46,24 +86,40 @@ class Location(models.Model):
     base_query = models.CharField(max_length=250, blank=True)
     latitude = models.DecimalField(max_digits=9, decimal_places=5, null=True, blank=True, unique=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=5, null=True, blank=True, unique=True)
+    # Prefix searches on the geohash find the locations near a point, see `geo.py`.
+    geohash = models.CharField(max_length=geo.PRECISION, blank=True, db_index=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ("country", "region", "name")
+        indexes = [
+            GinIndex(OpClass(Upper("name"), name="gin_trgm_ops"), name="location_name_trgm"),
+            # Bounding box queries of the map clusters.
+            models.Index(fields=["latitude", "longitude"], name="location_coordinates"),
+        ]
 
     def __str__(self):
         return f"{self.name}, {self.region}, {self.country}".replace("None", "").replace(", ,", ",")
 
-    def save(self):
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the loaded values so a save can tell where the location was."""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
         if not self.latitude:
-            response = httpx.get(
-                url="https://atlas.microsoft.com/search/address/json",
-                params={
-                    "query": str(self.base_query),
-                    "limit": 1,
-                    "subscription-key": os.environ.get("AZURE_MAPS_KEY"),
-                    "api-version": "1.0",
-                },
-            )
+            with timed("azure_maps_geocode"):
+                response = httpx.get(
+                    url="https://atlas.microsoft.com/search/address/json",
+                    params={
+                        "query": str(self.base_query),
+                        "limit": 1,
+                        "subscription-key": os.environ.get("AZURE_MAPS_KEY"),
+                        "api-version": "1.0",
+                    },
+                )
 
             if response.status_code == 200:
                 result = response.json()["results"][0]
@@ -77,7 +133,91 @@ class Location(models.Model):
 
                 self.latitude = result["position"]["lat"]
                 self.longitude = result["position"]["lon"]
-        return super().save()
+        self.geohash = (
+            geo.encode(float(self.latitude), float(self.longitude))
+            if self.latitude is not None and self.longitude is not None
+            else ""
+        )
+        super().save(*args, **kwargs)
+        self._loaded_values = {field.attname: getattr(self, field.attname) for field in self._meta.concrete_fields}
+
+
+class OrganizationQuerySet(models.QuerySet):
+    """
+    Named loading profiles for organizations. Each profile fetches exactly what its templates or
+    serializers read so rendering a page costs a fixed number of queries however many rows it shows.
+    """
+    CARD_FIELDS = (
+        "name", "slug", "logo", "online_only", "active", "parent_id",
+        "location__name", "location__region", "location__country",
+    )
+    MAP_FIELDS = ("name", "slug", "location__latitude", "location__longitude")
+
+    def _focuses(self, prefix: str = "", full: bool = False) -> "OrganizationQuerySet":
+        """Prefetch the focus names, or whole focuses with their parents when `full`."""
+        diversity, technology = DiversityFocus.objects.all(), TechnologyFocus.objects.all()
+        if full:
+            diversity, technology = diversity.prefetch_related("parents"), technology.prefetch_related("parents")
+        else:
+            diversity, technology = diversity.only("name"), technology.only("name")
+        return self.prefetch_related(
+            models.Prefetch(f"{prefix}diversity", queryset=diversity),
+            models.Prefetch(f"{prefix}technology", queryset=technology),
+        )
+
+    def for_cards(self) -> "OrganizationQuerySet":
+        """`assets/list_index_record.html`: name, logo, location and focus names."""
+        return self._focuses().select_related("location").only(*self.CARD_FIELDS)
+
+    def for_detail(self) -> "OrganizationQuerySet":
+        """`orgs/detail.html`: the full organization with its location, parent, focuses and organizers."""
+        return self._focuses().select_related("location", "parent").prefetch_related("organizers").defer(
+            "search_document", "parent__search_document",
+        )
+
+    def for_map(self) -> "OrganizationQuerySet":
+        """Map features: the name, url and coordinates of organizations with a location."""
+        return self.filter(location__isnull=False).select_related("location").only(*self.MAP_FIELDS)
+
+    def for_api(self) -> "OrganizationQuerySet":
+        """`OrganizationSerializer`: every field plus the nested location, parent and focuses."""
+        return self._focuses(full=True)._focuses("parent__").select_related("location", "parent").defer(
+            "search_document", "parent__search_document",
+        )
+
+    def for_fields(self, fields: Iterable[str], expand: Iterable[str] = ()) -> "OrganizationQuerySet":
+        """
+        `OrganizationSerializer` limited to `fields`: only their columns are read and only the
+        `expand` relations are joined or fetched whole, the others are read as primary keys.
+        """
+        columns, related, queryset = {"id", "name"}, [], self
+        for name in fields:
+            try:
+                field = self.model._meta.get_field(name)
+            except FieldDoesNotExist:
+                # Annotations, e.g. the distance of nearby organizations.
+                continue
+            if field.many_to_many:
+                focuses = field.related_model.objects.all()
+                focuses = focuses.prefetch_related("parents") if name in expand else focuses.only("id")
+                queryset = queryset.prefetch_related(models.Prefetch(name, queryset=focuses))
+            elif field.many_to_one and name in expand:
+                related.append(name)
+                columns.update(
+                    f"{name}__{column.name}" for column in field.related_model._meta.concrete_fields
+                    if column.name not in ("logo", "search_document")
+                )
+            else:
+                columns.add(name)
+        if "parent" in related:
+            queryset = queryset._focuses("parent__")
+        return queryset.select_related(*related).only(*columns)
+
+    def for_compact(self) -> "OrganizationQuerySet":
+        """`LimitedOrganizationSerializer`: name, slug, website and location name."""
+        return self.select_related("location").only(
+            "name", "slug", "url", "location__name", "location__region", "location__country",
+        )
 
 
 class Organization(models.Model):
@@ -181,13 +321,47 @@ class Organization(models.Model):
         upload_to=gen_upload_path(), blank=True,
         help_text="Logo of the organization. Will be displayed on the organization's page.",
     )
+    search_document = SearchVectorField(
+        null=True, editable=False,
+        help_text="Weighted full text search document. Maintained by the org_pages signals.",
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True, db_index=True,
+        help_text="Last change to the organization, its tags or organizers. Used for conditional requests.",
+    )
 
+    objects = OrganizationQuerySet.as_manager()
 
     class Meta:
         ordering = ("name",)
-
-    def save(self):
-        super().save()
+        indexes = [
+            GinIndex(fields=["search_document"], name="org_search_document_gin"),
+            GinIndex(OpClass(Upper("name"), name="gin_trgm_ops"), name="org_name_trgm"),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the loaded values so `changed_fields` can tell what a save changed."""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def _current_value(self, attname: str) -> Any:
+        value = getattr(self, attname)
+        return value.name if isinstance(value, FieldFile) else value
+
+    def changed_fields(self, *attnames: str) -> set[str]:
+        """The fields in `attnames` that differ from the database. Fields that weren't loaded count as changed."""
+        loaded = getattr(self, "_loaded_values", {})
+        return {name for name in attnames if name not in loaded or loaded[name] != self._current_value(name)}
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_values = {
+            field.attname: self._current_value(field.attname)
+            for field in self._meta.concrete_fields
+            if field.attname not in self.get_deferred_fields()
+        }
 
     def get_from_parents(self):
         if self.parent:
@@ -230,6 +404,33 @@ class Organization(models.Model):
             obj.save()
 
 
+class SimilarOrganization(models.Model):
+    """Precomputed similarity between two organizations. Maintained by `org_pages.similarity`."""
+    organization = models.ForeignKey(
+        Organization, on_delete=models.CASCADE, related_name="similarities",
+        help_text="Organization the similar organization is recommended for.",
+    )
+    similar = models.ForeignKey(
+        Organization, on_delete=models.CASCADE, related_name="similar_to",
+        help_text="The recommended organization.",
+    )
+    score = models.FloatField(
+        help_text="Weighted overlap of focuses, location and org type.",
+    )
+
+    class Meta:
+        ordering = ("organization", "-score")
+        indexes = [
+            models.Index(fields=["organization", "-score"], name="similar_org_score_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["organization", "similar"], name="unique_similar_organization"),
+        ]
+
+    def __str__(self):
+        return f"{self.organization_id} -> {self.similar_id} ({self.score:.2f})"
+
+
 class SuggestedEdit(models.Model):
     organization = models.ForeignKey(
         Organization, on_delete=models.SET_NULL,
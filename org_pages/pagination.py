@@ -0,0 +1,129 @@
+"""
+Keyset (cursor) pagination over `(name, id)`.
+
+Pages are fetched with `WHERE (name, id) > cursor ORDER BY name, id LIMIT n + 1` so every page
+costs the same as the first one. Totals are optional: they are counted at most once per
+`COUNT_CACHE_TIMEOUT` for each distinct query and served from the cache in between.
+"""
+
+import base64
+import hashlib
+import json
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from django.core.cache import cache
+from django.db.models import Q, QuerySet
+from django.http import QueryDict
+
+COUNT_CACHE_TIMEOUT = 300
+
+
+def encode_cursor(name: str, pk: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([name, pk]).encode()).decode()
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[tuple[str, int]]:
+    """Return the (name, pk) in a cursor, or None if it is missing or malformed."""
+    if not cursor:
+        return None
+    try:
+        name, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(name), int(pk)
+    except (ValueError, TypeError):
+        return None
+
+
+def cached_count(queryset: QuerySet) -> int:
+    """Count `queryset`, caching the result for a few minutes keyed by its SQL."""
+    sql, params = queryset.query.sql_with_params()
+    key = "count:" + hashlib.md5(f"{sql}{params}".encode()).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, COUNT_CACHE_TIMEOUT)
+    return count
+
+
+@dataclass
+class KeysetPage:
+    """A single page of results and the cursors around it."""
+    object_list: list
+    params: QueryDict
+    has_next: bool = False
+    has_previous: bool = False
+    total: Optional[int] = None
+    next_cursor: Optional[str] = field(default=None)
+    previous_cursor: Optional[str] = field(default=None)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_other_pages(self) -> bool:
+        return self.has_next or self.has_previous
+
+    def _url(self, **cursor: str) -> str:
+        query = self.params.copy()
+        for key in ("after", "before", "page"):
+            query.pop(key, None)
+        query.update(cursor)
+        return f"?{query.urlencode()}"
+
+    @property
+    def next_url(self) -> Optional[str]:
+        return self._url(after=self.next_cursor) if self.has_next else None
+
+    @property
+    def previous_url(self) -> Optional[str]:
+        return self._url(before=self.previous_cursor) if self.has_previous else None
+
+    @property
+    def first_url(self) -> str:
+        return self._url()
+
+
+def keyset_page(queryset: QuerySet, params: QueryDict, page_size: int, with_total: bool = True) -> KeysetPage:
+    """Fetch the page of `queryset` after (or before) the cursor in `params`."""
+    after, before = decode_cursor(params.get("after")), decode_cursor(params.get("before"))
+    total = cached_count(queryset.order_by()) if with_total else None
+
+    if before:
+        name, pk = before
+        rows = list(
+            queryset.filter(Q(name__lt=name) | Q(name=name, pk__lt=pk)).order_by("-name", "-pk")[: page_size + 1]
+        )
+        has_more = len(rows) > page_size
+        rows = rows[:page_size][::-1]
+        has_previous, has_next = has_more, True
+    else:
+        if after:
+            name, pk = after
+            queryset = queryset.filter(Q(name__gt=name) | Q(name=name, pk__gt=pk))
+        rows = list(queryset.order_by("name", "pk")[: page_size + 1])
+        has_next, has_previous = len(rows) > page_size, bool(after)
+        rows = rows[:page_size]
+
+    return KeysetPage(
+        object_list=rows,
+        params=params,
+        has_next=has_next and bool(rows),
+        has_previous=has_previous and bool(rows),
+        total=total,
+        next_cursor=encode_cursor(rows[-1].name, rows[-1].pk) if rows else None,
+        previous_cursor=encode_cursor(rows[0].name, rows[0].pk) if rows else None,
+    )
+
+
+class KeysetPaginationMixin:
+    """
+    ListView mixin replacing offset pagination with keyset pagination over `(name, id)`.
+    The page is available to templates as `page_obj` with `next_url` and `previous_url`.
+    """
+    paginate_with_total = True
+
+    def paginate_queryset(self, queryset: QuerySet, page_size: int) -> tuple[Any, KeysetPage, list, bool]:
+        page = keyset_page(queryset, self.request.GET, page_size, with_total=self.paginate_with_total)
+        return None, page, page.object_list, page.has_other_pages()
@@ -0,0 +1,128 @@
+"""Full text search helpers for the stored `Organization.search_document`."""
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from django.db.models import CharField, F, Func, OuterRef, Q, QuerySet, Subquery, TextField, Value
+from django.db.models.functions import Coalesce, Concat, Upper
+
+from .models import DiversityFocus, Location, Organization, TechnologyFocus
+
+SEARCH_CONFIG = "english"
+SUGGESTION_MODELS = (
+    (Organization, "organization"),
+    (DiversityFocus, "diversity"),
+    (TechnologyFocus, "technology"),
+    (Location, "location"),
+)
+
+
+def _tag_names(queryset: QuerySet, field_name: str) -> Subquery:
+    """Space separated names and other_names for the tags in `field_name` of the outer organization."""
+    tag_model = queryset.model._meta.get_field(field_name).related_model
+    query_name = queryset.model._meta.get_field(field_name).related_query_name()
+    other_names = Coalesce(
+        Func(F("other_names"), Value(" "), function="array_to_string", output_field=TextField()),
+        Value(""),
+        output_field=TextField(),
+    )
+    tag_text = Concat("name", Value(" "), other_names, output_field=TextField())
+    names = (
+        tag_model.objects.filter(**{query_name: OuterRef("pk")})
+        .order_by()
+        .values(query_name)
+        .annotate(names=StringAgg(tag_text, " ", output_field=TextField()))
+        .values("names")
+    )
+    return Subquery(names, output_field=TextField())
+
+
+def _location_name(queryset: QuerySet) -> Subquery:
+    """The name, region and country of the outer organization's location."""
+    location_model = queryset.model._meta.get_field("location").related_model
+    location = location_model.objects.filter(pk=OuterRef("location_id")).values(
+        text=Concat("name", Value(" "), "region", Value(" "), "country", output_field=TextField())
+    )
+    return Subquery(location, output_field=TextField())
+
+
+def search_document(queryset: QuerySet) -> SearchVector:
+    """
+    The weighted search document for each organization in `queryset`.
+
+    Organization names are weighted highest, followed by the diversity and technology focuses
+    (including their other names), the location and finally the description.
+    """
+    return (
+        SearchVector("name", weight="A", config=SEARCH_CONFIG)
+        + SearchVector(_tag_names(queryset, "diversity"), weight="B", config=SEARCH_CONFIG)
+        + SearchVector(_tag_names(queryset, "technology"), weight="B", config=SEARCH_CONFIG)
+        + SearchVector(_location_name(queryset), weight="C", config=SEARCH_CONFIG)
+        + SearchVector("description", weight="D", config=SEARCH_CONFIG)
+    )
+
+
+def update_search_documents(queryset: QuerySet) -> int:
+    """
+    Rebuild the stored search document for every organization in `queryset` in a single UPDATE.
+
+    `QuerySet.update` doesn't send `post_save` so this is safe to call from the signal handlers.
+    """
+    return queryset.update(search_document=search_document(queryset))
+
+
+def name_similarity(query: str) -> TrigramSimilarity:
+    """
+    Trigram similarity between `query` and a model's name.
+
+    Names are compared upper cased so the `UPPER(name) gin_trgm_ops` indexes serve both
+    `name__icontains` and the similarity lookups.
+    """
+    return TrigramSimilarity(Upper("name"), query.upper())
+
+
+def search(queryset: QuerySet, query: str) -> QuerySet:
+    """
+    Filter `queryset` to the organizations matching `query` ranked by relevance.
+
+    Matches the full text search document or a substring of the name. Both conditions are
+    served by indexes so the combined filter is a bitmap OR rather than a sequential scan.
+    A blank query matches nothing rather than every name.
+    """
+    if not query.strip():
+        return queryset.none()
+    search_query = SearchQuery(query, search_type="websearch", config=SEARCH_CONFIG)
+    return (
+        queryset.filter(Q(search_document=search_query) | Q(name__icontains=query))
+        .annotate(rank=SearchRank(F("search_document"), search_query) + name_similarity(query))
+        .order_by("-rank", "name")
+    )
+
+
+def suggestions(query: str, limit: int = 5) -> list[dict]:
+    """
+    Ranked "did you mean" suggestions for a query that returned no results.
+
+    Organization, focus and location names within the trigram similarity threshold are
+    combined into a single UNION query and ordered by similarity.
+    """
+    if not query:
+        return []
+
+    matches = [
+        model.objects.alias(upper_name=Upper("name"))
+        .filter(upper_name__trigram_similar=query.upper())
+        .annotate(kind=Value(kind, output_field=CharField()), similarity=name_similarity(query))
+        .order_by()
+        .values("name", "kind", "similarity")
+        for model, kind in SUGGESTION_MODELS
+    ]
+    results = matches[0].union(*matches[1:], all=True).order_by("-similarity", "name")
+
+    suggested, seen = [], set()
+    for result in results[: limit * len(SUGGESTION_MODELS)]:
+        if result["name"] and result["name"].lower() not in seen:
+            seen.add(result["name"].lower())
+            suggested.append(result)
+        if len(suggested) == limit:
+            break
+    return suggested
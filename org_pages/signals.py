@@ -0,0 +1,231 @@
+"""Signal handlers that keep denormalized organization data current."""
+
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .authorization import invalidate as invalidate_managed, invalidate_organizers
+from .autocomplete import autocomplete_index
+from .cache import GLOBAL, bump, bump_orgs, org_scope, tag_scope
+from .conditional import touch
+from .featured import FEATURED_FIELDS, invalidate as invalidate_featured
+from .models import DiversityFocus, Location, Organization, TechnologyFocus
+from .search import update_search_documents
+from .similarity import PROFILE_FIELDS, refresh_later as refresh_similar
+from .taxonomy import refresh as refresh_closure
+from .tiles import TILE_FIELDS, invalidate as invalidate_tiles
+
+AUTOCOMPLETE_MODELS = (Organization, DiversityFocus, TechnologyFocus, Location)
+
+
+@receiver(post_save, sender=Organization)
+def organization_saved(sender, instance, created, **kwargs):
+    """
+    Rebuild the search document, and the similar organizations (after commit) if a save changed
+    what they are scored on.
+    """
+    update_search_documents(Organization.objects.filter(pk=instance.pk))
+    if created or instance.changed_fields(*PROFILE_FIELDS):
+        refresh_similar([instance.pk])
+
+
+@receiver(post_save, sender=Organization)
+def featured_organization_saved(sender, instance, created, **kwargs):
+    """Drop the cached featured parents when a save could change the home page."""
+    if (created and instance.is_featured) or (not created and instance.changed_fields(*FEATURED_FIELDS)):
+        invalidate_featured()
+
+
+@receiver(post_delete, sender=Organization)
+def featured_organization_deleted(sender, instance, **kwargs):
+    """Deleting a featured organization or a (possibly featured) parent changes the home page."""
+    if instance.is_featured or not instance.parent_id:
+        invalidate_featured()
+
+
+@receiver(post_save, sender=Organization)
+@receiver(post_delete, sender=Organization)
+def organization_pages_changed(sender, instance, **kwargs):
+    """
+    Invalidate the directory pages and every detail page showing the organization: its own (under
+    its current and previous slug), its parent's, its children's and those listing it as similar.
+    """
+    previous_slug = getattr(instance, "_loaded_values", {}).get("slug")
+    bump(GLOBAL, *(org_scope(slug) for slug in {instance.slug, previous_slug} if slug))
+    bump_orgs(Organization.objects.filter(
+        Q(pk=instance.parent_id) | Q(parent_id=instance.pk) | Q(similarities__similar_id=instance.pk)
+    ))
+
+
+@receiver(post_save, sender=Organization)
+@receiver(post_delete, sender=Organization)
+def organization_tiles_changed(sender, instance, created=None, **kwargs):
+    """Invalidate the map tiles at the organization's current and previous location."""
+    if created is False and not instance.changed_fields(*TILE_FIELDS):
+        return
+    previous = getattr(instance, "_loaded_values", {}).get("location_id")
+    invalidate_tiles(
+        Location.objects.filter(pk__in=[instance.location_id, previous]).values_list("latitude", "longitude")
+    )
+
+
+@receiver(post_save, sender=Organization)
+def organization_parent_changed(sender, instance, created, **kwargs):
+    """Organizers of a parent manage its children, so moving an organization changes what they manage."""
+    previous = getattr(instance, "_loaded_values", {}).get("parent_id")
+    if instance.parent_id != previous:
+        invalidate_organizers([instance.parent_id, previous])
+
+
+@receiver(m2m_changed, sender=Organization.organizers.through)
+def organizers_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Drop the cached managed organizations of every user who gained or lost an organization and
+    mark the organizations as modified.
+    """
+    if action == "pre_clear":
+        instance._cleared_pks = list(instance.organizers.values_list("pk", flat=True))
+        return
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    if action == "post_clear":
+        pk_set = instance.__dict__.pop("_cleared_pks", [])
+    if reverse:
+        invalidate_managed([instance.pk])
+        touch(Organization.objects.filter(pk__in=pk_set))
+    else:
+        invalidate_managed(pk_set)
+        touch(Organization.objects.filter(pk=instance.pk))
+
+
+@receiver(m2m_changed, sender=Organization.diversity.through)
+@receiver(m2m_changed, sender=Organization.technology.through)
+def organization_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Rebuild the search documents of the organizations whose tags were added, removed or cleared."""
+    if reverse and action == "pre_clear":
+        # A reverse clear doesn't provide the affected organizations once it has happened.
+        field = "diversity" if sender is Organization.diversity.through else "technology"
+        instance._cleared_org_pks = list(
+            Organization.objects.filter(**{field: instance}).values_list("pk", flat=True)
+        )
+        return
+
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    if not reverse:
+        pk_set = {instance.pk}
+    elif action == "post_clear":
+        pk_set = instance.__dict__.pop("_cleared_org_pks", [])
+
+    orgs = Organization.objects.filter(pk__in=pk_set)
+    update_search_documents(orgs)
+    touch(orgs)
+    bump(GLOBAL)
+    bump_orgs(orgs)
+    refresh_similar(pk_set)
+
+
+@receiver(post_save, sender=DiversityFocus)
+def diversity_focus_saved(sender, instance, created, **kwargs):
+    """Tag names are part of the search document and detail page of every organization using the tag."""
+    bump(GLOBAL, tag_scope("diversity"))
+    if created:
+        refresh_closure(DiversityFocus, [instance.pk])
+    else:
+        update_search_documents(Organization.objects.filter(diversity=instance))
+        touch(Organization.objects.filter(diversity=instance))
+        bump_orgs(Organization.objects.filter(diversity=instance))
+
+
+@receiver(post_save, sender=TechnologyFocus)
+def technology_focus_saved(sender, instance, created, **kwargs):
+    """Tag names are part of the search document and detail page of every organization using the tag."""
+    bump(GLOBAL, tag_scope("technology"))
+    if created:
+        refresh_closure(TechnologyFocus, [instance.pk])
+    else:
+        update_search_documents(Organization.objects.filter(technology=instance))
+        touch(Organization.objects.filter(technology=instance))
+        bump_orgs(Organization.objects.filter(technology=instance))
+
+
+@receiver(m2m_changed, sender=DiversityFocus.parents.through)
+@receiver(m2m_changed, sender=TechnologyFocus.parents.through)
+def focus_parents_changed(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """Recompute the closure of every focus whose ancestors may have changed."""
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    if not reverse:
+        nodes = [instance.pk]
+    elif action == "post_clear":
+        # The former children of a cleared parent aren't known any more.
+        nodes = None
+    else:
+        nodes = pk_set
+    refresh_closure(model, nodes)
+    touch(model.objects.all() if nodes is None else model.objects.filter(pk__in=nodes))
+    bump(GLOBAL, tag_scope("diversity" if model is DiversityFocus else "technology"))
+
+
+@receiver(pre_delete, sender=DiversityFocus)
+@receiver(pre_delete, sender=TechnologyFocus)
+def focus_deleting(sender, instance, **kwargs):
+    """
+    Remember the descendants of a focus being deleted, their closure rows cascade with it.
+    The organizations using it lose the tag without an m2m_changed signal.
+    """
+    instance._descendant_pks = list(
+        instance.descendant_links.filter(depth__gt=0).values_list("descendant_id", flat=True)
+    )
+    orgs = Organization.objects.filter(**{"diversity" if sender is DiversityFocus else "technology": instance})
+    touch(orgs)
+    bump_orgs(orgs)
+
+
+@receiver(post_delete, sender=DiversityFocus)
+@receiver(post_delete, sender=TechnologyFocus)
+def focus_deleted(sender, instance, **kwargs):
+    """Descendants may still reach the deleted focus's ancestors through other paths."""
+    if descendants := instance.__dict__.pop("_descendant_pks", None):
+        refresh_closure(sender, descendants)
+    bump(GLOBAL, tag_scope("diversity" if sender is DiversityFocus else "technology"))
+
+
+@receiver(post_save, sender=Location)
+def location_saved(sender, instance, created, **kwargs):
+    """Location names are part of the search document and detail page of every organization at the location."""
+    bump(GLOBAL)
+    loaded = getattr(instance, "_loaded_values", {})
+    invalidate_tiles([(instance.latitude, instance.longitude), (loaded.get("latitude"), loaded.get("longitude"))])
+    if not created:
+        update_search_documents(Organization.objects.filter(location=instance))
+        touch(Organization.objects.filter(location=instance))
+        bump_orgs(Organization.objects.filter(location=instance))
+
+
+@receiver(pre_delete, sender=Location)
+def location_deleting(sender, instance, **kwargs):
+    """Organizations at a deleted location have it set to NULL without a post_save signal."""
+    bump(GLOBAL)
+    invalidate_tiles([(instance.latitude, instance.longitude)])
+    touch(Organization.objects.filter(location=instance))
+    bump_orgs(Organization.objects.filter(location=instance))
+
+
+def autocomplete_saved(sender, instance, **kwargs):
+    """Replace the instance's entries in the autocomplete index."""
+    autocomplete_index.update(instance)
+
+
+def autocomplete_deleted(sender, instance, **kwargs):
+    """Remove the instance's entries from the autocomplete index."""
+    autocomplete_index.update(instance, deleted=True)
+
+
+for model in AUTOCOMPLETE_MODELS:
+    post_save.connect(autocomplete_saved, sender=model, dispatch_uid=f"autocomplete_saved_{model.__name__}")
+    post_delete.connect(autocomplete_deleted, sender=model, dispatch_uid=f"autocomplete_deleted_{model.__name__}")
+
@@ -0,0 +1,254 @@
+"""
+Precomputed "similar organizations" for the organization detail page.
+
+Organizations are scored against each other by weighted overlap of their diversity and technology
+focuses (including the focuses' ancestors), by sharing or being near a location and by org_type.
+The top `TOP_K` matches for every organization are stored in `SimilarOrganization` so the detail
+page reads them back with a single indexed lookup.
+
+Saves refresh the lists with `refresh_later`, which merges every organization changed in a
+transaction into one `refresh_many` once it commits, outside of the request's transaction.
+"""
+
+import math
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+from django.db import transaction
+from django.db.models import Q, QuerySet
+
+from .cache import SIMILAR, bump
+from .models import DiversityFocus, Organization, SimilarOrganization, TechnologyFocus
+from .taxonomy import ancestors
+
+TOP_K = 10
+# Organization columns a similarity score depends on, besides the focuses.
+PROFILE_FIELDS = ("org_type", "location_id", "active")
+NEARBY_KM = 100
+WEIGHTS = {
+    "diversity": 3.0,
+    "diversity_ancestor": 1.5,
+    "technology": 2.0,
+    "technology_ancestor": 1.0,
+    "location": 4.0,
+    "nearby": 2.0,
+    "org_type": 1.0,
+}
+
+
+@dataclass
+class Profile:
+    """Everything needed to score an organization."""
+    pk: int
+    org_type: Optional[str] = None
+    location_id: Optional[int] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    diversity: set = field(default_factory=set)
+    diversity_ancestors: set = field(default_factory=set)
+    technology: set = field(default_factory=set)
+    technology_ancestors: set = field(default_factory=set)
+
+    @property
+    def has_coords(self) -> bool:
+        return self.latitude is not None and self.longitude is not None
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great circle distance between two points in kilometers."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 6371 * 2 * math.asin(math.sqrt(a))
+
+
+def load_profiles(queryset: QuerySet) -> dict[int, Profile]:
+    """Build a `Profile` for every active organization in `queryset` with a fixed number of queries."""
+    queryset = queryset.filter(active=True)
+    profiles = {
+        row["pk"]: Profile(
+            pk=row["pk"],
+            org_type=row["org_type"],
+            location_id=row["location_id"],
+            latitude=float(row["location__latitude"]) if row["location__latitude"] is not None else None,
+            longitude=float(row["location__longitude"]) if row["location__longitude"] is not None else None,
+        )
+        for row in queryset.values("pk", "org_type", "location_id", "location__latitude", "location__longitude")
+    }
+
+    for tag, model in (("diversity", DiversityFocus), ("technology", TechnologyFocus)):
+        through = getattr(Organization, tag).through
+        tags = list(through.objects.filter(organization_id__in=queryset.values("pk")).values_list(
+            "organization_id", f"{model._meta.model_name}_id"
+        ))
+        focus_ancestors = ancestors(model, {focus_id for _, focus_id in tags})
+        for org_id, focus_id in tags:
+            if profile := profiles.get(org_id):
+                getattr(profile, tag).add(focus_id)
+                getattr(profile, f"{tag}_ancestors").update(focus_ancestors.get(focus_id, ()))
+    return profiles
+
+
+def score(a: Profile, b: Profile) -> float:
+    """Weighted similarity between two organizations. Zero means they have nothing in common."""
+    total = 0.0
+
+    for tag in ("diversity", "technology"):
+        direct_a, direct_b = getattr(a, tag), getattr(b, tag)
+        direct = len(direct_a & direct_b)
+        expanded = len((direct_a | getattr(a, f"{tag}_ancestors")) & (direct_b | getattr(b, f"{tag}_ancestors")))
+        total += direct * WEIGHTS[tag] + (expanded - direct) * WEIGHTS[f"{tag}_ancestor"]
+
+    same_location = bool(a.location_id) and a.location_id == b.location_id
+    if not total and not same_location:
+        # Location and org_type alone don't make two organizations similar.
+        return 0.0
+
+    if same_location:
+        total += WEIGHTS["location"]
+    elif a.has_coords and b.has_coords:
+        distance = haversine_km(a.latitude, a.longitude, b.latitude, b.longitude)
+        if distance < NEARBY_KM:
+            total += WEIGHTS["nearby"] * (1 - distance / NEARBY_KM)
+
+    if a.org_type and a.org_type == b.org_type:
+        total += WEIGHTS["org_type"]
+    return total
+
+
+def top_matches(profile: Profile, candidates: Iterable[Profile], k: int = TOP_K) -> list[tuple[int, float]]:
+    """The `k` highest scoring candidates as (pk, score) pairs."""
+    scores = ((candidate.pk, score(profile, candidate)) for candidate in candidates if candidate.pk != profile.pk)
+    return sorted((pair for pair in scores if pair[1] > 0), key=lambda pair: (-pair[1], pair[0]))[:k]
+
+
+def candidate_filter(profiles: Iterable[Profile]) -> Q:
+    """
+    Organizations that could score above zero against any of `profiles`: those sharing a focus
+    (or an ancestor of one) or the location. Proximity only adds to a score, so it finds no others.
+    """
+    profiles = list(profiles)
+    query = Q()
+    for tag in ("diversity", "technology"):
+        if focuses := set().union(*(getattr(p, tag) | getattr(p, f"{tag}_ancestors") for p in profiles)):
+            query |= Q(**{f"{tag}__ancestor_links__ancestor__in": focuses})
+    if locations := {p.location_id for p in profiles if p.location_id}:
+        query |= Q(location_id__in=locations)
+    # No candidates at all rather than every organization.
+    return query or Q(pk__in=[])
+
+
+@transaction.atomic
+def refresh_all(k: int = TOP_K) -> int:
+    """Recompute the similar organizations for the whole directory. Returns the number of rows stored."""
+    profiles = load_profiles(Organization.objects.all())
+
+    # Inverted indexes so each organization is only scored against organizations sharing something with it.
+    buckets = defaultdict(set)
+    for profile in profiles.values():
+        for tag in ("diversity", "technology"):
+            for focus in getattr(profile, tag) | getattr(profile, f"{tag}_ancestors"):
+                buckets[(tag, focus)].add(profile.pk)
+        if profile.location_id:
+            buckets[("location", profile.location_id)].add(profile.pk)
+
+    rows = []
+    for profile in profiles.values():
+        keys = [
+            (tag, focus)
+            for tag in ("diversity", "technology")
+            for focus in getattr(profile, tag) | getattr(profile, f"{tag}_ancestors")
+        ]
+        if profile.location_id:
+            keys.append(("location", profile.location_id))
+
+        candidate_ids = set().union(*(buckets.get(key, ()) for key in keys))
+        rows.extend(
+            SimilarOrganization(organization_id=profile.pk, similar_id=pk, score=value)
+            for pk, value in top_matches(profile, (profiles[pk] for pk in candidate_ids), k)
+        )
+
+    SimilarOrganization.objects.all().delete()
+    SimilarOrganization.objects.bulk_create(rows, batch_size=1000)
+    bump(SIMILAR)
+    return len(rows)
+
+
+def refresh(org: Organization, k: int = TOP_K) -> None:
+    """Recompute the similar organizations of `org` and its place in the other lists."""
+    refresh_many([org.pk], k)
+
+
+@transaction.atomic
+def refresh_many(pks: Iterable[int], k: int = TOP_K) -> None:
+    """
+    Recompute the similar organizations of the organizations `pks`, with a fixed number of queries.
+
+    The lists they were in are recomputed too, so none is left short, and they are added to
+    the other lists they now score in. Lists that don't change otherwise aren't recomputed,
+    so `refresh_all` should still be run periodically.
+    """
+    pks = set(pks)
+    # The organizations that listed one of `pks`.
+    listing = set(
+        SimilarOrganization.objects.filter(similar_id__in=pks).values_list("organization_id", flat=True)
+    ) - pks
+    SimilarOrganization.objects.filter(
+        Q(organization_id__in=pks | listing) | Q(similar_id__in=pks)
+    ).delete()
+
+    profiles = load_profiles(Organization.objects.filter(pk__in=pks | listing))
+    if not profiles:
+        return
+    candidates = load_profiles(Organization.objects.filter(candidate_filter(profiles.values())).distinct())
+
+    rows = [
+        SimilarOrganization(organization_id=profile.pk, similar_id=pk, score=value)
+        for profile in profiles.values()
+        for pk, value in top_matches(profile, candidates.values(), k)
+    ]
+    # The refreshed organizations enter the other lists they score in, which are then trimmed back to `k`.
+    others = [candidate for candidate in candidates.values() if candidate.pk not in profiles]
+    rows.extend(
+        SimilarOrganization(organization_id=candidate.pk, similar_id=profile.pk, score=value)
+        for candidate in others
+        for profile in profiles.values() if profile.pk in pks
+        if (value := score(candidate, profile)) > 0
+    )
+    SimilarOrganization.objects.bulk_create(rows, batch_size=1000)
+
+    lists = defaultdict(list)
+    for row in SimilarOrganization.objects.filter(
+        organization_id__in=[candidate.pk for candidate in others]
+    ).order_by("-score", "similar_id").values("pk", "organization_id"):
+        lists[row["organization_id"]].append(row["pk"])
+    if stale := [pk for rows in lists.values() for pk in rows[k:]]:
+        SimilarOrganization.objects.filter(pk__in=stale).delete()
+
+
+class _Refresh:
+    """An on-commit refresh of the organizations changed in a transaction."""
+
+    def __init__(self) -> None:
+        self.pks = set()
+
+    def __call__(self) -> None:
+        refresh_many(self.pks)
+
+
+def refresh_later(pks: Iterable[int]) -> None:
+    """
+    Refresh the similar organizations of `pks` once the current transaction commits, together
+    with every other organization changed in it (at the same savepoint).
+    """
+    connection = transaction.get_connection()
+    if connection.in_atomic_block:
+        # Blocks without a savepoint (None) commit or roll back with the block around them.
+        savepoints = set(filter(None, connection.savepoint_ids))
+        for entry in reversed(connection.run_on_commit):
+            if isinstance(entry[1], _Refresh) and set(filter(None, entry[0])) == savepoints:
+                entry[1].pks.update(pks)
+                return
+    callback = _Refresh()
+    callback.pks.update(pks)
+    transaction.on_commit(callback)
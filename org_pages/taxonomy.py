@@ -0,0 +1,92 @@
+"""
+Transitive closure tables for the `DiversityFocus` and `TechnologyFocus` hierarchies.
+
+Every focus has a row for itself (depth 0) and one for each ancestor at any depth, so "this focus
+or anything below it" is a single indexed join regardless of how deep the taxonomy goes.
+"""
+
+from collections import defaultdict, deque
+from typing import Iterable, Optional
+
+from django.db import transaction
+from django.db.models import Model, Q
+
+from .models import DiversityFocus, DiversityFocusClosure, TechnologyFocus, TechnologyFocusClosure
+
+CLOSURE_MODELS = {
+    DiversityFocus: DiversityFocusClosure,
+    TechnologyFocus: TechnologyFocusClosure,
+}
+
+
+def parent_edges(focus_model: type[Model]) -> tuple[dict[int, set[int]], dict[int, set[int]]]:
+    """Load the parent links of a taxonomy as (parents, children) adjacency maps."""
+    parents, children = defaultdict(set), defaultdict(set)
+    name = focus_model._meta.model_name
+    for child, parent in focus_model.parents.through.objects.values_list(f"from_{name}_id", f"to_{name}_id"):
+        parents[child].add(parent)
+        children[parent].add(child)
+    return parents, children
+
+
+def walk(start: int, edges: dict[int, set[int]]) -> dict[int, int]:
+    """Breadth first walk returning each reachable node and its shortest depth. Cycles are ignored."""
+    depths = {start: 0}
+    queue = deque([start])
+    while queue:
+        node = queue.popleft()
+        for neighbour in edges.get(node, ()):
+            if neighbour not in depths:
+                depths[neighbour] = depths[node] + 1
+                queue.append(neighbour)
+    return depths
+
+
+@transaction.atomic
+def rebuild_closure(
+    focus_model: type[Model], closure_model: type[Model], nodes: Optional[Iterable[int]] = None,
+) -> None:
+    """
+    Recompute the closure rows for `nodes` and everything below them, or the whole taxonomy if
+    `nodes` is None. Accepts the historical models so it can be used from migrations.
+    """
+    parents, children = parent_edges(focus_model)
+
+    if nodes is None:
+        affected = set(focus_model.objects.values_list("pk", flat=True))
+        closure_model.objects.all().delete()
+    else:
+        affected = set()
+        for node in nodes:
+            affected.update(walk(node, children))
+        affected &= set(focus_model.objects.filter(pk__in=affected).values_list("pk", flat=True))
+        closure_model.objects.filter(descendant_id__in=affected).delete()
+
+    closure_model.objects.bulk_create(
+        (
+            closure_model(ancestor_id=ancestor, descendant_id=node, depth=depth)
+            for node in affected
+            for ancestor, depth in walk(node, parents).items()
+        ),
+        batch_size=1000,
+    )
+
+
+def refresh(focus_model: type[Model], nodes: Optional[Iterable[int]] = None) -> None:
+    """Recompute the closure of `nodes` (and their descendants) in a taxonomy."""
+    rebuild_closure(focus_model, CLOSURE_MODELS[focus_model], nodes)
+
+
+def tagged(field: str, name: str) -> Q:
+    """Filter organizations tagged with the focus `name` in `field` or with any focus below it."""
+    return Q(**{f"{field}__ancestor_links__ancestor__name__iexact": name})
+
+
+def ancestors(focus_model: type[Model], pks: Iterable[int]) -> dict[int, set[int]]:
+    """Map each focus in `pks` to its ancestors at any depth, excluding itself."""
+    result = defaultdict(set)
+    for descendant, ancestor in CLOSURE_MODELS[focus_model].objects.filter(
+        descendant_id__in=pks, depth__gt=0,
+    ).values_list("descendant_id", "ancestor_id"):
+        result[descendant].add(ancestor)
+    return result
@@ -1,5 +1,21 @@
-from django.test import TestCase
-from .models import Organization
+from io import StringIO
+from unittest import mock
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse, QueryDict
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from accounts.models import CustomUser
+from backend.queries import QueryBudgetExceeded, QueryInspectionMiddleware, fingerprint, query_budget
+from .authorization import is_organizer, managed_organizations
+from .bench import DirectoryConfig, benchmark, percentile, seed
+from .cache import bump, org_scope, tag_scope, versions
+from .facets import facet_counts, toggle_url
+from .featured import featured_parents
+from .models import DiversityFocus, Location, Organization, SimilarOrganization, TechnologyFocus
+from .similarity import refresh_all as refresh_all_similar, refresh_many as refresh_many_similar
 
 # Create your tests here.
 class OrganizationPageTest(TestCase):
@@ -11,6 +27,9 @@ class OrganizationPageTest(TestCase):
             url="https://www.test.org",
         )
 
+    def setUp(self) -> None:
+        cache.clear()
+
     def get_response(self):
         response = self.client.get("/")
         return response
@@ -23,3 +42,633 @@ class OrganizationPageTest(TestCase):
 
     def test_org_page_contains_org_name(self):
         self.assertContains(self.get_response(), self.org.name)
+
+
+class SearchDocumentTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.location = Location.objects.create(
+            name="Atlanta", region="Georgia", country="United States", latitude=33.749, longitude=-84.388,
+        )
+        cls.focus = DiversityFocus.objects.create(name="Black", other_names=["African American"])
+        cls.org = Organization.objects.create(
+            name="Python Users Group", slug="python-users-group", location=cls.location,
+        )
+        cls.org.diversity.add(cls.focus)
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def search(self, query):
+        return self.client.get(reverse("search"), {"q": query}).context["object_list"]
+
+    def test_search_matches_name(self):
+        self.assertIn(self.org, self.search("python"))
+
+    def test_search_matches_tag_other_names(self):
+        self.assertIn(self.org, self.search("african american"))
+
+    def test_search_document_updates_with_location(self):
+        self.location.name = "Savannah"
+        self.location.save()
+        self.assertIn(self.org, self.search("savannah"))
+
+    def test_search_document_updates_when_tag_removed(self):
+        self.org.diversity.remove(self.focus)
+        self.assertNotIn(self.org, self.search("african american"))
+
+    def test_blank_query_matches_nothing(self):
+        self.assertFalse(self.search(""))
+        self.assertFalse(self.search("  "))
+
+
+class FuzzySearchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.org = Organization.objects.create(name="PyLadies Chicago", slug="pyladies-chicago")
+        DiversityFocus.objects.create(name="Women")
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def get_response(self, query):
+        return self.client.get(reverse("search"), {"q": query})
+
+    def test_search_matches_name_substring(self):
+        self.assertIn(self.org, self.get_response("ladies chi").context["object_list"])
+
+    def test_zero_results_suggest_similar_names(self):
+        response = self.get_response("PyLadys Chicgo")
+        self.assertFalse(response.context["object_list"])
+        self.assertEqual(response.context["suggestions"][0]["name"], self.org.name)
+        self.assertContains(response, "Did you mean")
+
+    def test_suggestions_include_focuses(self):
+        suggested = self.get_response("Wommen").context["suggestions"]
+        self.assertIn(("Women", "diversity"), [(x["name"], x["kind"]) for x in suggested])
+
+
+class SimilarOrganizationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.location = Location.objects.create(
+            name="Atlanta", region="Georgia", country="United States", latitude=33.749, longitude=-84.388,
+        )
+        cls.women = DiversityFocus.objects.create(name="Women")
+        cls.black_women = DiversityFocus.objects.create(name="Black Women")
+        cls.black_women.parents.add(cls.women)
+
+        cls.org = Organization.objects.create(name="Black Women Code", slug="black-women-code", location=cls.location)
+        cls.org.diversity.add(cls.black_women)
+        cls.same_focus = Organization.objects.create(name="Black Women Tech", slug="black-women-tech")
+        cls.same_focus.diversity.add(cls.black_women)
+        cls.parent_focus = Organization.objects.create(
+            name="Women Who Code", slug="women-who-code", location=cls.location,
+        )
+        cls.parent_focus.diversity.add(cls.women)
+        cls.unrelated = Organization.objects.create(name="Python Users", slug="python-users")
+        # Saves refresh the lists on commit, which test data never reaches.
+        refresh_all_similar()
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def get_similar(self, org):
+        return list(self.client.get(org.get_absolute_url()).context["other_orgs"])
+
+    def test_similar_orgs_are_ranked(self):
+        self.assertEqual(self.get_similar(self.org), [self.parent_focus, self.same_focus])
+
+    def test_incremental_refresh_adds_new_org_to_existing_lists(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.unrelated.diversity.add(self.black_women)
+        self.assertIn(self.unrelated, self.get_similar(self.same_focus))
+
+    def test_refresh_similar_orgs_command(self):
+        SimilarOrganization.objects.all().delete()
+        call_command("refresh_similar_orgs", stdout=StringIO())
+        similar = self.get_similar(self.org)
+        self.assertEqual(similar, [self.parent_focus, self.same_focus])
+        self.assertNotIn(self.unrelated, similar)
+
+    def test_batch_refresh_matches_full_refresh(self):
+        def rows():
+            return set(SimilarOrganization.objects.values_list("organization_id", "similar_id", "score"))
+
+        # Tag without the signal, as bulk writes do.
+        Organization.diversity.through.objects.create(organization=self.unrelated, diversityfocus=self.black_women)
+        refresh_many_similar([self.unrelated.pk, self.org.pk])
+        refreshed = rows()
+        refresh_all_similar()
+        self.assertEqual(refreshed, rows())
+
+    def test_lists_losing_an_org_are_backfilled(self):
+        refresh_all_similar(k=1)
+        self.assertEqual(self.get_similar(self.org), [self.parent_focus])
+        Organization.objects.filter(pk=self.parent_focus.pk).update(active=False)
+        refresh_many_similar([self.parent_focus.pk], k=1)
+        cache.clear()
+        self.assertEqual(self.get_similar(self.org), [self.same_focus])
+
+    def test_saves_not_changing_the_score_inputs_keep_the_lists(self):
+        SimilarOrganization.objects.all().delete()
+        self.org.description = "Changed"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.org.save()
+        self.assertFalse(SimilarOrganization.objects.exists())
+        self.org.org_type = Organization.NETWORK
+        with self.captureOnCommitCallbacks(execute=True):
+            self.org.save()
+        self.assertTrue(SimilarOrganization.objects.filter(organization=self.org).exists())
+
+    def test_refreshes_wait_for_the_commit_and_are_merged(self):
+        with mock.patch("org_pages.similarity.refresh_many") as refresh_many:
+            with self.captureOnCommitCallbacks(execute=True):
+                org = Organization.objects.create(name="Women in Python", slug="women-in-python")
+                org.diversity.add(self.women)
+                self.unrelated.diversity.add(self.women)
+                refresh_many.assert_not_called()
+        refresh_many.assert_called_once_with({org.pk, self.unrelated.pk})
+
+
+class FocusClosureTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.women = DiversityFocus.objects.create(name="Women")
+        cls.black_women = DiversityFocus.objects.create(name="Black Women")
+        cls.black_women_in_data = DiversityFocus.objects.create(name="Black Women in Data")
+        cls.black_women.parents.add(cls.women)
+        cls.black_women_in_data.parents.add(cls.black_women)
+
+        cls.org = Organization.objects.create(name="Black Women in Data Atlanta", slug="bwid-atlanta")
+        cls.org.diversity.add(cls.black_women_in_data)
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def filter_orgs(self, **params):
+        return list(self.client.get(reverse("org_filter"), params).context["object_list"])
+
+    def test_closure_contains_every_ancestor(self):
+        self.assertEqual(
+            dict(self.black_women_in_data.ancestor_links.values_list("ancestor__name", "depth")),
+            {"Black Women in Data": 0, "Black Women": 1, "Women": 2},
+        )
+
+    def test_filter_matches_descendants_at_any_depth(self):
+        self.assertEqual(self.filter_orgs(diversity="women"), [self.org])
+
+    def test_removing_a_parent_updates_descendants(self):
+        self.black_women.parents.remove(self.women)
+        self.assertEqual(self.filter_orgs(diversity="Women"), [])
+        self.assertEqual(self.filter_orgs(diversity="Black Women"), [self.org])
+
+    def test_deleting_a_focus_updates_descendants(self):
+        self.black_women.delete()
+        self.assertFalse(self.black_women_in_data.ancestor_links.filter(ancestor=self.women).exists())
+
+
+class FacetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.women = DiversityFocus.objects.create(name="Women")
+        cls.lgbtq = DiversityFocus.objects.create(name="LGBTQIA+")
+        cls.both = Organization.objects.create(name="Queer Women Code", slug="queer-women-code", online_only=True)
+        cls.both.diversity.add(cls.women, cls.lgbtq)
+        cls.women_only = Organization.objects.create(name="Women Who Code", slug="women-who-code")
+        cls.women_only.diversity.add(cls.women)
+        cls.neither = Organization.objects.create(name="Python Users", slug="python-users", paid=True)
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def get_response(self, *params):
+        return self.client.get(f"{reverse('org_filter')}?{'&'.join(params)}")
+
+    def get_counts(self, response, facet):
+        return {value["value"]: value["count"] for value in response.context["facets"][facet]}
+
+    def test_values_within_a_facet_are_ored(self):
+        response = self.get_response("diversity=Women", "diversity=LGBTQIA%2B")
+        self.assertEqual(list(response.context["object_list"]), [self.both, self.women_only])
+
+    def test_match_all_ands_tag_values(self):
+        response = self.get_response("diversity=Women", "diversity=LGBTQIA%2B", "diversity_match=all")
+        self.assertEqual(list(response.context["object_list"]), [self.both])
+
+    def test_facets_are_anded(self):
+        response = self.get_response("diversity=Women", "online_only=true")
+        self.assertEqual(list(response.context["object_list"]), [self.both])
+
+    def test_counts_ignore_their_own_facet(self):
+        response = self.get_response("diversity=LGBTQIA%2B")
+        self.assertEqual(self.get_counts(response, "diversity"), {"Women": 2, "LGBTQIA+": 1})
+        self.assertEqual(self.get_counts(response, "online_only"), {True: 1})
+
+    def test_parent_focus_counts_match_the_filter(self):
+        black_women = DiversityFocus.objects.create(name="Black Women")
+        black_women.parents.add(self.women)
+        Organization.objects.create(name="Black Women Code", slug="black-women-code").diversity.add(black_women)
+        response = self.get_response()
+        counts = self.get_counts(response, "diversity")
+        self.assertEqual(counts, {"Women": 3, "LGBTQIA+": 1, "Black Women": 1})
+        self.assertEqual(len(self.get_response("diversity=Women").context["object_list"]), counts["Women"])
+
+    def test_counts_are_a_single_query(self):
+        response = self.get_response()
+        self.assertEqual(self.get_counts(response, "paid"), {False: 2, True: 1})
+        with self.assertNumQueries(1):
+            facet_counts(Organization.objects.all(), {"diversity": ["Women"]}, {})
+
+    def test_toggling_a_facet_starts_from_the_first_page(self):
+        url = toggle_url(QueryDict("diversity=Women&after=abc&before=def&page=3"), "paid", True)
+        self.assertEqual(url, "?diversity=Women&paid=True")
+
+
+class KeysetPaginationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        Organization.objects.bulk_create(
+            Organization(name=f"Org {i:03}", slug=f"org-{i:03}") for i in range(120)
+        )
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def get_page(self, url):
+        return self.client.get(url).context["page_obj"]
+
+    def test_pages_walk_every_organization_once(self):
+        page = self.get_page(reverse("org_filter"))
+        self.assertEqual(page.total, 120)
+        names = [org.name for org in page]
+        while page.has_next:
+            page = self.get_page(reverse("org_filter") + page.next_url)
+            names.extend(org.name for org in page)
+        self.assertEqual(names, [f"Org {i:03}" for i in range(120)])
+
+        previous = self.get_page(reverse("org_filter") + page.previous_url)
+        self.assertEqual(previous.object_list[0].name, "Org 050")
+
+    def test_deep_pages_cost_the_same_as_the_first(self):
+        first = self.get_page(reverse("org_filter") + "?active=true")
+        cache.clear()
+        with CaptureQueriesContext(connection) as first_queries:
+            self.client.get(reverse("org_filter") + "?active=true")
+        cache.clear()
+        with CaptureQueriesContext(connection) as deep_queries:
+            self.client.get(reverse("org_filter") + first.next_url)
+        self.assertEqual(len(first_queries), len(deep_queries))
+        self.assertFalse(any("OFFSET" in query["sql"] for query in deep_queries))
+
+
+class QueryProfileTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.women = DiversityFocus.objects.create(name="Women")
+        cls.python = TechnologyFocus.objects.create(name="Python")
+        cls.parent = Organization.objects.create(name="Women Who Code", slug="women-who-code")
+        cls.add_orgs(2)
+
+    @classmethod
+    def add_orgs(cls, count):
+        start = Organization.objects.count()
+        for i in range(start, start + count):
+            location = Location.objects.create(name=f"City {i}", country="United States", latitude=i, longitude=i)
+            org = Organization.objects.create(
+                name=f"Women Who Code {i}", slug=f"wwc-{i}", location=location, parent=cls.parent,
+            )
+            org.diversity.add(cls.women)
+            org.technology.add(cls.python)
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(queries)
+
+    def assertConstantQueries(self, url):
+        before = self.count_queries(url)
+        self.add_orgs(5)
+        self.assertEqual(self.count_queries(url), before)
+
+    def test_filter_page(self):
+        self.assertConstantQueries(reverse("org_filter") + "?diversity=Women")
+
+    def test_search_page(self):
+        self.assertConstantQueries(reverse("search") + "?q=women")
+
+    def test_detail_page_children(self):
+        self.assertConstantQueries(self.parent.get_absolute_url())
+
+    def test_api_lists(self):
+        self.assertConstantQueries(reverse("org_list"))
+        self.assertConstantQueries(reverse("org_map"))
+
+
+class FeaturedOrganizationsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.parent = Organization.objects.create(name="Black Girls Code", slug="black-girls-code")
+        cls.chapter = Organization.objects.create(
+            name="Black Girls Code Atlanta", slug="bgc-atlanta", parent=cls.parent, is_featured=True,
+        )
+        cls.other_parent = Organization.objects.create(name="PyLadies", slug="pyladies")
+        cls.other_chapter = Organization.objects.create(name="PyLadies Atlanta", slug="pyladies-atlanta")
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def get_featured(self):
+        return list(self.client.get(reverse("home")).context["aggs"])
+
+    def test_featured_parents_are_cached(self):
+        self.assertEqual(self.get_featured(), [self.parent])
+        with self.assertNumQueries(0):
+            self.client.get(reverse("home"))
+
+    def test_unrelated_changes_keep_the_cache(self):
+        self.get_featured()
+        chapter = Organization.objects.get(pk=self.chapter.pk)
+        chapter.description = "Coding workshops"
+        chapter.save()
+        with self.assertNumQueries(0):
+            featured_parents()
+
+    def test_featuring_an_org_invalidates_the_cache(self):
+        self.get_featured()
+        chapter = Organization.objects.get(pk=self.other_chapter.pk)
+        chapter.parent, chapter.is_featured = self.other_parent, True
+        with self.captureOnCommitCallbacks(execute=True):
+            chapter.save()
+        self.assertEqual(self.get_featured(), [self.parent, self.other_parent])
+
+        chapter = Organization.objects.get(pk=self.chapter.pk)
+        chapter.is_featured = False
+        with self.captureOnCommitCallbacks(execute=True):
+            chapter.save()
+        self.assertEqual(self.get_featured(), [self.other_parent])
+
+
+class PageCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.women = DiversityFocus.objects.create(name="Women")
+        cls.org = Organization.objects.create(name="Women Who Code", slug="women-who-code")
+        cls.other = Organization.objects.create(name="PyLadies", slug="pyladies")
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def assertCached(self, url, cached=True):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertEqual(not queries, cached)
+
+    def test_anonymous_pages_are_cached(self):
+        for url in (reverse("org_filter"), reverse("search") + "?q=code", self.org.get_absolute_url()):
+            self.client.get(url)
+            self.assertCached(url)
+
+    def test_logged_in_users_are_not_cached(self):
+        user = CustomUser.objects.create_user(username="organizer", email="organizer@example.com", password="x")
+        self.client.force_login(user)
+        self.client.get(self.org.get_absolute_url())
+        self.assertCached(self.org.get_absolute_url(), cached=False)
+
+    def test_changes_bump_only_their_scopes(self):
+        for url in (self.org.get_absolute_url(), self.other.get_absolute_url()):
+            self.client.get(url)
+
+        self.org.description = "Coding workshops"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.org.save()
+        self.assertContains(self.client.get(self.org.get_absolute_url()), "Coding workshops")
+        self.assertCached(self.other.get_absolute_url())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.org.diversity.add(self.women)
+        self.assertContains(self.client.get(self.org.get_absolute_url()), "Women")
+
+        tag_version = versions([tag_scope("diversity")])
+        with self.captureOnCommitCallbacks(execute=True):
+            DiversityFocus.objects.create(name="LGBTQIA+")
+        self.assertNotEqual(versions([tag_scope("diversity")]), tag_version)
+        self.assertCached(self.org.get_absolute_url())
+
+
+class AuthorizationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.user = CustomUser.objects.create_user(username="organizer", email="organizer@example.com", password="x")
+        cls.parent = Organization.objects.create(name="PyLadies", slug="pyladies")
+        cls.chapter = Organization.objects.create(name="PyLadies Atlanta", slug="pyladies-atlanta", parent=cls.parent)
+        cls.other = Organization.objects.create(name="Django Girls", slug="django-girls")
+        cls.parent.organizers.add(cls.user)
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def get_user(self):
+        return CustomUser.objects.get(pk=self.user.pk)
+
+    def test_organizers_manage_children(self):
+        managed = managed_organizations(self.get_user())
+        self.assertEqual(managed.direct, {self.parent.pk})
+        self.assertEqual(managed.all, {self.parent.pk, self.chapter.pk})
+
+    def test_managed_orgs_are_one_query_per_request(self):
+        user = self.get_user()
+        with self.assertNumQueries(1):
+            self.assertTrue(is_organizer(user, self.parent))
+            self.assertTrue(is_organizer(user, self.chapter))
+            self.assertFalse(is_organizer(user, self.other))
+        next_request_user = self.get_user()
+        with self.assertNumQueries(0):
+            self.assertTrue(is_organizer(next_request_user, self.chapter))
+
+    def test_organizer_changes_invalidate_the_cache(self):
+        self.assertFalse(is_organizer(self.get_user(), self.other))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.organizers.add(self.user)
+        self.assertTrue(is_organizer(self.get_user(), self.other))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.organizers.clear()
+        self.assertFalse(is_organizer(self.get_user(), self.chapter))
+
+    def test_moving_an_org_invalidates_the_cache(self):
+        self.assertFalse(is_organizer(self.get_user(), self.other))
+        self.other.parent = self.parent
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.save()
+        self.assertTrue(is_organizer(self.get_user(), self.other))
+
+    def test_api_lists_managed_orgs(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("my_orgs"))
+        self.assertEqual([org["name"] for org in response.json()], [self.parent.name])
+        self.assertEqual(self.client.get(reverse("my_org", args=[self.chapter.pk])).status_code, 200)
+        self.assertEqual(self.client.get(reverse("my_org", args=[self.other.pk])).status_code, 404)
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.women = DiversityFocus.objects.create(name="Women")
+        cls.parent = Organization.objects.create(name="Women Who Code", slug="women-who-code")
+        cls.org = Organization.objects.create(name="Women Who Code Atlanta", slug="wwc-atlanta", parent=cls.parent)
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def test_matching_etag_is_not_modified(self):
+        url = self.org.get_absolute_url()
+        etag = self.client.get(url)["ETag"]
+        # Answered from the page cache without any queries.
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bump(org_scope(self.org.slug))
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_if_modified_since(self):
+        last_modified = self.client.get(self.org.get_absolute_url())["Last-Modified"]
+        response = self.client.get(self.org.get_absolute_url(), HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_lists_are_validated_without_queries(self):
+        url = reverse("org_list")
+        response = self.client.get(url)
+        # A deletion doesn't move any timestamp forward, so lists have no Last-Modified.
+        self.assertNotIn("Last-Modified", response)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Organization.objects.create(name="PyLadies", slug="pyladies")
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 200)
+
+    def test_tag_and_parent_changes_change_the_etag(self):
+        url = self.org.get_absolute_url()
+        etag = self.client.get(url)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.org.diversity.add(self.women)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        etag = self.client.get(url)["ETag"]
+        self.parent.description = "Coding workshops"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.parent.save()
+        self.assertNotEqual(self.client.get(url)["ETag"], etag)
+
+    def test_api_lists(self):
+        url = reverse("org_list")
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.org.diversity.add(self.women)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class MetricsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.org = Organization.objects.create(name="Women Who Code", slug="women-who-code")
+        cls.staff = CustomUser.objects.create_user(username="staff", password="x", is_staff=True)
+
+    def get_metrics(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("metrics"))
+        self.client.logout()
+        return response
+
+    def test_metrics_are_staff_only(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 404)
+        self.assertEqual(self.get_metrics().status_code, 200)
+
+    def test_views_are_recorded_by_url_name(self):
+        cache.clear()
+        self.client.get(self.org.get_absolute_url())
+        body = self.get_metrics().content.decode()
+        self.assertIn('django_http_requests_total{method="GET",status="200",view="org_detail"}', body)
+        self.assertIn('django_db_queries_per_request_count{view="org_detail"}', body)
+        self.assertIn('django_template_render_seconds_bucket{view="org_detail",le="+Inf"}', body)
+        self.assertIn('django_http_response_size_bytes_sum{view="org_detail"}', body)
+
+
+class BenchTest(TestCase):
+    @override_settings(DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage")
+    def test_seed_and_time_every_route(self):
+        config = DirectoryConfig(organizations=40, locations=10, focuses=12, depth=3, parents=3, chapters=5, organizers=4)
+        counts = seed(config)
+        self.assertEqual(counts["organizations"], 40)
+        self.assertEqual(Organization.objects.filter(parent__isnull=False).count(), 15)
+        self.assertTrue(DiversityFocus.objects.filter(parents__isnull=False).exists())
+
+        results = benchmark(iterations=2)
+        self.assertIn("org_detail", results)
+        self.assertNotIn("api:org_list", results)
+        self.assertEqual(results["org_detail"]["statuses"], [200])
+        self.assertGreater(results["org_detail"]["queries"], 0)
+        self.assertGreater(results["org_detail"]["peak_memory_kb"], 0)
+
+    def test_percentile(self):
+        self.assertEqual(percentile(list(range(1, 101)), 95), 95)
+        self.assertEqual(percentile([3.0], 99), 3.0)
+
+
+class QueryInspectionTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.parent = Organization.objects.create(name="Women Who Code", slug="women-who-code")
+        for i, city in enumerate(("Austin", "Boston", "Chicago"), start=1):
+            Organization.objects.create(
+                name=f"Women Who Code {city}", slug=f"wwc-{city.lower()}", parent=cls.parent,
+                location=Location.objects.create(name=city, latitude=i, longitude=i),
+            )
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def inspect(self, view, request=None):
+        request = request or RequestFactory().get("/")
+        middleware = QueryInspectionMiddleware(view)
+        middleware.process_view(request, view, (), {})
+        return middleware(request)
+
+    def test_fingerprint_ignores_literals_and_in_lists(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'x' LIMIT 21"),
+            fingerprint("SELECT * FROM t WHERE id IN (%s) AND name = 'y' LIMIT 1"),
+        )
+
+    def test_n_plus_one_reports_its_origin(self):
+        def view(request):
+            for org in Organization.objects.filter(parent=self.parent):
+                org.location.name
+            return HttpResponse()
+
+        with self.assertRaisesRegex(QueryBudgetExceeded, r"N\+1: 3 x .*org_pages_location.* at org_pages/tests.py:\d+"):
+            self.inspect(view)
+
+    def test_budget(self):
+        @query_budget(1)
+        def view(request):
+            Organization.objects.count()
+            Location.objects.count()
+            return HttpResponse()
+
+        with self.assertRaisesRegex(QueryBudgetExceeded, "2 queries, over the budget of 1"):
+            self.inspect(view)
+
+    def test_pages_are_free_of_n_plus_one(self):
+        for url in (
+            self.parent.get_absolute_url(),
+            reverse("suggest_edit", args=[self.parent.slug]),
+            reverse("org_filter"),
+        ):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.query_report.repeated(), [])
@@ -0,0 +1,165 @@
+"""
+Mapbox Vector Tiles of the organization locations.
+
+Tiles follow the XYZ scheme in the web mercator projection and hold one `organizations` layer
+of points. Below `clusters.FEATURE_ZOOM` the points are the grid clusters of `clusters.py` (with
+`point_count` and `names` properties), from there on they are the organizations themselves
+(with `name` and `url`), so every tile is built with one bounded query.
+
+Tiles are encoded by hand (the format is a few protobuf messages, see
+https://github.com/mapbox/vector-tile-spec/tree/master/2.1) and cached under a version per
+tile. When an organization or location changes, only the versions of the tiles covering the
+affected coordinates are bumped, one tile per zoom level.
+"""
+
+import hashlib
+import json
+import math
+import struct
+from typing import Iterable, Optional
+
+from django.core.cache import cache
+from django.db.models import QuerySet
+
+from .cache import PAGE_TIMEOUT, bump, versions
+from .clusters import FEATURE_ZOOM, BoundingBox, clusters, features
+
+CACHE_PREFIX = "directory:tile:"
+LAYER = "organizations"
+EXTENT = 4096
+MAX_ZOOM = 22
+# Web mercator is cut off at the latitude where the world is a square.
+MAX_LATITUDE = 85.0511287798
+# The organization fields shown in (or filtering) tiles.
+TILE_FIELDS = ("name", "slug", "location_id", "is_featured", "parent_id")
+
+
+def tile_scope(z: int, x: int, y: int) -> str:
+    return f"tile:{z}/{x}/{y}"
+
+
+def is_valid(z: int, x: int, y: int) -> bool:
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def project(longitude: float, latitude: float, z: int) -> tuple[float, float]:
+    """The fractional tile coordinates of a point at zoom `z`."""
+    latitude = math.radians(max(-MAX_LATITUDE, min(MAX_LATITUDE, latitude)))
+    n = 2 ** z
+    return (longitude + 180) / 360 * n, (1 - math.asinh(math.tan(latitude)) / math.pi) / 2 * n
+
+
+def bounds(z: int, x: int, y: int) -> BoundingBox:
+    n = 2 ** z
+
+    def latitude(y: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+
+    return BoundingBox(x / n * 360 - 180, latitude(y + 1), (x + 1) / n * 360 - 180, latitude(y))
+
+
+def covering(coordinates: Iterable[tuple[float, float]]) -> set[tuple[int, int, int]]:
+    """The tile at every zoom level containing each (latitude, longitude)."""
+    tiles = set()
+    for latitude, longitude in coordinates:
+        for z in range(MAX_ZOOM + 1):
+            x, y = project(float(longitude), float(latitude), z)
+            tiles.add((z, min(int(x), 2 ** z - 1), min(int(y), 2 ** z - 1)))
+    return tiles
+
+
+def invalidate(coordinates: Iterable[tuple[Optional[float], Optional[float]]]) -> None:
+    """Invalidate the tiles showing any of the (latitude, longitude) pairs."""
+    bump(*(tile_scope(*tile) for tile in covering(
+        (latitude, longitude) for latitude, longitude in coordinates if latitude is not None and longitude is not None
+    )))
+
+
+# Protobuf encoding, just what the vector tile messages need.
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _zigzag(value: int) -> int:
+    return (value << 1) ^ (value >> 63)
+
+
+def _key(field: int, wire_type: int) -> bytes:
+    return _varint(field << 3 | wire_type)
+
+
+def _uint(field: int, value: int) -> bytes:
+    return _key(field, 0) + _varint(value)
+
+
+def _bytes(field: int, value: bytes) -> bytes:
+    return _key(field, 2) + _varint(len(value)) + value
+
+
+def _packed(field: int, values: Iterable[int]) -> bytes:
+    return _bytes(field, b"".join(_varint(value) for value in values))
+
+
+def _value(value) -> bytes:
+    """A `Value` message. Lists are encoded as JSON strings."""
+    if isinstance(value, bool):
+        return _uint(7, int(value))
+    if isinstance(value, int) and value >= 0:
+        return _uint(5, value)
+    if isinstance(value, int):
+        return _uint(6, _zigzag(value))
+    if isinstance(value, float):
+        return _key(3, 1) + struct.pack("<d", value)
+    if isinstance(value, (list, dict)):
+        value = json.dumps(value)
+    return _bytes(1, str(value).encode())
+
+
+def encode(points: list[dict], z: int, x: int, y: int) -> bytes:
+    """A tile with one layer of the GeoJSON `points` (Features with Point geometries)."""
+    keys, values, encoded = {}, {}, []
+    for point in points:
+        longitude, latitude = point["geometry"]["coordinates"]
+        px, py = project(longitude, latitude, z)
+        px, py = round((px - x) * EXTENT), round((py - y) * EXTENT)
+        tags = []
+        for key, value in point["properties"].items():
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault(_value(value), len(values)))
+        feature = (
+            _packed(2, tags)
+            + _uint(3, 1)  # POINT
+            + _packed(4, (1 | 1 << 3, _zigzag(px), _zigzag(py)))  # MoveTo(px, py)
+        )
+        encoded.append(_bytes(2, feature))
+
+    layer = (
+        _uint(15, 2)  # version
+        + _bytes(1, LAYER.encode())
+        + b"".join(encoded)
+        + b"".join(_bytes(3, key.encode()) for key in keys)
+        + b"".join(_bytes(4, value) for value in values)
+        + _uint(5, EXTENT)
+    )
+    return _bytes(3, layer)
+
+
+def tile(queryset: QuerySet, key: str, z: int, x: int, y: int) -> tuple[bytes, str]:
+    """
+    The encoded tile of the organizations in `queryset` and its ETag.
+    `key` identifies the queryset for the cache.
+    """
+    version = versions([tile_scope(z, x, y)])[0]
+    digest = hashlib.md5(f"{key}:{z}/{x}/{y}:{version}".encode()).hexdigest()
+    if (content := cache.get(CACHE_PREFIX + digest)) is None:
+        box = bounds(z, x, y)
+        points = features(queryset, box) if z >= FEATURE_ZOOM else clusters(queryset, box, z)
+        content = encode(points, z, x, y)
+        cache.set(CACHE_PREFIX + digest, content, PAGE_TIMEOUT)
+    return content, f'"{digest}"'
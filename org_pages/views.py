@@ -5,7 +5,6 @@ from django.views.generic import ListView, DetailView, UpdateView, CreateView
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.conf import settings
 from django.db.models import Q, QuerySet
-from django.contrib.postgres.search import SearchQuery, SearchVector, SearchRank
 from .models import (
     DiversityFocus,
     Organization,
@@ -19,208 +18,133 @@ from .forms import (
     SuggestEditForm,
     ViolationReportForm,
 )
+from .authorization import is_organizer
+from .cache import SIMILAR, PageCacheMixin, org_scope, tag_scope, versions
+from .conditional import ConditionalGetMixin
+from .facets import facet_counts, filter_organizations, match_modes, selected_facets, toggle_url
+from .featured import featured_parents
+from .pagination import KeysetPaginationMixin
+from .search import search, suggestions
 
-def is_organizer(user: object, org:object) -> bool:
-    """Check if a user is authenticated and an organizer of an organization."""
-    if not user.is_authenticated:
-        return False
-    if org.parent and user in org.parent.organizers.all():
-        return True
-    if user in org.organizers.all():
-        return True
-    if user.is_superuser:
-        return True
-    return False
-
-
-def get_location_q(params: dict[str, Any]) -> dict[Any]:
-    """Get a query for a set of location parameters."""
-    if "city" in params:
-        params["name"] = params.pop('city')
-    return {f'location__{key}__icontains': value for key, value in params.items() if value != None}
-    
-
-def validate_params(params: dict[str, Any]) -> dict[str, Any]:
-    """Check params and remove invalid keys."""
-    
-    # tag filters check the tag name and the tag's parents
-    valid_tags = (
-        'diversity',
-        'technology',
-        'city',
-        'region',
-        'country',
-        'active',
-        'online_only',
-        'paid',
-    )
-    
-    return { t: params.get(t) for t in valid_tags if params.get(t, None) != None}    
+def validate_params(params: dict[str, Any]) -> dict[str, list]:
+    """Check params and remove invalid keys. Every facet can have several values."""
+    return selected_facets(params)
 
 
 def get_by_params(params: dict[str, Any], model: Organization=Organization,) -> QuerySet:
-    """Get a queryset based on a set of parameters."""
-    
-    valid_params = validate_params(params)
-
-    # tag filters check the tag name and the tag's parents
-    location_params = {k:v for k,v in valid_params.items() if k in ("city", "region", "country")}
-    bool_params = {k:v for k,v in valid_params.items() if k in ("active", "online_only", "paid")}
-    queries = Q()
-
-    for tag in ('diversity', 'technology'):
-        if tag in valid_params: 
-           queries |= Q(**{f'{tag}__name__iexact': valid_params[tag]}) \
-                | Q(**{f'{tag}__parents__name__in': valid_params[tag]})
-
-    # Combine all the filters
-    for param in [bool_params, location_params, queries]:
-        print(param)
-
-    return model.objects.filter(
-            queries,
-            **bool_params,
-            **get_location_q(location_params),
-        ).distinct()
+    """
+    Get a queryset based on a set of parameters.
+    Values within a facet are OR'd (or AND'd for tags with `<tag>_match=all`) and facets are AND'd.
+    """
+    return filter_organizations(model.objects.for_cards(), selected_facets(params), match_modes(params))
 
 _context = TypeVar('_context', bound=dict)
 
 
 # Create your views here.
-class HomePageView(ListView):
+class HomePageView(PageCacheMixin, ConditionalGetMixin, ListView):
     """The Home Page showing featured organizations and a map of all organizations."""
     
     template_name = "home.html"
+    query_budget = 4
     model = Organization
 
-    def get_queryset(self) -> QuerySet[Organization]:
-        """Return the organizations where the is_featured flag is True."""
-        return self.model.objects.filter(is_featured=True) \
-            .exclude(parent=None).values('parent__name', 'parent__slug') \
-            .distinct().order_by()
+    def get_queryset(self) -> list[Organization]:
+        """Return the (cached) parents of the organizations where the is_featured flag is True."""
+        return featured_parents()
 
     def get_context_data(self, **kwargs) -> _context:
         """
-        Add aggregations from the object_list and the map API call trigger for `is_featured=True`
+        Add the featured parents and the map API call trigger for `is_featured=True`
         """        
 
         context = super().get_context_data(**kwargs)
 
-        context['aggs'] = [self.model.objects.get(name=obj['parent__name']) for obj in self.object_list]
+        context['aggs'] = self.object_list
         context["map"] = "is_featured=True"
         context["AZURE_MAPS_KEY"] = settings.AZURE_MAPS_KEY
         return context
 
 
-class SearchResultsView(ListView):
+class SearchResultsView(PageCacheMixin, ConditionalGetMixin, ListView):
     """Returns the results of a search query."""
     template_name = "search_results.html"
+    query_budget = 7
     model = Organization
 
-    def get_queryset(self) -> SearchQuery:
+    def get_queryset(self) -> QuerySet[Organization]:
         """
-        Test search based on existed entrys in the database.
-        Checks Organization, Location, DiversityFocus and TechnologyFocus objects.
-        Returns a full text search on those models if nothing is a match.
+        Full text search against the stored, GIN indexed `Organization.search_document`.
+        The document covers the name, focuses (and their other names), location and description
+        so a single indexed query replaces checking each model separately.
         """
-        
-        query = self.request.GET.get("q")
-
-        if name_match := Organization.objects.filter(name__iexact=query):
-            return name_match
-
-        if name_match := Organization.objects.filter(name__icontains=query):
-            return name_match
-
-        if location_match := Organization.objects.filter(
-            Q(location__name=query) | Q(location__region=query) | Q(location__country=query)
-        ):
-            return location_match
-
-        if diversity_match := Organization.objects.filter(diversity__name=query):
-            return diversity_match
-
-        if techonology_match := Organization.objects.filter(technology__name=query):
-            return techonology_match
-
-        # Create vectors for search
-        query = SearchQuery(self.request.GET.get("q"), search_type="websearch")
-        vector = (
-            SearchVector("diversity__name", weight="B")
-            + SearchVector("technology__name", weight="B")
-            + SearchVector("location__name", weight="C")
-            + SearchVector("location__region", weight="C")
-            + SearchVector("location__country", weight="C")
-        )
-        queryset = (
-            Organization.objects.annotate(
-                rank=SearchRank(vector, query, weights=[0.1, 0.3, 0.6, 1.0]),
-            )
-            .filter(rank__gte=0.4)
-            .order_by("-rank")
-            .distinct()
-        )
-        return queryset
+        return search(Organization.objects.for_cards(), self.request.GET.get("q", ""))
 
     def get_context_data(self, **kwargs) -> _context:
-        """Add the search query and the parents aggregates to the context."""
+        """
+        Add the search query and the parents aggregates to the context.
+        Searches without results get "did you mean" suggestions from similar names.
+        """
         context = super().get_context_data(**kwargs)
         context["query"] = self.request.GET.get("q")
-        context["parents"] = self.object_list.values("parent__name").distinct()
+        context["parents"] = self.object_list.order_by().values("parent__name").distinct()
+
+        if not context["object_list"]:
+            context["suggestions"] = suggestions(self.request.GET.get("q", ""))
         return context
 
-class OrgDetailView(DetailView):
+class OrgDetailView(PageCacheMixin, ConditionalGetMixin, DetailView):
     """Returns an organization's detail page."""
     template_name = "orgs/detail.html"
+    query_budget = 12
     model = Organization
     form_class = CreateOrgForm
+
+    def get_queryset(self) -> QuerySet[Organization]:
+        return self.model.objects.for_detail()
+
+    def get_cache_scopes(self) -> list[str]:
+        return [org_scope(self.kwargs.get("slug")), SIMILAR]
+
+    def get_validator_scopes(self) -> None:
+        return None
+
+    def get_validator_queryset(self) -> QuerySet[Organization]:
+        """The organization and the parent, children and similar organizations shown with it."""
+        slug = self.kwargs.get("slug")
+        return self.model.objects.filter(
+            Q(slug=slug) | Q(parent__slug=slug) | Q(organization__slug=slug) | Q(similar_to__organization__slug=slug)
+        )
+
+    def get_etag_parts(self, request) -> list:
+        return [*super().get_etag_parts(request), *versions([SIMILAR])]
     
     def get_context_data(self, **kwargs) -> _context:
         """
         Add the organization's parent and children to the context.
         Enable the map for all of the orgs children.
-        Uses focuses and focus parents to build similar organizations.
+        Similar organizations are read from the precomputed `SimilarOrganization` table.
         """
         context = super().get_context_data(**kwargs)
-        context['is_organizer'] = is_organizer(self.request.user, self.object) or self.request.user.is_superuser
+        context['is_organizer'] = is_organizer(self.request.user, self.object)
 
-        if children := self.model.objects.filter(parent=self.object):
-            context["children"] = children.order_by("location__country", "location__name")
+        children = self.model.objects.for_cards().filter(parent=self.object)
+        if children := list(children.order_by("location__country", "location__name")):
+            context["children"] = children
             context["map"] = f"parent={self.object.pk}"
             context["AZURE_MAPS_KEY"] = settings.AZURE_MAPS_KEY
             
         else:
-            diversities = []
-
-            for focus in self.object.diversity.all():
-                if focus.parents:
-                    for parent in focus.parents.all():
-                        diversities.append(parent)
-
-            diversities.extend(self.object.diversity.all())
-            technologies = []
-            for focus in self.object.technology.all():
-                if focus.parents:
-                    for parent in focus.parents.all():
-                        technologies.append(parent)
-            technologies.extend(self.object.technology.all())
-
-            other_orgs = self.model.objects.filter(
-                location=self.object.location,
-            ).exclude(pk=self.object.pk)
-
-            if diversities:
-                other_orgs = other_orgs.filter(diversity__in=diversities)
-
-            if technologies:
-                other_orgs = other_orgs.filter(technology__in=technologies)
-            context["other_orgs"] = other_orgs.distinct()
+            context["other_orgs"] = self.model.objects.for_cards().filter(
+                similar_to__organization=self.object,
+            ).order_by("-similar_to__score")
         return context
 
 
 class CreateOrgView(LoginRequiredMixin, CreateView):
     """Create a new organization."""
     template_name = "orgs/create.html"
+    query_budget = 4
     model = Organization
     form_class = CreateOrgForm
     
@@ -239,9 +163,14 @@ class CreateOrgView(LoginRequiredMixin, CreateView):
 class SuggestEditView(UpdateView):
     """Form that allows users to suggest edits to an organization page."""
     template_name = "orgs/update.html" # TODO:Create #20 Custom Template
+    query_budget = 6
     form_class = SuggestEditForm
     model = Organization 
 
+    def get_queryset(self) -> QuerySet[Organization]:
+        """Fetch the focuses, organizers, location and parent `get_initial` lists with the organization."""
+        return self.model.objects.for_detail()
+
     def get_success_url(self) -> str:
         """Return the absolute url of the organization."""
         return self.object.get_absolute_url()
@@ -283,6 +212,7 @@ class SuggestEditView(UpdateView):
 class ReportViolationView(CreateView):
     """View that allows users to report a violation of an organization."""
     template_name = "orgs/report.html" # TODO:Create Custom Template
+    query_budget = 4
     form_class = ViolationReportForm
     model = ViolationReport
 
@@ -317,6 +247,17 @@ class UpdateOrgView(LoginRequiredMixin, UpdateView):
     template_name = "orgs/update.html"
     model = Organization
     form_class = OrgForm
+    query_budget = 8
+
+    def get_queryset(self) -> QuerySet[Organization]:
+        """Fetch the focuses, organizers, location and parent `get_initial` lists with the organization."""
+        return self.model.objects.for_detail()
+
+    def get_object(self, queryset=None) -> Organization:
+        """The organization is fetched once by `dispatch` and reused to handle the request."""
+        if getattr(self, "object", None) is None:
+            self.object = super().get_object(queryset)
+        return self.object
 
     def get_initial(self, *args, **kwargs) -> dict[str, Any]:
         """
@@ -399,11 +340,17 @@ class ClaimOrgView(LoginRequiredMixin, CreateView):
         return redirect(self.object.get_absolute_url())
 
 
-class DiversityFocusView(ListView):
+class DiversityFocusView(PageCacheMixin, ConditionalGetMixin, KeysetPaginationMixin, ListView):
     """List of the diversity focuses."""
     template_name = "tags/list.html"
     model = DiversityFocus
+    query_budget = 5
+    queryset = DiversityFocus.objects.prefetch_related("parents")
     paginate_by=50
+    paginate_with_total = False
+
+    def get_cache_scopes(self) -> list[str]:
+        return [tag_scope("diversity")]
 
     def get_context_data(self, **kwargs) -> _context:
         """
@@ -416,7 +363,7 @@ class DiversityFocusView(ListView):
         return context
 
 
-class TechnologyFocusView(ListView):
+class TechnologyFocusView(PageCacheMixin, ConditionalGetMixin, KeysetPaginationMixin, ListView):
     """
     List of the technology focuses.
 
@@ -425,7 +372,13 @@ class TechnologyFocusView(ListView):
     """
     template_name = "tags/list.html"
     model = TechnologyFocus
+    query_budget = 5
+    queryset = TechnologyFocus.objects.prefetch_related("parents")
     paginate_by=50
+    paginate_with_total = False
+
+    def get_cache_scopes(self) -> list[str]:
+        return [tag_scope("technology")]
 
     def get_context_data(self, **kwargs) -> _context:
         """
@@ -438,7 +391,7 @@ class TechnologyFocusView(ListView):
         return context
     
 
-class TagFilterView(ListView):
+class TagFilterView(PageCacheMixin, ConditionalGetMixin, KeysetPaginationMixin, ListView):
     """
     Return a list  filtered by URL parameters.
     """
@@ -447,6 +400,7 @@ class TagFilterView(ListView):
         "technology": TechnologyFocus,
     }
     template_name = "orgs/list.html"
+    query_budget = 8
     model = Organization    
     paginate_by: int = 50
 
@@ -458,11 +412,19 @@ class TagFilterView(ListView):
             )
 
     def get_context_data(self, **kwargs) -> _context:
-        """add tag to context"""
+        """Add the selected facets and the counts for every facet to the context."""
         context = super().get_context_data(**kwargs)
+        selected = validate_params(self.request.GET)
+        facets = facet_counts(Organization.objects.all(), selected, match_modes(self.request.GET))
+
+        for facet, values in facets.items():
+            for value in values:
+                value["url"] = toggle_url(self.request.GET, facet, value["value"])
+
         context = {
             **context,
-            **validate_params(self.request.GET),
+            **selected,
+            "selected": selected,
+            "facets": facets,
         }
         return context
-        